@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_PUNCTUATION = re.compile(r"[^\w\s$%]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a chatbot question used for cache lookups
+
+    Lower-cases, drops punctuation (keeping $ and %) and collapses whitespace,
+    so "What is an emergency fund?" and "what is an  emergency fund" match.
+    """
+    query = _PUNCTUATION.sub(" ", query.lower())
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def make_cache_key(query: str, model: str, prompt_version: str) -> str:
+    """
+    Build the cache key for a query, model and system-prompt version
+
+    :param query: Raw user query
+    :param model: Completion model name
+    :param prompt_version: Identifier of the system prompt in use
+    :return: Hex digest key
+    """
+    raw = json.dumps([normalize_query(query), model, prompt_version])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = 86400,
+                 max_memory_entries: int = 1024, max_disk_entries: int = 100000,
+                 touch_interval: float = 5.0):
+        """
+        Two-tier LRU/TTL cache for chatbot answers
+
+        Lookups hit an in-memory OrderedDict first and fall back to a SQLite
+        file, so answers survive process restarts. Both tiers are size-bounded
+        and evict least recently used entries; expired entries are dropped on
+        access. Memory hits also count as use of the on-disk copy: their
+        access times are written to SQLite in batches, at most every
+        touch_interval seconds and always before disk eviction.
+
+        :param path: SQLite file for the on-disk tier (None keeps it in memory only)
+        :param ttl: Seconds an answer stays valid
+        :param max_memory_entries: Entries kept in the in-memory tier
+        :param max_disk_entries: Entries kept in the on-disk tier
+        :param touch_interval: Seconds between batched last_access updates for memory hits
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.touch_interval = touch_interval
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "stores": 0
+        }
+        self._db = None
+        self._disk_entries = 0
+        self._touched: Dict[str, float] = {}
+        self._touched_flushed_at = time.time()
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_access ON answers(last_access)")
+        self._db.execute("DELETE FROM answers WHERE expires_at <= ?", (time.time(),))
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached answer
+
+        :param key: Key from make_cache_key
+        :return: Cached value, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    if self._db is not None:
+                        self._touch(key, now)
+                    return value
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = json.loads(row[0]), row[1]
+                    if expires_at > now:
+                        self._db.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+                        self._remember(key, value, expires_at)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                    self._disk_entries -= 1
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store an answer in both tiers
+
+        :param key: Key from make_cache_key
+        :param value: JSON-serializable value
+        :param ttl: Override the default time to live, in seconds
+        """
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._stats["stores"] += 1
+            if self._db is not None:
+                self._touched.pop(key, None)
+                exists = self._db.execute("SELECT 1 FROM answers WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), expires_at, now)
+                )
+                if not exists:
+                    self._disk_entries += 1
+                self._evict_disk()
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _touch(self, key: str, now: float) -> None:
+        self._touched[key] = now
+        if now - self._touched_flushed_at >= self.touch_interval:
+            self._flush_touches(now)
+
+    def _flush_touches(self, now: float) -> None:
+        if self._touched:
+            self._db.executemany("UPDATE answers SET last_access = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+        self._touched_flushed_at = now
+
+    def _evict_disk(self) -> None:
+        overflow = self._disk_entries - self.max_disk_entries
+        if overflow <= 0:
+            return
+        # Answers hot in memory must not look idle on disk
+        self._flush_touches(time.time())
+        self._db.execute(
+            "DELETE FROM answers WHERE key IN "
+            "(SELECT key FROM answers ORDER BY last_access LIMIT ?)",
+            (overflow,)
+        )
+        self._disk_entries -= overflow
+        self._stats["evictions"] += overflow
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._disk_entries = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current tier sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._disk_entries
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._flush_touches(time.time())
+                self._db.close()
+                self._db = None
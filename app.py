@@ -1,13 +1,32 @@
 import streamlit as st
 import requests
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objs as go
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
+from lazy_import import LazyModule
+
+# pandas and plotly load when the first table or chart is drawn, so the input
+# form renders without waiting for them
+pd = LazyModule("pandas")
+px = LazyModule("plotly.express")
 
 # Set API Endpoints
 API_URL = "http://127.0.0.1:5000/predict"
 GLOSSARY_URL = "http://127.0.0.1:5000/get_financial_term"
+GLOSSARY_BULK_URL = "http://127.0.0.1:5000/get_financial_terms"
 FINANCIAL_ADVISOR_URL = "http://127.0.0.1:5000/financial_advisor"
+FINANCIAL_ADVISOR_STREAM_URL = "http://127.0.0.1:5000/financial_advisor/stream"
+INDICATORS_URL = "http://127.0.0.1:5000/indicators"
+INDICATORS_SUMMARY_URL = "http://127.0.0.1:5000/indicators/summary"
+
+# (connect, read) timeouts in seconds; chat answers can take a while to generate
+REQUEST_TIMEOUT = (3.05, 15)
+CHAT_TIMEOUT = (3.05, 60)
+
+# How long the glossary is used before it is revalidated with its ETag
+GLOSSARY_TTL_SECONDS = 3600
 
 # Custom CSS for Modern Design and Tooltip
 st.markdown("""
@@ -84,14 +103,97 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+TERM_NOT_FOUND = {"definition": "Term not found in our glossary.", "example": "No example available."}
+TERM_UNAVAILABLE = {"definition": "Term explanation unavailable.", "example": ""}
+
+@st.cache_resource
+def get_http_session():
+    """Pooled HTTP session shared by all reruns, so requests reuse open connections"""
+    session = requests.Session()
+    # Retry idempotent GETs on connection errors and 502/503/504; POSTs are not retried
+    retries = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class GlossaryCache:
+    def __init__(self, ttl=GLOSSARY_TTL_SECONDS):
+        """
+        The whole glossary and its ETag, shared by all sessions and reruns
+
+        Once the copy is older than ttl seconds the next read sends a
+        conditional GET; a 304 keeps the copy and only resets its age.
+        Plain Python with its own lock, so it is safe to use off the
+        script thread.
+
+        :param ttl: Seconds before the glossary is revalidated
+        """
+        self.ttl = ttl
+        self.etag = None
+        self.terms = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, session):
+        with self._lock:
+            if self.terms is None or time.monotonic() - self.checked_at >= self.ttl:
+                headers = {"If-None-Match": self.etag} if self.terms is not None and self.etag else {}
+                response = session.get(GLOSSARY_BULK_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    self.etag, self.terms = response.headers.get("ETag"), response.json()
+                self.checked_at = time.monotonic()
+            return self.terms
+
+@st.cache_resource
+def get_glossary_cache():
+    """Process-wide glossary cache; kept across reruns, unlike module globals"""
+    return GlossaryCache()
+
+def fetch_financial_glossary():
+    """Fetch the whole glossary in one request; reruns read it from the cache"""
+    return get_glossary_cache().get(get_http_session())
+
 def get_financial_term_explanation(term):
     try:
-        response = requests.get(f"{GLOSSARY_URL}?term={term}")
-        if response.status_code == 200:
-            return response.json()
+        return fetch_financial_glossary().get(term, TERM_NOT_FOUND)
     except Exception as e:
         st.error(f"Error fetching term explanation: {e}")
-    return {"definition": "Term explanation unavailable.", "example": ""}
+    return TERM_UNAVAILABLE
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def get_financial_insights(inputs):
+    """
+    POST the inputs to /predict; results are cached per input tuple, so
+    resubmitting the same figures does not hit the API again
+
+    :param inputs: Tuple of (field, value) pairs, see make_input_key
+    """
+    response = get_http_session().post(API_URL, json=dict(inputs), timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_indicator_summary():
+    """Latest indicator values per ticker from the API"""
+    response = get_http_session().get(INDICATORS_SUMMARY_URL, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_indicator_history(ticker):
+    """Full indicator history for one ticker as a DataFrame indexed by date"""
+    response = get_http_session().get(INDICATORS_URL, params={"ticker": ticker}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    payload = response.json()
+    history = pd.DataFrame(payload["indicators"], index=pd.to_datetime(payload["dates"]))
+    history["adj_close"] = payload["adj_close"]
+    return history
+
+def make_input_key(input_data):
+    """Hashable, order-independent cache key for a /predict payload"""
+    return tuple(sorted(input_data.items()))
 
 def render_term_with_tooltip(term, display_text=None):
     """Render a term with a tooltip for its explanation."""
@@ -113,7 +215,7 @@ def render_term_with_tooltip(term, display_text=None):
 def financial_advisor_chat(query):
     """Send query to financial advisor API and get response"""
     try:
-        response = requests.post(FINANCIAL_ADVISOR_URL, json={'query': query})
+        response = get_http_session().post(FINANCIAL_ADVISOR_URL, json={'query': query}, timeout=CHAT_TIMEOUT)
         if response.status_code == 200:
             return response.json().get('response', 'No response received.')
         else:
@@ -121,6 +223,42 @@ def financial_advisor_chat(query):
     except Exception as e:
         return f"An error occurred: {e}"
 
+def financial_advisor_chat_stream(query):
+    """Stream the financial advisor's answer token by token (server-sent events)"""
+    session = get_http_session()
+    with session.post(FINANCIAL_ADVISOR_STREAM_URL, json={'query': query}, stream=True, timeout=CHAT_TIMEOUT) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                payload = json.loads(line[len("data:"):])
+                if event == "error":
+                    yield payload.get("error", "Sorry, I couldn't process your request at the moment.")
+                    return
+                if event == "done":
+                    return
+                yield payload.get("token", "")
+
+def render_streamed_response(query):
+    """Render the answer as it arrives; falls back to the blocking endpoint"""
+    placeholder = st.empty()
+    tokens = []
+    try:
+        for token in financial_advisor_chat_stream(query):
+            tokens.append(token)
+            placeholder.markdown(f'<div class="bot-message">🤖 {"".join(tokens)}▌</div>', unsafe_allow_html=True)
+    except Exception:
+        if not tokens:
+            placeholder.empty()
+            return financial_advisor_chat(query)
+    # The full answer is shown again by the chat history below
+    placeholder.empty()
+    return "".join(tokens).strip()
+
 def financial_advisor_chatbot():
     """Streamlit component for Financial Advisor Chatbot"""
     st.header("🤖 Financial Advisor Chatbot")
@@ -139,8 +277,8 @@ def financial_advisor_chatbot():
             # Add user message to chat history
             st.session_state.chat_history.append({"role": "user", "content": user_query})
 
-            # Get bot response
-            bot_response = financial_advisor_chat(user_query)
+            # Get bot response, rendering tokens as they stream in
+            bot_response = render_streamed_response(user_query)
             st.session_state.chat_history.append({"role": "bot", "content": bot_response})
 
     # Display chat history
@@ -210,9 +348,15 @@ def main():
             # Send request to API
             with st.spinner("Analyzing Financial Data..."):
                 try:
-                    response = requests.post(API_URL, json=input_data)
-                    if response.status_code == 200:
-                        result = response.json()
+                    # The glossary feeds the tooltips below; fetch it while /predict runs.
+                    # The worker has no ScriptRunContext, so it gets the plain cache and
+                    # session objects and never calls st.* or a cached function itself
+                    glossary_cache, session = get_glossary_cache(), get_http_session()
+                    with ThreadPoolExecutor(max_workers=1) as pool:
+                        glossary = pool.submit(glossary_cache.get, session)
+                        result = get_financial_insights(make_input_key(input_data))
+                        glossary.exception()
+                    if result:
 
                         # Financial Overview Tab
                         st.header("Financial Health Dashboard")
@@ -231,6 +375,18 @@ def main():
                             st.write("Emergency Fund: ", end="")
                             render_term_with_tooltip("emergency_fund", result['emergency_fund'])
 
+                        # Retirement Projection (Monte Carlo percentile bands)
+                        projection = result.get('retirement_projection')
+                        if projection:
+                            st.subheader("Retirement Projection")
+                            st.write(result['retirement_estimate'])
+                            bands = pd.DataFrame(projection['bands'], index=projection['years'])
+                            fig_retirement = px.line(
+                                bands, labels={'index': 'Years', 'value': 'Balance ($)', 'variable': 'Percentile'},
+                                title=f"Projected Balance ({projection['paths']:,} simulated paths)"
+                            )
+                            st.plotly_chart(fig_retirement)
+
                         # Tax Optimization Display
                         st.header("🧾 Tax Optimization Insights")
                         
@@ -286,15 +442,39 @@ def main():
 
     with tab2:
         st.header("Investment Insights")
-        # Investment Risk Bar Chart
-        risk_data = pd.DataFrame({
-            'Category': ['Short-Term', 'Long-Term', 'Investment Type'],
-            'Risk Level': [0.7, 0.4, 0.6]  # Simulated risk levels
-        })
-
-        fig_risk = px.bar(risk_data, x='Category', y='Risk Level', 
-        title='Investment Risk Profile')
-        st.plotly_chart(fig_risk)
+        try:
+            summary = get_indicator_summary()
+        except Exception as e:
+            summary = {}
+            st.error(f"Error fetching market indicators: {e}")
+
+        if summary:
+            # Investment Risk Bar Chart from the stored price history
+            risk_data = pd.DataFrame([
+                {"Ticker": ticker, "Measure": measure, "Risk Level": abs(values[key] or 0)}
+                for ticker, values in summary.items()
+                for measure, key in (("Annualized Volatility", "volatility"), ("Max Drawdown", "max_drawdown"))
+            ])
+            fig_risk = px.bar(risk_data, x='Ticker', y='Risk Level', color='Measure', barmode='group',
+            title='Investment Risk Profile')
+            st.plotly_chart(fig_risk)
+
+            ticker = st.selectbox("Ticker:", list(summary))
+            history = get_indicator_history(ticker)
+            fig_trend = px.line(history, y=["adj_close", "sma_20", "sma_50", "ema_26"],
+                                title=f'{ticker} Price and Moving Averages')
+            st.plotly_chart(fig_trend)
+
+            col1, col2, col3 = st.columns(3)
+            latest = summary[ticker]
+            # Indicators are None until a ticker has enough history for their window
+            col1.metric("Volatility (20d, annualized)",
+                        "n/a" if latest['volatility'] is None else f"{latest['volatility']:.1%}")
+            col2.metric("Current Drawdown", "n/a" if latest['drawdown'] is None else f"{latest['drawdown']:.1%}")
+            col3.metric("ATR (14d)", "n/a" if latest['atr'] is None else f"${latest['atr']:.2f}")
+
+            fig_drawdown = px.area(history, y="drawdown", title=f'{ticker} Drawdown from Peak')
+            st.plotly_chart(fig_drawdown)
 
     with tab3:
         st.header("Financial Goals")
@@ -0,0 +1,453 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
+import aiohttp
+from aiohttp import web
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RoutingException
+
+import api
+from api import openai  # configured by api on first use
+from metrics import REGISTRY
+from single_flight import AsyncSingleFlight
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class RouteLimit(NamedTuple):
+    concurrency: int
+    timeout: float
+
+
+# Per-route (concurrent requests, seconds) limits; ROUTE_LIMITS overrides them as
+# "/predict=32:10,/financial_advisor=256:60"
+DEFAULT_ROUTE_LIMITS = {
+    "/predict": RouteLimit(32, 10.0),
+    "/predict_batch": RouteLimit(4, 60.0),
+    "/financial_advisor": RouteLimit(256, 60.0),
+    "/financial_advisor/stream": RouteLimit(256, 120.0),
+}
+# Limit for every other route
+DEFAULT_LIMIT = RouteLimit(64, 30.0)
+# Route key of every path no Flask rule matches (404s, scanners, typos)
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Flask routes that burn CPU get their own thread pool, so a burst of them
+# cannot starve the cheap routes (and vice versa)
+CPU_ROUTES = ("/predict", "/predict_batch")
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 32))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', os.cpu_count() or 4))
+WSGI_WORKERS = int(os.getenv('WSGI_WORKERS', 16))
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 64 * 1024 * 1024))
+
+ROUTE_REJECTIONS = REGISTRY.counter(
+    "async_route_rejections_total", "Requests refused for a full route or cut off by its timeout",
+    ["route", "reason"])
+ASYNC_REQUEST_SECONDS = REGISTRY.histogram(
+    "async_request_duration_seconds", "Latency of requests served natively by the async server",
+    ["route", "status"])
+LLM_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_pool_wait_seconds", "Time spent waiting for a free slot in the LLM concurrency pool")
+
+
+def parse_route_limits(spec: Optional[str]) -> Dict[str, RouteLimit]:
+    """
+    Route limits from DEFAULT_ROUTE_LIMITS updated by a spec string
+
+    :param spec: Comma-separated "route=concurrency:timeout" entries
+    :return: Route -> RouteLimit
+    """
+    limits = dict(DEFAULT_ROUTE_LIMITS)
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        try:
+            route, values = entry.split("=")
+            concurrency, timeout = values.split(":")
+            limits[route] = RouteLimit(int(concurrency), float(timeout))
+        except ValueError:
+            raise ValueError(f"Invalid route limit '{entry}', expected route=concurrency:timeout")
+    return limits
+
+
+class RouteOverloaded(Exception):
+    """No slot of the route became free before its timeout."""
+
+
+def _busy_response() -> web.Response:
+    return web.json_response({"error": "Server is busy, try again later"}, status=503)
+
+
+class RouteLimiter:
+    def __init__(self, limits: Dict[str, RouteLimit], default: RouteLimit = DEFAULT_LIMIT):
+        """
+        Concurrency caps and deadlines per route
+
+        A request waits for a free slot of its route, and the wait counts
+        against the route timeout. Must be created inside the event loop.
+
+        :param limits: Route -> RouteLimit
+        :param default: Limit of each route not listed; routes must come from a
+            fixed set (e.g. Flask rules), as each gets its own slots
+        """
+        self.limits = limits
+        self.default = default
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def limit(self, route: str) -> RouteLimit:
+        return self.limits.get(route, self.default)
+
+    def _semaphore(self, route: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(route)
+        if semaphore is None:
+            semaphore = self._semaphores[route] = asyncio.Semaphore(self.limit(route).concurrency)
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self, route: str):
+        """
+        Hold one of the route's slots for the with-block
+
+        :return: Seconds left until the route's deadline
+        :raises RouteOverloaded: If no slot frees up within the route timeout
+        """
+        limit = self.limit(route)
+        deadline = time.monotonic() + limit.timeout
+        semaphore = self._semaphore(route)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), limit.timeout)
+        except asyncio.TimeoutError:
+            ROUTE_REJECTIONS.inc(route=route, reason="overloaded")
+            raise RouteOverloaded(route)
+        try:
+            yield max(deadline - time.monotonic(), 0.0)
+        finally:
+            semaphore.release()
+
+    async def run(self, route: str, handler, *args) -> web.StreamResponse:
+        """
+        Run handler(*args) within the route's limits
+
+        A handler running in a thread cannot be interrupted; on timeout the
+        client gets its 504 while the thread finishes in the background.
+
+        :return: The handler's response, 503 if no slot frees up in time, 504
+            if the handler itself runs past the deadline
+        """
+        try:
+            async with self.slot(route) as remaining:
+                return await asyncio.wait_for(handler(*args), remaining)
+        except RouteOverloaded:
+            return _busy_response()
+        except asyncio.TimeoutError:
+            ROUTE_REJECTIONS.inc(route=route, reason="timeout")
+            return web.json_response({"error": f"Request timed out after {self.limit(route).timeout:g}s"},
+                                     status=504)
+
+
+class AsyncLLMClient:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT,
+                 cache_executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Chat completions over aiohttp with a bounded number of calls in flight
+
+        A slow LLM only holds a slot of this pool (and a coroutine), never a
+        worker thread. The answer cache of api.py is shared with the
+        synchronous routes; its lookups run on cache_executor because a miss
+        in memory reads SQLite. Identical questions in flight at once share
+        one completion (REQUEST_COALESCING_ENABLED).
+
+        :param max_concurrency: Completions in flight at once, the rest wait in line
+        :param timeout: Seconds allowed per completion
+        :param cache_executor: Executor for answer cache reads and writes
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache_executor = cache_executor
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.flight = AsyncSingleFlight("financial_advisor_async", enabled=api.REQUEST_COALESCING_ENABLED)
+
+    async def start(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # One pooled session instead of openai's session per call
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_concurrency))
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def _cache(self, method, *args):
+        if api.answer_cache is None:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(
+            self.cache_executor, getattr(api.answer_cache, method), *args)
+
+    async def _acquire(self) -> None:
+        start = time.perf_counter()
+        await self._semaphore.acquire()
+        LLM_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    async def _create(self, user_query: str, stream: bool):
+        # openai reads the session from a context variable, set it for this task only
+        token = openai.aiosession.set(self._session)
+        try:
+            return await openai.ChatCompletion.acreate(
+                **api._chat_request(user_query, stream), request_timeout=self.timeout)
+        finally:
+            openai.aiosession.reset(token)
+
+    async def complete(self, user_query: str) -> str:
+        """Answer a query like api.financial_advisor_chat (errors become an apology message)."""
+        cache_key = api._answer_cache_key(user_query)
+        cached_answer = await self._cache("get", cache_key)
+        if cached_answer is not None:
+            return cached_answer
+
+        try:
+            return await self.flight.do(cache_key, self._answer, user_query, cache_key)
+        except Exception as e:
+            return api.CHAT_ERROR_MESSAGE.format(e)
+
+    async def _answer(self, user_query: str, cache_key: str) -> str:
+        await self._acquire()
+        start = time.perf_counter()
+        try:
+            response = await self._create(user_query, stream=False)
+            answer = response.choices[0].message.content.strip()
+        except Exception as e:
+            api.OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, mode="async", outcome="error")
+            api.OPENAI_ERRORS.inc(mode="async", error=type(e).__name__)
+            raise
+        finally:
+            self._semaphore.release()
+        api.OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, mode="async", outcome="ok")
+        if answer:
+            await self._cache("set", cache_key, answer)
+        return answer
+
+    async def stream(self, user_query: str) -> AsyncIterator[str]:
+        """Yield the answer token by token like api.financial_advisor_chat_stream; errors are raised."""
+        cache_key = api._answer_cache_key(user_query)
+        cached_answer = await self._cache("get", cache_key)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        tokens = []
+        await self._acquire()
+        start = time.perf_counter()
+        try:
+            async for chunk in await self._create(user_query, stream=True):
+                token = chunk["choices"][0].get("delta", {}).get("content")
+                if token:
+                    tokens.append(token)
+                    yield token
+        except Exception as e:
+            api.OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, mode="async_stream", outcome="error")
+            api.OPENAI_ERRORS.inc(mode="async_stream", error=type(e).__name__)
+            raise
+        finally:
+            self._semaphore.release()
+        api.OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - start, mode="async_stream", outcome="ok")
+        answer = "".join(tokens).strip()
+        if answer:
+            await self._cache("set", cache_key, answer)
+
+
+def _wsgi_environ(request: web.Request, body: bytes) -> dict:
+    host, port = (request.transport.get_extra_info("sockname") or ("localhost", 80))[:2]
+    peer = request.transport.get_extra_info("peername") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": request.path,
+        "QUERY_STRING": request.query_string,
+        "SERVER_NAME": str(host),
+        "SERVER_PORT": str(port),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": str(peer[0]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in request.headers.items():
+        key = name.upper().replace("-", "_")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH":
+            key = f"HTTP_{key}"
+            if key in environ:
+                # Repeated headers are comma-joined, except cookies (RFC 6265)
+                value = environ[key] + ("; " if key == "HTTP_COOKIE" else ",") + value
+            environ[key] = value
+    return environ
+
+
+def _call_wsgi(environ: dict):
+    """Run the Flask app on one request and collect the whole response."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = status, headers
+
+    result = api.app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return int(started["status"].split(" ", 1)[0]), started["headers"], body
+
+
+class AsyncServer:
+    def __init__(self, route_limits: Optional[Dict[str, RouteLimit]] = None, cpu_workers: int = CPU_WORKERS,
+                 wsgi_workers: int = WSGI_WORKERS, llm_max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 llm_timeout: float = LLM_TIMEOUT):
+        """
+        Production serving mode for api.py on an asyncio event loop
+
+        The chatbot routes are served natively: their LLM calls are awaited
+        on a bounded async client, so slow completions queue up there
+        instead of occupying threads. Every other route runs the Flask app
+        on a thread pool, with CPU_ROUTES on a pool of their own, so a
+        backlog of chats never delays /predict.
+
+        :param route_limits: Route -> RouteLimit (default: DEFAULT_ROUTE_LIMITS with ROUTE_LIMITS applied)
+        :param cpu_workers: Threads for CPU_ROUTES
+        :param wsgi_workers: Threads for the other Flask routes
+        :param llm_max_concurrency: LLM completions in flight at once
+        :param llm_timeout: Seconds allowed per LLM completion
+        """
+        self.route_limits = route_limits or parse_route_limits(os.getenv('ROUTE_LIMITS'))
+        self.cpu_executor = ThreadPoolExecutor(cpu_workers, thread_name_prefix="cpu")
+        self.wsgi_executor = ThreadPoolExecutor(wsgi_workers, thread_name_prefix="wsgi")
+        self.llm = AsyncLLMClient(llm_max_concurrency, llm_timeout, cache_executor=self.wsgi_executor)
+        self.limiter: Optional[RouteLimiter] = None
+        # Limits are keyed on the matched rule, so arbitrary paths cannot add routes
+        self._url_adapter = api.app.url_map.bind("localhost")
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=MAX_BODY_BYTES)
+        app.router.add_post("/financial_advisor", self.financial_advisor)
+        app.router.add_post("/financial_advisor/stream", self.financial_advisor_stream)
+        app.router.add_route("*", "/{path:.*}", self.flask_route)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self.limiter = RouteLimiter(self.route_limits)
+        await self.llm.start()
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        await self.llm.close()
+        self.cpu_executor.shutdown(wait=False)
+        self.wsgi_executor.shutdown(wait=False)
+
+    def _flask_rule(self, request: web.Request) -> str:
+        """The Flask rule a request matches (e.g. "/news"), or UNMATCHED_ROUTE."""
+        try:
+            rule, _ = self._url_adapter.match(request.path, method=request.method, return_rule=True)
+        except (HTTPException, RoutingException):
+            return UNMATCHED_ROUTE
+        return rule.rule
+
+    async def flask_route(self, request: web.Request) -> web.StreamResponse:
+        route = self._flask_rule(request)
+        return await self.limiter.run(route, self._flask, request, route)
+
+    async def _flask(self, request: web.Request, route: str) -> web.Response:
+        body = await request.read()
+        executor = self.cpu_executor if route in CPU_ROUTES else self.wsgi_executor
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+            executor, _call_wsgi, _wsgi_environ(request, body))
+        response = web.Response(status=status, body=payload)
+        for name, value in headers:
+            if name.lower() not in ("content-length", "transfer-encoding", "connection"):
+                response.headers.add(name, value)
+        return response
+
+    @staticmethod
+    async def _query(request: web.Request) -> Optional[str]:
+        try:
+            data = await request.json()
+        except ValueError:
+            return None
+        return data.get('query', '') if isinstance(data, dict) else None
+
+    def _observe(self, route: str, start: float, status: int) -> None:
+        ASYNC_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, status=status)
+
+    async def financial_advisor(self, request: web.Request) -> web.StreamResponse:
+        start = time.perf_counter()
+        response = await self.limiter.run(request.path, self._financial_advisor, request)
+        self._observe(request.path, start, response.status)
+        return response
+
+    async def _financial_advisor(self, request: web.Request) -> web.Response:
+        user_query = await self._query(request)
+        if not user_query:
+            return web.json_response({"error": "No query provided"}, status=400)
+        return web.json_response({"response": await self.llm.complete(user_query)})
+
+    async def financial_advisor_stream(self, request: web.Request) -> web.StreamResponse:
+        # Streams cannot be turned into a 504 once started, so only the wait for
+        # a slot is limited here; the LLM client's timeout bounds the stream
+        start = time.perf_counter()
+        try:
+            async with self.limiter.slot(request.path):
+                response = await self._financial_advisor_stream(request)
+        except RouteOverloaded:
+            response = _busy_response()
+        self._observe(request.path, start, response.status)
+        return response
+
+    async def _financial_advisor_stream(self, request: web.Request) -> web.StreamResponse:
+        user_query = await self._query(request)
+        if not user_query:
+            return web.json_response({"error": "No query provided"}, status=400)
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"
+        })
+        await response.prepare(request)
+        tokens = []
+        try:
+            async for token in self.llm.stream(user_query):
+                tokens.append(token)
+                await response.write(api._sse_event({"token": token}).encode())
+            await response.write(api._sse_event({"response": "".join(tokens).strip()}, event="done").encode())
+        except ConnectionResetError:
+            raise
+        except Exception as e:
+            await response.write(api._sse_event({"error": api.CHAT_ERROR_MESSAGE.format(e)}, event="error").encode())
+        await response.write_eof()
+        return response
+
+
+def create_app() -> web.Application:
+    """Application factory, e.g. for gunicorn's aiohttp.GunicornWebWorker."""
+    return AsyncServer().create_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API on an asyncio event loop")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,328 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from portfolio_optimizer import BOND_ASSET, TRADING_DAYS
+from price_store import PriceStore, get_price_store
+from retirement_simulator import BOND_ANNUAL_RETURN, BOND_TICKERS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Rebalance schedules: the portfolio is reset to its target weights on the
+# first trading day of each new period (None: buy and hold)
+REBALANCE_SCHEDULES = {
+    "never": None,
+    "daily": "D",
+    "weekly": "W",
+    "monthly": "M",
+    "quarterly": "Q",
+    "annually": "Y",
+}
+DEFAULT_COSTS_BPS = (0.0, 5.0, 10.0, 25.0)
+DEFAULT_RISK_FREE_RATE = 0.0
+DEFAULT_SHARD_SCENARIOS = 1000
+DEFAULT_CACHE_SIZE = 8
+METRICS = ("cagr", "volatility", "sharpe", "max_drawdown", "annual_turnover", "total_costs")
+
+
+class DailyReturns:
+    def __init__(self, dates: np.ndarray, assets: List[str], growth: np.ndarray,
+                 bonds: np.ndarray, source: str):
+        """
+        Cumulative daily growth of every asset over a common date range
+
+        :param dates: Trading days, ascending
+        :param assets: Asset names
+        :param growth: Shape (len(dates), len(assets)); growth[t] is the value on
+            dates[t] of 1 invested on dates[0]
+        :param bonds: True for bond assets
+        :param source: Description of where the returns came from
+        """
+        self.dates = dates
+        self.assets = assets
+        self.growth = growth
+        self.bonds = bonds
+        self.source = source
+
+    @classmethod
+    def from_store(cls, store: PriceStore, start=None, end=None) -> "DailyReturns":
+        """
+        Adjusted closes of every stored ticker, aligned on the days all of them traded
+
+        Without bond price files a "Bonds" asset accrues BOND_ANNUAL_RETURN
+        every trading day (no volatility).
+        """
+        series = {ticker: store.load_range(ticker, start, end) for ticker in store.tickers()}
+        if not series:
+            raise ValueError(f"No price files found in {store.data_dir}")
+        common = None
+        for s in series.values():
+            common = s.dates if common is None else np.intersect1d(common, s.dates, assume_unique=True)
+        if len(common) < 3:
+            raise ValueError(f"Not enough common price history between {start} and {end}")
+
+        assets = list(series)
+        growth = np.empty((len(common), len(assets)))
+        for i, s in enumerate(series.values()):
+            adj_close = np.asarray(s["adj_close"], dtype=float)[np.searchsorted(s.dates, common)]
+            growth[:, i] = adj_close / adj_close[0]
+        bonds = np.isin(assets, BOND_TICKERS)
+        if not bonds.any():
+            daily = (1.0 + BOND_ANNUAL_RETURN) ** (1.0 / TRADING_DAYS)
+            growth = np.column_stack([growth, daily ** np.arange(len(common))])
+            assets.append(BOND_ASSET)
+            bonds = np.append(bonds, True)
+        source = f"{len(common)} trading days ({common[0]} to {common[-1]}) of {', '.join(assets)}"
+        return cls(common, assets, growth, bonds, source)
+
+    def weights_of(self, allocation: Dict[str, float]) -> np.ndarray:
+        """
+        Asset weights of an allocation like {"Bonds": 80, "Stocks": 20}
+
+        "Stocks" and "Bonds" are spread evenly over the stock and bond
+        assets; keys naming an asset go to that asset.
+        """
+        weights = np.zeros(len(self.assets))
+        for name, value in allocation.items():
+            if name in self.assets:
+                weights[self.assets.index(name)] += value
+            elif name.lower() == "stocks" and (~self.bonds).any():
+                weights[~self.bonds] += value / (~self.bonds).sum()
+            elif name.lower() == "bonds" and self.bonds.any():
+                weights[self.bonds] += value / self.bonds.sum()
+            else:
+                raise ValueError(f"Cannot map allocation '{name}' to {self.assets}")
+        total = weights.sum()
+        if total <= 0 or (weights < 0).any():
+            raise ValueError("Allocation must be non-negative with a positive total")
+        return weights / total
+
+    def rebalance_days(self, schedule: str) -> np.ndarray:
+        """Indices of the trading days a schedule rebalances on (never the first day)."""
+        if schedule not in REBALANCE_SCHEDULES:
+            raise ValueError(f"Unknown rebalance schedule '{schedule}', expected one of {list(REBALANCE_SCHEDULES)}")
+        unit = REBALANCE_SCHEDULES[schedule]
+        if unit is None:
+            return np.empty(0, dtype=np.intp)
+        if unit == "Q":
+            periods = self.dates.astype("datetime64[M]").astype(np.int64) // 3
+        elif unit == "W":
+            # NumPy weeks start on Thursday (1970-01-01); shift so they start on Monday
+            periods = (self.dates + np.timedelta64(3, "D")).astype("datetime64[W]").astype(np.int64)
+        else:
+            periods = self.dates.astype(f"datetime64[{unit}]").astype(np.int64)
+        return np.flatnonzero(np.diff(periods)) + 1
+
+
+def backtest(growth: np.ndarray, weights: np.ndarray, rebalance_days: np.ndarray, cost_rates: np.ndarray,
+             risk_free_rate: float = DEFAULT_RISK_FREE_RATE) -> Dict[str, np.ndarray]:
+    """
+    Backtest many portfolios that share one rebalance schedule
+
+    Between two rebalances each holding just grows, so the portfolio value
+    over a segment is one matrix product of the target weights with the
+    assets' growth since the segment started; the only loop is over
+    rebalance dates. At a rebalance, the trades back to the target weights
+    cost cost_rate times the value traded.
+
+    :param growth: Cumulative asset growth, shape (days, assets), see DailyReturns
+    :param weights: Target weights, shape (portfolios, assets), rows summing to 1
+    :param rebalance_days: Day indices to rebalance on, ascending, all > 0
+    :param cost_rates: Transaction cost per unit traded, per portfolio
+    :param risk_free_rate: Annual rate subtracted for the Sharpe ratio
+    :return: Dict of METRICS, one value per portfolio
+    """
+    n, days = len(weights), len(growth)
+    values = np.empty((n, days))
+    base = np.ones(n)
+    traded = np.zeros(n)
+    costs = np.zeros(n)
+    # Rebalancing on the last day would only pay costs
+    bounds = np.unique(np.concatenate([[0], rebalance_days, [days - 1]])).astype(np.intp)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        relative = growth[start:stop + 1] / growth[start]
+        np.multiply(weights @ relative.T, base[:, None], out=values[:, start:stop + 1])
+        if stop == days - 1:
+            break
+        # Holdings just before rebalancing, and the trades back to target
+        drifted = weights * relative[-1] * base[:, None]
+        value = values[:, stop]
+        turnover = np.abs(weights * value[:, None] - drifted).sum(axis=1)
+        cost = cost_rates * turnover
+        traded += turnover / value
+        costs += cost
+        base = value - cost
+        values[:, stop] = base
+
+    years = (days - 1) / TRADING_DAYS
+    daily = values[:, 1:] / values[:, :-1] - 1.0
+    volatility = daily.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+    excess = daily.mean(axis=1) * TRADING_DAYS - risk_free_rate
+    sharpe = np.divide(excess, volatility, out=np.full(n, np.nan), where=volatility > 1e-12)
+    drawdown = 1.0 - values / np.maximum.accumulate(values, axis=1)
+    return {
+        "cagr": values[:, -1] ** (1.0 / years) - 1.0,
+        "volatility": volatility,
+        "sharpe": sharpe,
+        "max_drawdown": drawdown.max(axis=1),
+        "annual_turnover": traded / years,
+        "total_costs": costs,
+    }
+
+
+# Returns, loaded once per worker process by _init_worker
+_worker_returns = {}
+
+
+def _init_worker(returns: DailyReturns) -> None:
+    _worker_returns["returns"] = returns
+
+
+def _run_shard(weights: np.ndarray, schedule_codes: np.ndarray, cost_rates: np.ndarray,
+               schedules: Sequence[str], risk_free_rate: float,
+               returns: Optional[DailyReturns] = None) -> Dict[str, np.ndarray]:
+    """Backtest one shard of a grid, one backtest call per schedule it contains."""
+    returns = returns or _worker_returns["returns"]
+    result = {metric: np.empty(len(weights)) for metric in METRICS}
+    for code in np.unique(schedule_codes):
+        rows = np.flatnonzero(schedule_codes == code)
+        metrics = backtest(returns.growth, weights[rows], returns.rebalance_days(schedules[code]),
+                           cost_rates[rows], risk_free_rate)
+        for metric, values in metrics.items():
+            result[metric][rows] = values
+    return result
+
+
+class Backtester:
+    def __init__(self, store: Optional[PriceStore] = None, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Vectorized backtests of allocations over the stored price history
+
+        Returns are cached per date window (and reloaded when the price files
+        change).
+
+        :param store: Price store (default: the process-wide one)
+        :param cache_size: Date windows kept, least recently used dropped first
+        """
+        self.store = store or get_price_store()
+        self.cache_size = cache_size
+        self._returns: "OrderedDict[tuple, DailyReturns]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def returns(self, start=None, end=None) -> DailyReturns:
+        key = (str(start) if start else None, str(end) if end else None,
+               tuple((ticker, self.store.version(ticker)) for ticker in self.store.tickers()))
+        with self._lock:
+            if key in self._returns:
+                self._returns.move_to_end(key)
+                return self._returns[key]
+        returns = DailyReturns.from_store(self.store, start, end)
+        with self._lock:
+            self._returns[key] = returns
+            while len(self._returns) > self.cache_size:
+                self._returns.popitem(last=False)
+        return returns
+
+    def run_grid(self, allocations: Sequence[Dict[str, float]], schedules: Sequence[str] = tuple(REBALANCE_SCHEDULES),
+                 costs_bps: Sequence[float] = DEFAULT_COSTS_BPS, start=None, end=None,
+                 risk_free_rate: float = DEFAULT_RISK_FREE_RATE, workers: Optional[int] = None,
+                 shard_scenarios: int = DEFAULT_SHARD_SCENARIOS) -> Dict:
+        """
+        Backtest every combination of allocation, rebalance schedule and transaction cost
+
+        Scenarios are ordered schedule-major and split into shards of
+        shard_scenarios; with workers > 1 the shards run in a process pool,
+        each worker receiving the returns once.
+
+        :param allocations: Allocations like {"Bonds": 80, "Stocks": 20}
+        :param schedules: Names from REBALANCE_SCHEDULES
+        :param costs_bps: Transaction costs in basis points of the value traded, non-negative
+        :param start: First date of the backtest (default: all history)
+        :param end: Last date
+        :param risk_free_rate: Annual rate for the Sharpe ratio
+        :param workers: Worker processes (None or 1: in this process)
+        :param shard_scenarios: Scenarios per shard
+        :return: Columnar results: the grid axes, per-scenario codes into them
+            (allocation, schedule, cost) and one array per metric
+        """
+        returns = self.returns(start, end)
+        schedules = list(schedules)
+        for schedule in schedules:
+            returns.rebalance_days(schedule)  # validate before fanning out
+        targets = np.array([returns.weights_of(allocation) for allocation in allocations])
+        costs = np.asarray(costs_bps, dtype=float)
+        if not np.isfinite(costs).all() or (costs < 0).any():
+            raise ValueError("Transaction costs must be non-negative basis points")
+        schedule_codes, cost_codes, allocation_codes = (
+            grid.ravel() for grid in np.meshgrid(np.arange(len(schedules)), np.arange(len(costs)),
+                                                 np.arange(len(targets)), indexing="ij")
+        )
+        weights, cost_rates = targets[allocation_codes], costs[cost_codes] / 10000.0
+
+        shards = [slice(i, i + shard_scenarios) for i in range(0, len(weights), shard_scenarios)]
+        args = [(weights[s], schedule_codes[s], cost_rates[s], schedules, risk_free_rate) for s in shards]
+        if workers and workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(returns,)) as pool:
+                results = list(pool.map(_run_shard, *zip(*args)))
+        else:
+            results = [_run_shard(*shard_args, returns=returns) for shard_args in args]
+
+        return {
+            "assets": returns.assets,
+            "window": (str(returns.dates[0]), str(returns.dates[-1])),
+            "allocations": list(allocations),
+            "schedules": schedules,
+            "costs_bps": costs.tolist(),
+            "allocation": allocation_codes,
+            "schedule": schedule_codes,
+            "cost": cost_codes,
+            **{metric: np.concatenate([r[metric] for r in results]) for metric in METRICS}
+        }
+
+
+def stock_bond_allocations(steps: int) -> List[Dict[str, float]]:
+    """Allocations from all bonds to all stocks in steps + 1 even increments."""
+    return [{"Bonds": 100.0 * (steps - i) / steps, "Stocks": 100.0 * i / steps} for i in range(steps + 1)]
+
+
+_default_backtester: Optional[Backtester] = None
+
+
+def get_backtester() -> Backtester:
+    """Process-wide Backtester over the default price store."""
+    global _default_backtester
+    if _default_backtester is None:
+        _default_backtester = Backtester()
+    return _default_backtester
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest stock/bond allocations over the stored price history")
+    parser.add_argument("--steps", type=int, default=100, help="Allocation steps from all bonds to all stocks")
+    parser.add_argument("--schedules", default=",".join(REBALANCE_SCHEDULES))
+    parser.add_argument("--costs-bps", default=",".join(f"{c:g}" for c in DEFAULT_COSTS_BPS))
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    backtester = Backtester()
+    start = time.perf_counter()
+    result = backtester.run_grid(stock_bond_allocations(args.steps), args.schedules.split(","),
+                                 [float(c) for c in args.costs_bps.split(",")], args.start, args.end,
+                                 workers=args.workers)
+    logging.info(f"Backtested {len(result['cagr'])} scenarios in {time.perf_counter() - start:.2f}s "
+                 f"over {result['window'][0]} to {result['window'][1]}")
+    best = np.nanargmax(result["sharpe"])
+    logging.info(f"Best Sharpe {result['sharpe'][best]:.2f}: {result['allocations'][result['allocation'][best]]}, "
+                 f"{result['schedules'][result['schedule'][best]]} rebalancing, "
+                 f"{result['costs_bps'][result['cost'][best]]:g} bps costs, CAGR {result['cagr'][best]:.2%}, "
+                 f"max drawdown {result['max_drawdown'][best]:.2%}")
@@ -0,0 +1,4 @@
+"""Reproducible benchmarks for the API and analytics paths.
+
+Run ``python -m benchmarks --help`` from the repository root.
+"""
@@ -0,0 +1,73 @@
+import argparse
+import logging
+import os
+import sys
+
+from benchmarks import suites
+from benchmarks.report import compare, load_results, run_metadata, write_results
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SUITES = {
+    "api": lambda args: suites.bench_api(args.requests, args.seed),
+    "tax": lambda args: suites.bench_tax(seed=args.seed),
+    "tax_lots": lambda args: suites.bench_tax_lots(seed=args.seed),
+    "mixed_load": lambda args: suites.bench_mixed_load(seed=args.seed),
+    "prices": lambda args: suites.bench_prices(args.data_dir),
+    "backtest": lambda args: suites.bench_backtest(),
+    "startup": lambda args: suites.bench_startup(),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the benchmark suites")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES),
+                        help="Suite to run (repeatable, default: all)")
+    parser.add_argument("--requests", type=int, default=500, help="Timed requests per API route")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=None, help="Directory with *_stock_data.csv files")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=os.path.join("benchmarks", "baseline.json"),
+                        help="Stored results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    results = {"meta": run_metadata(), "suites": {}}
+    for name in args.suite or sorted(SUITES):
+        logging.info(f"Running {name} benchmarks...")
+        results["suites"][name] = SUITES[name](args)
+
+    write_results(results, args.output)
+    logging.info(f"Wrote results to {args.output}")
+
+    # Suites with a fixed budget (e.g. startup) fail the run on their own
+    over_budget = [
+        f"{suite}.{name}" for suite, metrics in results["suites"].items()
+        for name, values in metrics.items() if isinstance(values, dict) and values.get("over_budget")
+    ]
+    for name in over_budget:
+        logging.warning(f"{name} is over its budget")
+
+    if args.save_baseline:
+        write_results(results, args.baseline)
+        logging.info(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        logging.info("No baseline found, skipping regression check")
+        return 1 if over_budget else 0
+
+    regressions = compare(results["suites"], load_results(args.baseline)["suites"], args.tolerance)
+    for r in regressions:
+        logging.warning(f"Regression in {r['metric']}: {r['baseline']:.3f} -> {r['current']:.3f} "
+                        f"(+{r['regression']:.0%})")
+    if regressions or over_budget:
+        return 1
+    logging.info("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
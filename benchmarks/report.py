@@ -0,0 +1,76 @@
+import json
+import platform
+import subprocess
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# Metric name suffixes that improve when they go up; everything else timed
+# improves when it goes down
+HIGHER_IS_BETTER = ("_per_sec",)
+LOWER_IS_BETTER = ("_ms", "_us")
+
+
+def run_metadata() -> Dict[str, str]:
+    """Environment details stored with every run so results can be compared."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = "unknown"
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def write_results(results: Dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = 0.2) -> List[Dict]:
+    """
+    Flag metrics that regressed beyond a relative tolerance
+
+    :param current: Results of this run (the "suites" section)
+    :param baseline: Stored results to compare against
+    :param tolerance: Allowed relative slowdown, e.g. 0.2 for 20%
+    :return: One dict per regressed metric
+    """
+    regressions = []
+    baseline_flat = _flatten(baseline)
+    for name, value in _flatten(current).items():
+        reference = baseline_flat.get(name)
+        if not reference:
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            change = (reference - value) / reference
+        elif name.endswith(LOWER_IS_BETTER):
+            change = (value - reference) / reference
+        else:
+            continue
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": reference, "current": value, "regression": change})
+    return sorted(regressions, key=lambda r: -r["regression"])
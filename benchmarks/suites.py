@@ -0,0 +1,429 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.workloads import CHAT_QUERIES, GLOSSARY_TERMS, predict_payloads, synthetic_tax_lots
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarize per-call durations
+
+    :param samples: Durations in seconds
+    :return: Throughput and latency percentiles in milliseconds
+    """
+    samples_ms = np.asarray(samples, dtype=float) * 1000.0
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {
+        "calls": len(samples_ms),
+        "throughput_per_sec": float(len(samples_ms) / (samples_ms.sum() / 1000.0)),
+        "mean_ms": float(samples_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+def _time_calls(fn: Callable[[int], None], calls: int, warmup: int = 5) -> List[float]:
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_api(requests_per_route: int = 500, seed: int = 42) -> Dict[str, Dict[str, float]]:
+    """
+    In-process latency of the main routes through the Flask test client
+
+    The LLM is replaced by a zero-delay fake_llm_server and the answer cache
+    is disabled, so /financial_advisor measures our own overhead.
+
+    :param requests_per_route: Timed requests per route
+    :param seed: Seed for the /predict payloads
+    :return: Latency stats per route
+    """
+    from fake_llm_server import FakeCompletionServer
+
+    llm = FakeCompletionServer().start()
+    os.environ["OPENAI_API_BASE"] = llm.base_url
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    import openai
+    openai.api_base = llm.base_url
+
+    import api
+    api.answer_cache = None
+    client = api.app.test_client()
+    payloads = predict_payloads(requests_per_route, seed)
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"Benchmark request failed with HTTP {response.status_code}")
+
+    results = {
+        "predict": latency_stats(_time_calls(
+            lambda i: check(client.post("/predict", json=payloads[i % len(payloads)])),
+            requests_per_route)),
+        "get_financial_term": latency_stats(_time_calls(
+            lambda i: check(client.get("/get_financial_term", query_string={"term": GLOSSARY_TERMS[i % len(GLOSSARY_TERMS)]})),
+            requests_per_route)),
+        "financial_advisor": latency_stats(_time_calls(
+            lambda i: check(client.post("/financial_advisor", json={"query": CHAT_QUERIES[i % len(CHAT_QUERIES)]})),
+            requests_per_route)),
+    }
+    llm.shutdown()
+    return results
+
+
+def bench_mixed_load(predict_requests: int = 300, chat_clients: int = 64, llm_delay: float = 1.0,
+                     seed: int = 42) -> Dict[str, Dict[str, float]]:
+    """
+    /predict latency on the async server, alone and while chats wait on a slow LLM
+
+    Starts fake_llm_server with llm_delay seconds before each answer and
+    async_server on free local ports. chat_clients concurrent clients (tasks
+    on one event loop, to keep client threads from skewing the numbers) then
+    keep /financial_advisor busy with the answer cache disabled while
+    /predict is timed from one client; /predict p99 should barely move.
+
+    :param predict_requests: Timed /predict requests per phase
+    :param chat_clients: Concurrent chat clients during the loaded phase
+    :param llm_delay: Seconds the fake LLM takes per answer
+    :param seed: Seed for the /predict payloads
+    :return: Latency stats for /predict (idle and loaded) and for the chats
+    """
+    import asyncio
+    import socket
+    import threading
+
+    import aiohttp
+    import requests
+    from aiohttp import web
+
+    from fake_llm_server import FakeCompletionServer
+
+    llm = FakeCompletionServer(first_token_delay=llm_delay).start()
+    os.environ["OPENAI_API_BASE"] = llm.base_url
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    import openai
+    openai.api_base = llm.base_url
+
+    import api
+    from async_server import AsyncServer
+    api.answer_cache = None
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(AsyncServer(llm_max_concurrency=chat_clients).create_app())
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    session = requests.Session()
+    for _ in range(100):
+        try:
+            session.get(f"{base_url}/metrics", timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.05)
+
+    payloads = predict_payloads(predict_requests, seed)
+
+    def predict(i):
+        response = session.post(f"{base_url}/predict", json=payloads[i % len(payloads)], timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(f"Benchmark request failed with HTTP {response.status_code}")
+
+    results = {"predict_idle": latency_stats(_time_calls(predict, predict_requests))}
+
+    stop = threading.Event()
+    chat_samples: List[float] = []
+
+    async def chat(client, i):
+        while not stop.is_set():
+            start = time.perf_counter()
+            async with client.post(f"{base_url}/financial_advisor",
+                                   json={"query": CHAT_QUERIES[i % len(CHAT_QUERIES)]}) as response:
+                await response.read()
+            chat_samples.append(time.perf_counter() - start)
+
+    async def chat_load():
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=chat_clients)) as client:
+            await asyncio.gather(*(chat(client, i) for i in range(chat_clients)))
+
+    load = threading.Thread(target=asyncio.run, args=(chat_load(),), daemon=True)
+    load.start()
+    time.sleep(llm_delay / 2)
+    results["predict_under_chat_load"] = latency_stats(_time_calls(predict, predict_requests))
+    stop.set()
+    load.join()
+    results["financial_advisor_under_load"] = latency_stats(chat_samples)
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    llm.shutdown()
+    return results
+
+
+def bench_tax(batch_sizes=(1, 10, 100, 1000, 10000), seed: int = 42) -> Dict[str, Dict[str, float]]:
+    """
+    TaxOptimizationTool.generate_tax_strategy_report at varying batch sizes
+
+    Times the per-profile tool (one instance and DataFrame per profile, as
+    /predict does) against BatchTaxOptimizationTool on the same inputs.
+
+    :param batch_sizes: Profiles per batch
+    :param seed: Seed for incomes and returns
+    :return: Per-batch wall time and per-profile cost for both paths
+    """
+    from optimize import BatchTaxOptimizationTool, TaxOptimizationTool
+
+    rng = np.random.default_rng(seed)
+    tickers = ["Bonds", "Stocks"]
+    portfolio = {"Bonds": 50, "Stocks": 50}
+    results = {}
+    for size in batch_sizes:
+        incomes = rng.integers(3000, 10000, size) * 12.0
+        returns = rng.uniform(-0.1, 0.1, (size, len(tickers)))
+
+        start = time.perf_counter()
+        for income, row in zip(incomes, returns):
+            tool = TaxOptimizationTool(income=float(income), portfolio=portfolio, region="US")
+            tool.generate_tax_strategy_report(pd.DataFrame({"ticker": tickers, "return": row}))
+        scalar_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        BatchTaxOptimizationTool(incomes, region="US").generate_tax_strategy_report(returns, tickers)
+        batch_seconds = time.perf_counter() - start
+
+        results[f"batch_{size}"] = {
+            "scalar_total_ms": scalar_seconds * 1000.0,
+            "scalar_per_profile_us": scalar_seconds / size * 1e6,
+            "vectorized_total_ms": batch_seconds * 1000.0,
+            "vectorized_per_profile_us": batch_seconds / size * 1e6,
+        }
+    return results
+
+
+def bench_tax_lots(lot_counts=(1000, 10000, 100000), seed: int = 42) -> Dict[str, Dict[str, float]]:
+    """
+    Lot-level tax-loss harvesting (pricing, selection and wash-sale check)
+
+    :param lot_counts: Lots per portfolio
+    :param seed: Seed for the synthetic lots
+    :return: Milliseconds to build the lots and to evaluate a full harvest and a HIFO sale
+    """
+    from optimize import MAX_DEDUCTIBLE_LOSS, lookup_tax_rates
+    from price_store import get_price_store
+    from tax_lots import TaxLots, harvest_losses, select_lots
+
+    tickers = get_price_store().tickers()
+    tax_rates = {name: float(rate) for name, rate in lookup_tax_rates(90000.0).items()}
+    results = {}
+    for count in lot_counts:
+        frame = synthetic_tax_lots(count, tickers, seed)
+        lots = TaxLots.from_frame(frame)
+        sell = {ticker: 10.0 for ticker in lots.symbols}
+        timings = {
+            "build_ms": lambda: TaxLots.from_frame(frame),
+            "harvest_ms": lambda: harvest_losses(lots, tax_rates, MAX_DEDUCTIBLE_LOSS),
+            "hifo_select_ms": lambda: select_lots(lots, "hifo", sell),
+        }
+        results[f"lots_{count}"] = {
+            name: float(np.median(_time_calls(lambda _: fn(), 5, warmup=1)) * 1000.0)
+            for name, fn in timings.items()
+        }
+    return results
+
+
+def bench_backtest(steps: int = 100, costs: int = 17, workers: int = None) -> Dict[str, Dict[str, float]]:
+    """
+    Backtest sweep over stock/bond allocations x every rebalance schedule x transaction costs
+
+    The defaults give 101 x 6 x 17 = 10302 scenarios over the stored price
+    history, run in this process and sharded over a process pool.
+
+    :param steps: Allocation steps from all bonds to all stocks
+    :param costs: Transaction cost levels from 0 to 50 bps
+    :param workers: Pool size (default: all cores)
+    :return: Sweep time per mode
+    """
+    from backtester import REBALANCE_SCHEDULES, Backtester, stock_bond_allocations
+
+    backtester = Backtester()
+    backtester.returns()  # load the prices outside the timings
+    allocations = stock_bond_allocations(steps)
+    costs_bps = np.linspace(0.0, 50.0, costs)
+    scenarios = len(allocations) * len(REBALANCE_SCHEDULES) * len(costs_bps)
+    workers = workers or os.cpu_count()
+
+    results = {"grid": {"scenarios": scenarios, "workers": workers}}
+    for name, pool_size in [("in_process", None), ("process_pool", workers)]:
+        samples = _time_calls(
+            lambda _: backtester.run_grid(allocations, list(REBALANCE_SCHEDULES), costs_bps, workers=pool_size),
+            3, warmup=1)
+        sweep = float(np.median(samples))
+        results[name] = {"sweep_ms": sweep * 1000.0, "per_scenario_us": sweep / scenarios * 1e6}
+    return results
+
+
+# Run in a fresh interpreter by bench_startup: import api, serve one glossary
+# request and print the timings (argv[1] is the parent's launch time)
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+status = api.app.test_client().get("/get_financial_term", query_string={"term": "risk_tolerance"}).status_code
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000.0,
+    "first_request_ms": (served - imported) * 1000.0,
+    "ready_ms": (time.time() - float(sys.argv[1])) * 1000.0,
+    "status": status,
+    "loaded": sorted(m for m in ("numpy", "pandas", "openai", "sklearn") if m in sys.modules)
+}))
+"""
+
+# Loads everything the startup warm-up loads, synchronously, for the deferred import profile
+_DEFERRED_IMPORTS = "import api; api._import_startup_modules(); api.get_risk_model_server(); api.get_news_store()"
+
+# Everything api.py can start in the background at import
+_NO_WARM_UP = {"STARTUP_WARM_UP": "0", "RETIREMENT_WARM_UP": "0", "TAX_OPTIMIZER_WARM_UP": "0"}
+
+STARTUP_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', 500))
+
+
+def import_profile(code: str, env: Dict[str, str] = None, top: int = 12) -> Dict[str, float]:
+    """
+    Import time of a snippet per top-level package, like `python -X importtime` summed up
+
+    Each module's self time is added to its top-level package (sklearn.tree
+    counts as sklearn), so the few packages that dominate stand out.
+
+    :param code: Python code to run in a fresh interpreter
+    :param env: Extra environment variables
+    :param top: Packages to list, the rest are summed as "other"
+    :return: Milliseconds per package plus "total_ms"
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+        env=dict(os.environ, **(env or {})), check=True
+    )
+    packages = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000.0
+    ranked = sorted(packages.items(), key=lambda item: -item[1])
+    profile = dict(ranked[:top])
+    profile["other"] = sum(ms for _, ms in ranked[top:])
+    profile["total_ms"] = sum(packages.values())
+    return profile
+
+
+def bench_startup(repeat: int = 5, budget_ms: float = STARTUP_BUDGET_MS) -> Dict[str, Dict]:
+    """
+    Cold start of the Flask worker: time until a fresh process has answered a glossary request
+
+    Each run launches a new interpreter with the default startup (warm-up
+    thread included) and measures from launch to the first response.
+    Import profiles show what is still on the startup path and what the
+    lazy imports and warm-up moved off it.
+
+    :param repeat: Fresh processes to time
+    :param budget_ms: Allowed launch-to-first-response time; exceeding it at
+        the median sets over_budget
+    :return: Cold start timings and per-package import profiles
+    """
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, repr(time.time())],
+                                   capture_output=True, text=True, check=True)
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        if run["status"] != 200:
+            raise RuntimeError(f"Glossary request failed with HTTP {run['status']}")
+        runs.append(run)
+
+    ready = np.array([run["ready_ms"] for run in runs])
+    cold_start = {
+        "import_ms": float(np.median([run["import_ms"] for run in runs])),
+        "first_request_ms": float(np.median([run["first_request_ms"] for run in runs])),
+        "ready_ms": float(np.median(ready)),
+        "ready_max_ms": float(ready.max()),
+        "budget_ms": budget_ms,
+        "over_budget": int(np.median(ready) > budget_ms),
+        "heavy_modules_loaded_at_ready": max(len(run["loaded"]) for run in runs)
+    }
+    return {
+        "glossary_cold_start": cold_start,
+        "startup_imports": import_profile("import api", _NO_WARM_UP),
+        "deferred_imports": import_profile(_DEFERRED_IMPORTS, _NO_WARM_UP),
+    }
+
+
+def bench_prices(data_dir: str = None, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Price loading: pandas CSV parsing against the memory-mapped price store
+
+    :param data_dir: Directory with *_stock_data.csv files (default: price_store default)
+    :param repeat: Timed repetitions per method
+    :return: Milliseconds to load every ticker, per method
+    """
+    from price_store import PriceStore, default_data_dir
+
+    data_dir = data_dir or default_data_dir()
+    cache_dir = tempfile.mkdtemp(prefix="bench-price-cache-")
+    try:
+        store = PriceStore(data_dir, cache_dir=cache_dir)
+        tickers = store.tickers()
+
+        def read_csvs():
+            for ticker in tickers:
+                pd.read_csv(store.csv_path(ticker), header=0, skiprows=[1])
+
+        def cold_store():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            fresh = PriceStore(data_dir, cache_dir=cache_dir)
+            for ticker in tickers:
+                fresh.load(ticker)
+
+        def warm_store():
+            fresh = PriceStore(data_dir, cache_dir=cache_dir)
+            for ticker in tickers:
+                fresh.load(ticker)["close"].sum()
+
+        def range_slice():
+            for ticker in tickers:
+                store.load_range(ticker, "2021-01-01", "2021-03-31")["close"].sum()
+
+        results = {"tickers": {"count": len(tickers)}}
+        for name, fn in [("pandas_read_csv", read_csvs), ("price_store_cold", cold_store),
+                         ("price_store_warm", warm_store), ("price_store_range_slice", range_slice)]:
+            samples = _time_calls(lambda _: fn(), repeat, warmup=1)
+            results[name] = {"all_tickers_ms": float(np.median(samples) * 1000.0)}
+        return results
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,78 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from data_fetching import generate_user_profiles
+
+INVESTMENT_TYPES = ["stocks", "bonds", "real_estate", "crypto"]
+
+GLOSSARY_TERMS = [
+    "risk_tolerance", "bonds", "stocks", "emergency_fund",
+    "debt_ratio", "tax_loss_harvesting", "portfolio_allocation", "unknown_term"
+]
+
+CHAT_QUERIES = [
+    "What is an emergency fund?",
+    "How much should I save each month?",
+    "Should I pay off debt or invest?",
+    "What is tax loss harvesting?",
+]
+
+
+def synthetic_profiles(num_profiles: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Seeded synthetic profiles from generate_user_profiles
+
+    :param num_profiles: Number of profiles to generate
+    :param seed: Seed so repeated runs use the same workload
+    :return: DataFrame of profiles
+    """
+    return generate_user_profiles(num_profiles, seed=seed, output_path=None)
+
+
+def synthetic_tax_lots(num_lots: int, tickers: List[str], seed: int = 42,
+                       start: str = "2020-01-02", days: int = 1000) -> pd.DataFrame:
+    """
+    Seeded tax lots spread over the given tickers and acquisition window
+
+    :param num_lots: Number of lots
+    :param tickers: Tickers to draw from
+    :param seed: Seed so repeated runs use the same workload
+    :param start: Earliest acquisition date
+    :param days: Acquisition dates fall within this many days of start
+    :return: DataFrame with ticker, acquired, quantity and cost_basis columns
+    """
+    rng = np.random.default_rng(seed)
+    quantity = rng.integers(1, 100, num_lots).astype(float)
+    return pd.DataFrame({
+        "ticker": rng.choice(tickers, num_lots),
+        "acquired": np.datetime64(start, "D") + rng.integers(0, days, num_lots),
+        "quantity": quantity,
+        "cost_basis": quantity * rng.uniform(50, 400, num_lots),
+    })
+
+
+def predict_payloads(num_profiles: int, seed: int = 42) -> List[Dict]:
+    """
+    /predict request bodies built from synthetic profiles
+
+    :param num_profiles: Number of payloads
+    :param seed: Seed for the profiles and the extra request fields
+    :return: List of JSON-ready dicts
+    """
+    profiles = synthetic_profiles(num_profiles, seed)
+    rng = np.random.default_rng(seed)
+    extras = pd.DataFrame({
+        "debt": rng.integers(0, 20000, num_profiles),
+        "current_savings": rng.integers(0, 100000, num_profiles),
+        "target_amount": rng.integers(1000, 200000, num_profiles),
+        "monthly_savings": rng.integers(0, 2000, num_profiles),
+        "years_to_retire": rng.integers(1, 40, num_profiles),
+        "investment_type": rng.choice(INVESTMENT_TYPES, num_profiles),
+    })
+    payloads = pd.concat([profiles.drop(columns=["risk_tolerance"]), extras], axis=1)
+    return [
+        {key: (value.item() if hasattr(value, "item") else value) for key, value in row.items()}
+        for row in payloads.to_dict(orient="records")
+    ]
@@ -1,68 +1,417 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
 import random
 from newsapi import NewsApiClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
 import json
 import os
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Function to fetch historical stock data
-def fetch_stock_data(tickers, start_date, end_date):
-    """Fetch historical stock data for multiple tickers."""
-    all_data = {}
+# Download sources: callables (ticker, start_date, end_date) -> DataFrame with
+# a Date column plus price columns, end_date exclusive like yfinance. Batch
+# sources take a list of tickers and return {ticker: DataFrame} for the ones
+# they got. Both must return the stored columns (Adj Close and an unadjusted
+# Close), so yfinance is called with auto_adjust=False.
+DEFAULT_BATCH_TICKERS = 100
+
+def yfinance_source(ticker, start_date, end_date):
+    """Download daily bars from Yahoo Finance."""
+    stock_data = yf.download(ticker, start=start_date, end=end_date, progress=False, auto_adjust=False)
+    # yf.download reports failures by returning an empty frame; raise so they are retried
+    if stock_data is None or stock_data.empty:
+        raise ValueError(f"No data returned for {ticker}")
+    return _flatten_columns(stock_data).reset_index()
+
+def yfinance_batch_source(tickers, start_date, end_date):
+    """Download daily bars for many tickers from Yahoo Finance in one request."""
+    data = yf.download(list(tickers), start=start_date, end=end_date, progress=False, auto_adjust=False,
+                       group_by="ticker", threads=True)
+    frames = {}
+    if data is None or data.empty:
+        return frames
     for ticker in tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            if ticker not in data.columns.get_level_values(0):
+                continue
+            stock_data = data[ticker]
+        else:
+            stock_data = data
+        # Days only other tickers traded on come back as all-NaN rows
+        stock_data = stock_data.dropna(how="all")
+        if not stock_data.empty:
+            frames[ticker] = stock_data.reset_index()
+    return frames
+
+class CsvDirectorySource:
+    """File-backed stand-in for yfinance that serves bars from *_stock_data.csv files."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, ticker, start_date, end_date):
+        from price_store import read_price_csv
+
+        data = read_price_csv(os.path.join(self.directory, f"{ticker}_stock_data.csv"))
+        mask = (data["Date"] >= pd.Timestamp(start_date)) & (data["Date"] < pd.Timestamp(end_date))
+        return data[mask].reset_index(drop=True)
+
+def _flatten_columns(stock_data):
+    """Drop the ticker level newer yfinance versions add to the columns."""
+    if isinstance(stock_data.columns, pd.MultiIndex):
+        stock_data = stock_data.copy()
+        stock_data.columns = stock_data.columns.get_level_values(0)
+    return stock_data
+
+def last_stored_date(csv_path):
+    """Read the date of the last row of a stored CSV without parsing the whole file."""
+    if not os.path.exists(csv_path):
+        return None
+    with open(csv_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        lines = f.read().decode(errors="ignore").splitlines()
+    for line in reversed(lines):
         try:
-            stock_data = yf.download(ticker, start=start_date, end=end_date)
-            stock_data.reset_index(inplace=True)
-            stock_data.to_csv(f"data/{ticker}_stock_data.csv", index=False)
-            all_data[ticker] = stock_data
-            logging.info(f"Saved stock data for {ticker}")
+            return pd.Timestamp(line.split(",", 1)[0]).date()
+        except ValueError:
+            continue
+    return None
+
+def _download_with_retry(source, ticker, start_date, end_date, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return source(ticker, start_date, end_date)
         except Exception as e:
-            logging.error(f"Failed to fetch stock data for {ticker}: {e}")
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            logging.warning(f"Fetching {ticker} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def _append_rows(csv_path, stock_data):
+    """Append new bars to an existing CSV, following its column order."""
+    with open(csv_path, newline="") as f:
+        header = f.readline().strip().split(",")
+    if set(stock_data.columns) != set(header):
+        # e.g. an auto-adjusted download: no Adj Close and a Close on another basis
+        raise ValueError(f"Downloaded columns {sorted(stock_data.columns)} do not match the stored {sorted(header)}")
+    stock_data = stock_data.copy()
+    stock_data["Date"] = pd.to_datetime(stock_data["Date"]).dt.strftime("%Y-%m-%d")
+    stock_data = stock_data.reindex(columns=header)
+    with open(csv_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    stock_data.to_csv(csv_path, mode="a", header=False, index=False)
+
+def _fetch_window(csv_path, start_date, end_date, incremental):
+    """(first date to download or None if up to date, last stored date or None) for one ticker."""
+    last_date = last_stored_date(csv_path) if incremental else None
+    if last_date is None:
+        return pd.Timestamp(start_date).date(), None
+    fetch_start = last_date + timedelta(days=1)
+    # An empty download counts as a failure, so do not ask for a window without weekdays
+    if np.busday_count(fetch_start, pd.Timestamp(end_date).date()) == 0:
+        return None, last_date
+    return fetch_start, last_date
+
+def _fetch_ticker(ticker, fetch_start, last_date, end_date, csv_path, source, retries, backoff, stock_data=None):
+    if fetch_start is None:
+        logging.info(f"Stock data for {ticker} is up to date")
+        return pd.DataFrame()
+    if stock_data is None:
+        stock_data = _download_with_retry(source, ticker, fetch_start, end_date, retries, backoff)
+    stock_data = _flatten_columns(stock_data)
+
+    if last_date is None:
+        if stock_data.empty:
+            # Never replace stored history with nothing
+            raise ValueError(f"No data returned for {ticker}")
+        # Write next to the target and rename, so a failed write keeps the old file
+        tmp_path = f"{csv_path}.tmp"
+        stock_data.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+        logging.info(f"Saved stock data for {ticker}")
+        return stock_data
+
+    if not stock_data.empty:
+        # Guard against sources that ignore the start date
+        stock_data = stock_data[pd.to_datetime(stock_data["Date"]).dt.date > last_date]
+    if not stock_data.empty:
+        _append_rows(csv_path, stock_data)
+    logging.info(f"Appended {len(stock_data)} rows of stock data for {ticker}")
+    return stock_data
+
+def _prefetch_batches(batch_source, windows, end_date, batch_size):
+    """Download tickers sharing a start date together, batch_size per request."""
+    groups = {}
+    for ticker, (fetch_start, _) in windows.items():
+        if fetch_start is not None:
+            groups.setdefault(fetch_start, []).append(ticker)
+    prefetched = {}
+    for fetch_start, group in groups.items():
+        for i in range(0, len(group), batch_size):
+            chunk = group[i:i + batch_size]
+            try:
+                prefetched.update(batch_source(chunk, fetch_start, end_date))
+            except Exception as e:
+                logging.warning(f"Batch download of {len(chunk)} tickers failed ({e}), fetching them one by one")
+    return prefetched
+
+# Function to fetch historical stock data
+def fetch_stock_data(tickers, start_date, end_date, incremental=False, max_workers=8,
+                     retries=3, backoff=1.0, source=None, data_dir="data", batch_source=None,
+                     batch_size=DEFAULT_BATCH_TICKERS):
+    """Fetch historical stock data for multiple tickers.
+
+    Tickers that need the same date range are first downloaded together,
+    batch_size per request (yfinance's multi-ticker download). Tickers a
+    batch did not return are fetched one by one on a bounded thread pool
+    with retry and exponential backoff. With incremental=True each ticker
+    only fetches the bars after the last date already stored and appends
+    them; the returned frames then hold just the new rows. source replaces
+    yfinance, e.g. with CsvDirectorySource for offline runs; it is then
+    used alone unless batch_source is also given.
+    """
+    if source is None:
+        source, batch_source = yfinance_source, batch_source or yfinance_batch_source
+    end_date = end_date or (date.today() + timedelta(days=1)).isoformat()
+    os.makedirs(data_dir, exist_ok=True)
+    csv_paths = {ticker: os.path.join(data_dir, f"{ticker}_stock_data.csv") for ticker in tickers}
+    windows = {ticker: _fetch_window(csv_paths[ticker], start_date, end_date, incremental) for ticker in tickers}
+    prefetched = _prefetch_batches(batch_source, windows, end_date, batch_size) if batch_source else {}
+
+    all_data = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers) or 1))) as executor:
+        futures = {
+            executor.submit(_fetch_ticker, ticker, *windows[ticker], end_date, csv_paths[ticker],
+                            source, retries, backoff, prefetched.get(ticker)): ticker
+            for ticker in tickers
+        }
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                all_data[ticker] = future.result()
+            except Exception as e:
+                logging.error(f"Failed to fetch stock data for {ticker}: {e}")
     return all_data
 
 # Function to generate synthetic user profiles
-def generate_user_profiles(num_profiles=100):
-    """Generate synthetic user profiles for training."""
-    profiles = []
-    risk_levels = ["low", "medium", "high"]
-    
-    for _ in range(num_profiles):
-        income = random.randint(3000, 10000)  # Monthly income
-        expenses = random.randint(1000, 8000)  # Monthly expenses
-        investment_amount = random.randint(500, 5000)  # Amount they want to invest
-        risk_tolerance = random.choice(risk_levels)  # User's risk tolerance
-        savings = income - expenses  # Calculate monthly savings
-
-        profile = {
+# Synthetic user profiles. Columns are drawn straight into NumPy arrays, one
+# chunk at a time, so millions of rows can be streamed to disk in flat memory.
+PROFILE_COLUMNS = ["income", "expenses", "savings", "risk_tolerance", "investment_amount"]
+RISK_LEVELS = ["low", "medium", "high"]
+DEFAULT_PROFILE_CHUNK_ROWS = 100_000
+
+class ProfileDistribution:
+    def __init__(self, income=(3000, 10000), expenses=(1000, 8000), investment_amount=(500, 5000),
+                 income_expense_correlation=0.0, risk_weights=(1, 1, 1)):
+        """
+        Sampling settings for synthetic profiles
+
+        Income, expenses and investment amount are uniform integers on the
+        inclusive ranges, as in the original generator. A non-zero
+        income_expense_correlation couples income and expenses through a
+        Gaussian copula, keeping both marginals uniform.
+
+        :param income: (low, high) monthly income
+        :param expenses: (low, high) monthly expenses
+        :param investment_amount: (low, high) amount the user wants to invest
+        :param income_expense_correlation: Correlation of the underlying normals, in [-1, 1]
+        :param risk_weights: Relative frequency of each of RISK_LEVELS
+        """
+        if not -1.0 <= income_expense_correlation <= 1.0:
+            raise ValueError("income_expense_correlation must be between -1 and 1")
+        if len(risk_weights) != len(RISK_LEVELS):
+            raise ValueError(f"risk_weights needs one weight per level in {RISK_LEVELS}")
+        self.income = income
+        self.expenses = expenses
+        self.investment_amount = investment_amount
+        self.income_expense_correlation = income_expense_correlation
+        weights = np.asarray(risk_weights, dtype=float)
+        self.risk_probabilities = weights / weights.sum()
+
+    @staticmethod
+    def _scale(uniform, bounds):
+        low, high = bounds
+        return low + np.minimum((uniform * (high - low + 1)).astype(np.int64), high - low)
+
+    def sample(self, rng, size):
+        """
+        Draw one chunk of profiles
+
+        :param rng: numpy.random.Generator
+        :param size: Number of rows
+        :return: Dict of column name -> array, in PROFILE_COLUMNS order
+        """
+        rho = self.income_expense_correlation
+        if rho:
+            from scipy.special import ndtr
+
+            z = rng.standard_normal((2, size))
+            z[1] = rho * z[0] + np.sqrt(1.0 - rho * rho) * z[1]
+            u_income, u_expenses = ndtr(z)
+            income = self._scale(u_income, self.income)
+            expenses = self._scale(u_expenses, self.expenses)
+        else:
+            income = rng.integers(self.income[0], self.income[1], size, endpoint=True)
+            expenses = rng.integers(self.expenses[0], self.expenses[1], size, endpoint=True)
+        investment_amount = rng.integers(self.investment_amount[0], self.investment_amount[1], size, endpoint=True)
+        risk_codes = rng.choice(len(RISK_LEVELS), size, p=self.risk_probabilities).astype(np.int8)
+        return {
             "income": income,
             "expenses": expenses,
-            "savings": savings,
-            "risk_tolerance": risk_tolerance,
+            "savings": income - expenses,
+            "risk_tolerance": risk_codes,
             "investment_amount": investment_amount
         }
-        profiles.append(profile)
-    
-    user_profiles_df = pd.DataFrame(profiles)
-    try:
-        user_profiles_df.to_csv("data/user_profiles.csv", index=False)
-        logging.info("Saved synthetic user profiles to data/user_profiles.csv")
-    except Exception as e:
-        logging.error(f"Failed to save user profiles: {e}")
+
+def iter_user_profile_chunks(num_profiles, seed=None, distribution=None, chunk_rows=DEFAULT_PROFILE_CHUNK_ROWS):
+    """
+    Yield synthetic profiles as column dicts of at most chunk_rows rows
+
+    Chunk i is drawn from its own generator, derived from (seed, i), so the
+    same seed and chunk_rows always produce the same rows. risk_tolerance is
+    yielded as int8 codes into RISK_LEVELS.
+
+    :param num_profiles: Total number of rows
+    :param seed: Integer seed, None for fresh OS entropy
+    :param distribution: ProfileDistribution (default: the original uniform ranges)
+    :param chunk_rows: Rows per chunk
+    """
+    distribution = distribution or ProfileDistribution()
+    root = np.random.SeedSequence(seed)
+    for index, start in enumerate(range(0, num_profiles, chunk_rows)):
+        child = np.random.SeedSequence(root.entropy, spawn_key=(index,))
+        yield distribution.sample(np.random.default_rng(child), min(chunk_rows, num_profiles - start))
+
+def _profile_frame(columns):
+    frame = pd.DataFrame(columns, columns=PROFILE_COLUMNS)
+    frame["risk_tolerance"] = np.asarray(RISK_LEVELS, dtype=object)[columns["risk_tolerance"]]
+    return frame
+
+def write_user_profiles(path, num_profiles, seed=None, distribution=None, chunk_rows=DEFAULT_PROFILE_CHUNK_ROWS):
+    """
+    Stream synthetic profiles to disk without holding them all in memory
+
+    A path ending in .csv gets a CSV with the same layout as
+    generate_user_profiles. Any other path becomes a columnar directory: one
+    .npy file per column, preallocated and filled through np.memmap, plus
+    meta.json naming the risk level categories. Read it back with
+    load_user_profiles_columnar.
+
+    :param path: Output .csv file or columnar directory
+    :param num_profiles: Total number of rows
+    :param seed: Integer seed, None for fresh OS entropy
+    :param distribution: ProfileDistribution (default: the original uniform ranges)
+    :param chunk_rows: Rows generated and written per step
+    :return: Number of rows written
+    """
+    chunks = iter_user_profile_chunks(num_profiles, seed, distribution, chunk_rows)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            for index, columns in enumerate(chunks):
+                _profile_frame(columns).to_csv(f, header=index == 0, index=False)
+        logging.info(f"Wrote {num_profiles} synthetic user profiles to {path}")
+        return num_profiles
+
+    os.makedirs(path, exist_ok=True)
+    outputs = {
+        name: np.lib.format.open_memmap(
+            os.path.join(path, f"{name}.npy"), mode="w+",
+            dtype=np.int8 if name == "risk_tolerance" else np.int64, shape=(num_profiles,)
+        )
+        for name in PROFILE_COLUMNS
+    }
+    start = 0
+    for columns in chunks:
+        stop = start + len(columns["income"])
+        for name, values in columns.items():
+            outputs[name][start:stop] = values
+        start = stop
+    for array in outputs.values():
+        array.flush()
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"rows": num_profiles, "columns": PROFILE_COLUMNS, "risk_levels": RISK_LEVELS, "seed": seed}, f)
+    logging.info(f"Wrote {num_profiles} synthetic user profiles to {path}/")
+    return num_profiles
+
+def load_user_profiles_columnar(path, mmap=True):
+    """
+    Open a directory written by write_user_profiles
+
+    :param path: Columnar profile directory
+    :param mmap: Memory-map the columns instead of reading them into memory
+    :return: (dict of column name -> array, risk level names for the risk_tolerance codes)
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    columns = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        for name in meta["columns"]
+    }
+    return columns, meta["risk_levels"]
+
+def generate_user_profiles(num_profiles=100, seed=None, distribution=None, output_path="data/user_profiles.csv"):
+    """
+    Generate synthetic user profiles for training.
+
+    Builds the whole DataFrame in memory; use write_user_profiles for large
+    row counts.
+
+    :param num_profiles: Number of profiles
+    :param seed: Integer seed, None for fresh OS entropy
+    :param distribution: ProfileDistribution (default: the original uniform ranges)
+    :param output_path: CSV file to save to, None to skip saving
+    :return: DataFrame of profiles
+    """
+    chunks = [
+        _profile_frame(columns)
+        for columns in iter_user_profile_chunks(num_profiles, seed, distribution)
+    ]
+    user_profiles_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=PROFILE_COLUMNS)
+    if output_path:
+        try:
+            user_profiles_df.to_csv(output_path, index=False)
+            logging.info(f"Saved synthetic user profiles to {output_path}")
+        except Exception as e:
+            logging.error(f"Failed to save user profiles: {e}")
     return user_profiles_df
 
 # Function to fetch market news
-def fetch_market_news(api_key, query="stock market", language="en"):
-    """Fetch market news using NewsAPI."""
+def fetch_market_news(api_key, query="stock market", language="en", store=None):
+    """
+    Fetch market news using NewsAPI.
+
+    Articles with unseen URLs are appended to the JSON Lines news archive
+    (NEWS_ARCHIVE_PATH, default data/market_news_archive.jsonl), which a
+    running API tails on its next /news request. The seed file
+    data/market_news.json is never overwritten.
+
+    :param store: news_store.NewsStore to add the articles to (default: one
+        over the archive, loaded first so known URLs are not appended again)
+    """
     try:
         newsapi = NewsApiClient(api_key=api_key)
         articles = newsapi.get_everything(q=query, language=language)
-        with open("data/market_news.json", "w") as f:
-            json.dump(articles["articles"], f)
-        logging.info("Saved market news to data/market_news.json")
+        if store is None:
+            from news_store import NewsStore, default_news_paths
+            store = NewsStore(archive_path=default_news_paths()[1])
+            store.refresh()
+        added = store.add_articles(articles["articles"])
+        logging.info(f"Indexed {added} new articles ({len(store)} total) into {store.archive_path}")
         return articles["articles"]
     except Exception as e:
         logging.error(f"Failed to fetch market news: {e}")
@@ -0,0 +1,150 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions (plain and stream=True) with a canned answer
+split into tokens, sleeping first_token_delay before the first token and
+token_delay between tokens. Point the API at it with
+OPENAI_API_BASE=http://127.0.0.1:<port>/v1.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_ANSWER = (
+    "An emergency fund is money set aside for unexpected expenses. "
+    "Aim for three to six months of essential living costs in an easily accessible savings account."
+)
+
+
+class FakeCompletionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), answer=DEFAULT_ANSWER,
+                 token_delay=0.0, first_token_delay=0.0, fail=False):
+        """
+        :param address: (host, port) to bind, port 0 picks a free one
+        :param answer: Text returned for every completion
+        :param token_delay: Seconds to sleep between streamed tokens
+        :param first_token_delay: Seconds to sleep before the first token
+        :param fail: Respond with HTTP 500 to every request
+        """
+        super().__init__(address, _CompletionHandler)
+        self.answer = answer
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.fail = fail
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def tokens(self):
+        words = self.answer.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def start(self):
+        """Serve from a daemon thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server.count_request()
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        if server.fail:
+            self._send_json(500, {"error": {"message": "Fake server failure", "type": "server_error"}})
+            return
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake-model")
+        time.sleep(server.first_token_delay)
+
+        if not body.get("stream"):
+            time.sleep(server.token_delay * max(0, len(server.tokens()) - 1))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": server.answer},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(server.tokens()), "total_tokens": 0}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, token in enumerate(server.tokens()):
+            if i:
+                time.sleep(server.token_delay)
+            self._send_chunk(completion_id, model, {"content": token}, None)
+        self._send_chunk(completion_id, model, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_chunk(self, completion_id, model, delta, finish_reason):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Seconds between tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    args = parser.parse_args()
+
+    server = FakeCompletionServer((args.host, args.port), answer=args.answer,
+                                  token_delay=args.token_delay, first_token_delay=args.first_token_delay)
+    logging.info(f"Fake completion server listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,266 @@
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Rows evaluated together in batch mode; bounds the (trees x rows) work arrays
+DEFAULT_CHUNK_ROWS = 512
+
+
+class CompiledForest:
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray,
+                 max_depth: int, classes: np.ndarray, n_features: int):
+        """
+        Tree ensemble flattened into contiguous NumPy arrays
+
+        All trees share one node table in which the right child of a split
+        always sits right after its left child, so one step of traversal is
+        node = left[node] + (x > threshold[node]). Leaves point to themselves
+        with threshold +inf, so every row can take exactly max_depth steps
+        without branching on leaf-ness.
+
+        :param feature: Split feature per node
+        :param threshold: Split threshold per node, go left when x <= threshold
+        :param left: Global index of the left child per node (right is left + 1)
+        :param value: Normalized class probabilities per node, shape (nodes, classes)
+        :param roots: Global index of each tree's root node
+        :param max_depth: Deepest tree in the ensemble
+        :param classes: Class labels in predict_proba column order
+        :param n_features: Number of input features
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = classes
+        self.n_features = n_features
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def _prepare(self, X: np.ndarray) -> np.ndarray:
+        # sklearn validates tree inputs as float32, then compares against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        if np.isnan(X).any():
+            raise ValueError("Compiled forests do not support missing values")
+        return X
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Leaf node reached by every row in every tree
+
+        :param X: Array of shape (rows, features)
+        :return: Global leaf indices of shape (trees, rows)
+        """
+        return self._apply(self._prepare(X))
+
+    def _apply(self, X: np.ndarray) -> np.ndarray:
+        n_rows = X.shape[0]
+        # Column-major copy so a (feature, row) pair is one flat index:
+        # column_offset[node] + row
+        columns = np.ascontiguousarray(X.T).ravel()
+        column_offset = self.feature * n_rows
+        rows = np.arange(n_rows)
+        node = np.repeat(self.roots[:, None], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            flat = column_offset.take(node)
+            flat += rows
+            go_right = columns.take(flat) > self.threshold.take(node)
+            node = self.left.take(node)
+            node += go_right
+        return node
+
+    def _proba_from_leaves(self, leaves: np.ndarray) -> np.ndarray:
+        # Summing over the tree axis adds trees one after another, in the same
+        # order as RandomForestClassifier, so the result is bit-identical
+        return self.value[leaves].sum(axis=0) / self.n_trees
+
+    def predict_proba_one(self, x: np.ndarray) -> np.ndarray:
+        """
+        Fast path for a single row
+
+        :param x: Feature vector of length n_features
+        :return: Class probabilities
+        """
+        x = self._prepare(x)[0]
+        node = self.roots
+        for _ in range(self.max_depth):
+            node = self.left.take(node) + (x.take(self.feature.take(node)) > self.threshold.take(node))
+        return self._proba_from_leaves(node)
+
+    def predict_proba(self, X: np.ndarray, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> np.ndarray:
+        """
+        Class probabilities for many rows, evaluated in fixed-size chunks
+
+        :param X: Array of shape (rows, features)
+        :param chunk_rows: Rows evaluated per vectorized pass
+        :return: Array of shape (rows, classes), equal to model.predict_proba
+        """
+        X = self._prepare(X)
+        out = np.empty((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        for start in range(0, X.shape[0], chunk_rows):
+            stop = start + chunk_rows
+            out[start:stop] = self._proba_from_leaves(self._apply(X[start:stop]))
+        return out
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path: str) -> None:
+        """Store the flattened arrays as an .npz file."""
+        np.savez(
+            path, feature=self.feature, threshold=self.threshold, left=self.left, value=self.value,
+            roots=self.roots, max_depth=self.max_depth, classes=self.classes, n_features=self.n_features
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        """Load arrays written by save(); no scikit-learn needed."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["feature"], data["threshold"], data["left"], data["value"],
+                data["roots"], int(data["max_depth"]), data["classes"], int(data["n_features"])
+            )
+
+
+def _values_are_fractions() -> bool:
+    """scikit-learn 1.4+ stores class fractions in tree_.value and predicts them as is."""
+    try:
+        import sklearn
+        from sklearn.utils.fixes import parse_version
+    except ImportError:
+        return True
+    return parse_version(sklearn.__version__) >= parse_version("1.4")
+
+
+_VALUES_ARE_FRACTIONS = _values_are_fractions()
+
+
+def _sibling_order(children_left: np.ndarray, children_right: np.ndarray) -> np.ndarray:
+    """Breadth-first node order in which every right child follows its left sibling."""
+    order = [0]
+    for node in order:
+        if children_left[node] != -1:
+            order.extend((children_left[node], children_right[node]))
+    return np.asarray(order)
+
+
+def compile_forest(model) -> CompiledForest:
+    """
+    Flatten a fitted RandomForestClassifier (or any classifier whose
+    estimators_ expose a sklearn tree_) into a CompiledForest
+
+    :param model: Fitted forest classifier
+    :return: CompiledForest reproducing model.predict_proba bit-for-bit
+    """
+    features, thresholds, lefts, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        order = _sibling_order(tree.children_left, tree.children_right)
+        position = np.empty(tree.node_count, dtype=np.intp)
+        position[order] = np.arange(len(order)) + offset
+
+        children_left = tree.children_left[order]
+        is_leaf = children_left == -1
+        features.append(np.where(is_leaf, 0, tree.feature[order]))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+        lefts.append(np.where(is_leaf, position[order], position[np.where(is_leaf, 0, children_left)]))
+
+        value = tree.value[order, 0, :].astype(np.float64)
+        if not _VALUES_ARE_FRACTIONS:
+            # Same normalization DecisionTreeClassifier.predict_proba applies
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+        values.append(value)
+
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += len(order)
+
+    return CompiledForest(
+        feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+        threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+        left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+        value=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.asarray(roots, dtype=np.intp),
+        max_depth=max_depth,
+        classes=np.asarray(model.classes_),
+        n_features=int(model.n_features_in_)
+    )
+
+
+def _per_row_us(fn, rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for row in rows:
+            fn(row)
+    return (time.perf_counter() - start) / (repeat * len(rows)) * 1e6
+
+
+def benchmark(model, X: np.ndarray, batch_rows: int = 100000, single_rows: Optional[int] = 200,
+              seed: int = 42) -> dict:
+    """
+    Check bit-for-bit agreement with sklearn and time both evaluators
+
+    :param model: Fitted forest classifier
+    :param X: Reference feature matrix (e.g. user_profiles.csv features)
+    :param batch_rows: Rows in the large-batch timing, resampled from X
+    :param single_rows: Rows timed one at a time
+    :param seed: Seed for resampling the large batch
+    :return: Dict of agreement flags and per-row latencies in microseconds
+    """
+    import pandas as pd
+
+    columns = list(getattr(model, "feature_names_in_", range(X.shape[1])))
+    frame = lambda data: pd.DataFrame(np.atleast_2d(data), columns=columns)
+    forest = compile_forest(model)
+
+    reference = model.predict_proba(frame(X))
+    results = {"exact_match_batch": bool(np.array_equal(forest.predict_proba(X), reference))}
+    results["exact_match_single"] = bool(all(
+        np.array_equal(forest.predict_proba_one(row), reference[i]) for i, row in enumerate(X)
+    ))
+
+    rows = X[:single_rows]
+    results["single_row_us_sklearn"] = _per_row_us(lambda row: model.predict_proba(frame(row)), rows, 1)
+    results["single_row_us_compiled"] = _per_row_us(forest.predict_proba_one, rows, 5)
+
+    rng = np.random.default_rng(seed)
+    big = X[rng.integers(0, len(X), batch_rows)]
+    start = time.perf_counter()
+    big_reference = model.predict_proba(frame(big))
+    results["batch_row_us_sklearn"] = (time.perf_counter() - start) / batch_rows * 1e6
+    start = time.perf_counter()
+    big_compiled = forest.predict_proba(big)
+    results["batch_row_us_compiled"] = (time.perf_counter() - start) / batch_rows * 1e6
+    results["exact_match_large_batch"] = bool(np.array_equal(big_compiled, big_reference))
+    return results
+
+
+if __name__ == "__main__":
+    import joblib
+    import pandas as pd
+
+    from train_model import FEATURE_COLUMNS
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    model = joblib.load(os.getenv("RISK_MODEL_PATH", os.path.join(base, "investment_model.pkl")))
+    profiles = pd.read_csv(os.path.join(base, "user_profiles.csv"))
+    for name, value in benchmark(model, profiles[FEATURE_COLUMNS].to_numpy(dtype=float)).items():
+        logging.info(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
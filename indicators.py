@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from price_store import PriceSeries, PriceStore, get_price_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+INDICATOR_CACHE_DIR_NAME = "_indicators"
+INDICATOR_FORMAT_VERSION = 1
+TRADING_DAYS_PER_YEAR = 252
+
+# Window lengths in trading days
+VOLATILITY_WINDOW = 20
+SMA_WINDOWS = (20, 50)
+EMA_SPANS = (12, 26)
+ATR_WINDOW = 14
+
+INDICATOR_COLUMNS = (
+    ["return", "volatility"]
+    + [f"sma_{window}" for window in SMA_WINDOWS]
+    + [f"ema_{span}" for span in EMA_SPANS]
+    + ["drawdown", "atr"]
+)
+
+# Rows of history a tail update needs before the first new row
+LOOKBACK = max((VOLATILITY_WINDOW + 1,) + SMA_WINDOWS)
+
+_PARAMS = {
+    "volatility": VOLATILITY_WINDOW, "sma": list(SMA_WINDOWS), "ema": list(EMA_SPANS),
+    "atr": ATR_WINDOW, "trading_days": TRADING_DAYS_PER_YEAR
+}
+
+
+def _rolling(values: np.ndarray, window: int, start: int, reducer) -> np.ndarray:
+    """
+    Apply reducer over trailing windows ending at rows start..len(values)-1
+
+    Every window is reduced on its own, so the value at a row does not depend
+    on where the computation started. Rows without a full window get NaN.
+    """
+    out = np.full(len(values) - start, np.nan)
+    first = max(start, window - 1)
+    if first < len(values):
+        windows = sliding_window_view(values[first - window + 1:], window)
+        out[first - start:] = reducer(windows)
+    return out
+
+
+def _ewm(values: np.ndarray, alpha: float, previous: Optional[float]) -> np.ndarray:
+    """Recursive EMA, y = (1 - alpha) * y_prev + alpha * x, continued from previous."""
+    if previous is None:
+        return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    # Seeding with the previous value repeats exactly the arithmetic of a full pass
+    seeded = np.concatenate(([previous], values))
+    return pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def compute_indicators(series: PriceSeries, start: int = 0,
+                       state: Optional[dict] = None) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    Indicator values for rows start..end of a price series
+
+    With start > 0, state must hold the values from the row before start
+    (as returned by an earlier call); only the rows from start on are
+    computed, reading at most LOOKBACK earlier rows of prices.
+
+    :param series: Price series with adj_close, close, high and low
+    :param start: First row to compute
+    :param state: Recursive state after row start - 1 (None when start == 0)
+    :return: (indicator name -> array for the computed rows, state after the last row)
+    """
+    if start and state is None:
+        raise ValueError("state is required to continue from a later row")
+    lo = max(0, start - LOOKBACK)
+    adj = np.asarray(series["adj_close"][lo:], dtype=np.float64)
+    close = np.asarray(series["close"][lo:], dtype=np.float64)
+    high = np.asarray(series["high"][lo:], dtype=np.float64)
+    low = np.asarray(series["low"][lo:], dtype=np.float64)
+    offset = start - lo
+
+    returns = np.empty(len(adj))
+    returns[0] = np.nan if lo == 0 else adj[0] / np.asarray(series["adj_close"][lo - 1]) - 1.0
+    returns[1:] = adj[1:] / adj[:-1] - 1.0
+
+    result = {"return": returns[offset:]}
+    result["volatility"] = _rolling(
+        returns, VOLATILITY_WINDOW, offset, lambda w: w.std(axis=1, ddof=1)
+    ) * np.sqrt(TRADING_DAYS_PER_YEAR)
+    for window in SMA_WINDOWS:
+        result[f"sma_{window}"] = _rolling(adj, window, offset, lambda w: w.mean(axis=1))
+
+    new_state = {}
+    for span in EMA_SPANS:
+        name = f"ema_{span}"
+        result[name] = _ewm(adj[offset:], 2.0 / (span + 1), state[name] if start else None)
+        new_state[name] = float(result[name][-1]) if len(result[name]) else (state or {}).get(name)
+
+    running_max = np.maximum.accumulate(
+        np.concatenate(([state["running_max"]], adj[offset:])) if start else adj[offset:]
+    )
+    running_max = running_max[1:] if start else running_max
+    result["drawdown"] = adj[offset:] / running_max - 1.0
+    new_state["running_max"] = float(running_max[-1]) if len(running_max) else (state or {}).get("running_max")
+
+    # True range uses the previous close; the very first bar has only high - low
+    previous_close = np.concatenate(([np.nan], close[:-1]))
+    if lo > 0:
+        previous_close[0] = float(series["close"][lo - 1])
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+    result["atr"] = _ewm(true_range[offset:], 1.0 / ATR_WINDOW, state["atr"] if start else None)
+    new_state["atr"] = float(result["atr"][-1]) if len(result["atr"]) else (state or {}).get("atr")
+    return result, new_state
+
+
+class IndicatorSeries:
+    def __init__(self, ticker: str, dates: np.ndarray, columns: Dict[str, np.ndarray]):
+        """
+        Indicator columns for one ticker, aligned with its price dates
+
+        :param ticker: Ticker symbol
+        :param dates: Sorted datetime64[D] array
+        :param columns: Indicator name -> array aligned with dates
+        """
+        self.ticker = ticker
+        self.dates = dates
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def slice(self, start=None, end=None) -> "IndicatorSeries":
+        lo, hi = PriceSeries(self.ticker, self.dates, {}).index_range(start, end)
+        return IndicatorSeries(self.ticker, self.dates[lo:hi], {name: values[lo:hi] for name, values in self.columns.items()})
+
+    def to_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame({name: np.asarray(values) for name, values in self.columns.items()})
+        frame.index = pd.DatetimeIndex(np.asarray(self.dates), name="Date")
+        return frame
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Latest values plus maximum drawdown, as plain floats (None for NaN)."""
+        def value(x):
+            x = float(x)
+            return None if np.isnan(x) else x
+
+        if not len(self):
+            return {}
+        last = {name: value(values[-1]) for name, values in self.columns.items()}
+        last["max_drawdown"] = value(np.nanmin(self.columns["drawdown"]))
+        last["date"] = str(self.dates[-1])
+        return last
+
+
+class IndicatorEngine:
+    def __init__(self, store: Optional[PriceStore] = None, cache_dir: Optional[str] = None):
+        """
+        Technical indicators over the price store, cached next to the price cache
+
+        Results are stored per ticker as one .npy file per indicator plus the
+        recursive state after the last row. If the last cached bar is still
+        present and unchanged, the prices were only appended to, and just the
+        new tail is computed from that state and a short lookback; otherwise
+        everything is recomputed.
+
+        :param store: Price store (default: the process-wide one)
+        :param cache_dir: Directory for indicator files (default: <price cache>/_indicators)
+        """
+        self.store = store or get_price_store()
+        self.cache_dir = cache_dir or os.path.join(self.store.cache_dir, INDICATOR_CACHE_DIR_NAME)
+        self._open: Dict[str, Tuple[Tuple[int, int], IndicatorSeries]] = {}
+        self._lock = threading.Lock()
+
+    def _ticker_dir(self, ticker: str) -> str:
+        return os.path.join(self.cache_dir, ticker)
+
+    def _read_meta(self, ticker: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._ticker_dir(ticker), "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("format_version") != INDICATOR_FORMAT_VERSION or meta.get("params") != _PARAMS:
+            return None
+        return meta
+
+    def _open_columns(self, ticker: str) -> Dict[str, np.ndarray]:
+        return {
+            name: np.load(os.path.join(self._ticker_dir(ticker), f"{name}.npy"), mmap_mode="r")
+            for name in INDICATOR_COLUMNS
+        }
+
+    @staticmethod
+    def _row_fingerprint(series: PriceSeries, row: int) -> list:
+        return [str(series.dates[row])] + [float(series[name][row]) for name in ("adj_close", "close", "high", "low")]
+
+    def _write(self, ticker: str, columns: Dict[str, np.ndarray], meta: dict) -> None:
+        """Write a complete indicator set, swapping it in atomically."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{ticker}-", dir=self.cache_dir)
+        try:
+            for name, values in columns.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            target_dir = self._ticker_dir(ticker)
+            old_dir = None
+            if os.path.exists(target_dir):
+                old_dir = tempfile.mkdtemp(prefix=f".{ticker}-old-", dir=self.cache_dir)
+                os.rmdir(old_dir)
+                os.replace(target_dir, old_dir)
+            os.replace(tmp_dir, target_dir)
+            if old_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def update(self, ticker: str) -> IndicatorSeries:
+        """
+        Bring a ticker's indicators up to date with its prices and return them
+
+        :param ticker: Ticker symbol
+        :return: IndicatorSeries backed by read-only memmaps
+        """
+        with self._lock:
+            series = self.store.load(ticker)
+            version = self.store.version(ticker)
+            cached = self._open.get(ticker)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            if not len(series):
+                raise ValueError(f"No price rows for {ticker}")
+            meta = self._read_meta(ticker)
+            rows = meta["rows"] if meta else 0
+            # New bars were only appended if the last cached row is unchanged
+            appended = 0 < rows <= len(series) and meta["last_row"] == self._row_fingerprint(series, rows - 1)
+            if not appended:
+                columns, state = compute_indicators(series)
+                self._save(ticker, series, version, columns, state)
+                logging.info(f"Computed indicators for {ticker} ({len(series)} rows)")
+            elif rows < len(series):
+                old = self._open_columns(ticker)
+                tail, state = compute_indicators(series, rows, meta["state"])
+                columns = {name: np.concatenate((old[name], tail[name])) for name in INDICATOR_COLUMNS}
+                del old
+                self._save(ticker, series, version, columns, state)
+                logging.info(f"Updated indicators for {ticker}: {len(series) - rows} new rows")
+            elif tuple(meta["price_version"]) != version:
+                # Touched but unchanged: refresh the stamp
+                meta["price_version"] = list(version)
+                self._save_meta(ticker, meta)
+
+            result = IndicatorSeries(ticker, series.dates, self._open_columns(ticker))
+            self._open[ticker] = (version, result)
+            return result
+
+    def _meta(self, series: PriceSeries, version: Tuple[int, int], state: dict) -> dict:
+        return {
+            "format_version": INDICATOR_FORMAT_VERSION,
+            "params": _PARAMS,
+            "price_version": list(version),
+            "rows": len(series),
+            "last_row": self._row_fingerprint(series, len(series) - 1) if len(series) else None,
+            "state": state,
+        }
+
+    def _save(self, ticker: str, series: PriceSeries, version: Tuple[int, int],
+              columns: Dict[str, np.ndarray], state: dict) -> None:
+        self._open.pop(ticker, None)
+        self._write(ticker, columns, self._meta(series, version, state))
+
+    def _save_meta(self, ticker: str, meta: dict) -> None:
+        tmp_path = os.path.join(self._ticker_dir(ticker), "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self._ticker_dir(ticker), "meta.json"))
+
+    def load_range(self, ticker: str, start=None, end=None) -> IndicatorSeries:
+        return self.update(ticker).slice(start, end)
+
+    def update_many(self, tickers: Optional[List[str]] = None) -> Dict[str, IndicatorSeries]:
+        """Update several tickers (default: every ticker in the price store)."""
+        result = {}
+        for ticker in tickers or self.store.tickers():
+            try:
+                result[ticker] = self.update(ticker)
+            except Exception as e:
+                logging.error(f"Failed to compute indicators for {ticker}: {e}")
+        return result
+
+
+_default_engine: Optional[IndicatorEngine] = None
+
+
+def get_indicator_engine() -> IndicatorEngine:
+    """Process-wide IndicatorEngine over the default price store."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = IndicatorEngine()
+    return _default_engine
+
+
+if __name__ == "__main__":
+    for ticker, indicators in get_indicator_engine().update_many().items():
+        summary = indicators.summary()
+        logging.info(
+            f"{ticker}: volatility {summary['volatility']:.2%}, drawdown {summary['drawdown']:.2%}, "
+            f"max drawdown {summary['max_drawdown']:.2%}, ATR {summary['atr']:.2f}"
+        )
@@ -0,0 +1,120 @@
+import functools
+import importlib
+import logging
+import threading
+import time
+import types
+from typing import Callable, Dict, Iterable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str, on_load: Optional[Callable[[types.ModuleType], None]] = None):
+        """
+        Stand-in for a module that is imported on first attribute access
+
+        `np = LazyModule("numpy")` keeps numpy off the startup path; the
+        first `np.asarray` imports it (once, under the import lock) and
+        every access after that is forwarded to the real module.
+
+        :param name: Module to import
+        :param on_load: Called with the real module right after the import,
+            e.g. to configure it
+        """
+        super().__init__(name)
+        self.__dict__["_lazy_on_load"] = on_load
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    on_load = self.__dict__["_lazy_on_load"]
+                    if on_load is not None:
+                        on_load(module)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_lazy_module"] is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def resolve(module: types.ModuleType) -> types.ModuleType:
+    """The real module behind a LazyModule (importing it if needed), or module itself."""
+    return module._load() if isinstance(module, LazyModule) else module
+
+
+def once(factory: Callable[[], object]) -> Callable[[], object]:
+    """
+    Decorator turning a zero-argument factory into a thread-safe lazy getter
+
+    The first call runs the factory (concurrent callers wait for it) and
+    every later call returns the same object; `getter.loaded()` tells
+    whether that has happened. An exception is raised to the caller and the
+    next call tries again.
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(factory)
+    def getter():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(factory())
+        return result[0]
+
+    getter.loaded = lambda: bool(result)
+    return getter
+
+
+def warm_up(steps: Iterable[Callable[[], object]], name: str = "warm-up") -> threading.Thread:
+    """
+    Run startup steps one after another in a daemon thread
+
+    A failing step is logged and skipped; whatever it would have loaded is
+    then loaded by the first request that needs it.
+
+    :param steps: Callables such as lazy getters or module loaders
+    :param name: Thread name
+    :return: The started thread
+    """
+    steps = list(steps)
+
+    def run():
+        start = time.perf_counter()
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                logging.warning(f"Warm-up step {getattr(step, '__name__', step)} failed: {e}")
+        logging.info(f"{name} finished in {time.perf_counter() - start:.2f}s")
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def import_modules(names: Iterable[str]) -> Dict[str, types.ModuleType]:
+    """Import modules by name, e.g. as a warm-up step."""
+    return {name: importlib.import_module(name) for name in names}
@@ -0,0 +1,235 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from forest_compiler import compile_forest
+from train_model import FEATURE_COLUMNS, LABEL_MAPPING
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "investment_model.pkl")
+
+# Class index -> risk label, inverse of the training label mapping
+RISK_LABELS = {index: label for label, index in LABEL_MAPPING.items()}
+
+# The compiled forest wins on small inputs (no per-call overhead) but
+# sklearn's vectorized trees overtake it at around 1-2k rows
+DEFAULT_COMPILED_MAX_ROWS = 1024
+
+
+class _PendingRequest:
+    __slots__ = ("features", "future", "enqueued_at")
+
+    def __init__(self, features: Sequence[float]):
+        self.features = features
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class RiskModelServer:
+    def __init__(self, model, max_batch_size: int = 64, max_wait_ms: float = 2.0,
+                 stats_window: int = 4096, compiled: bool = True,
+                 compiled_max_rows: int = DEFAULT_COMPILED_MAX_ROWS):
+        """
+        Serve risk predictions from a fitted classifier with micro-batching
+
+        Concurrent callers enqueue feature rows; one worker thread gathers up
+        to max_batch_size rows, waiting at most max_wait_ms after the first
+        one arrives, and answers them all with a single predict_proba call.
+
+        :param model: Fitted classifier trained on FEATURE_COLUMNS
+        :param max_batch_size: Largest batch passed to predict_proba
+        :param max_wait_ms: Longest time a request waits for others to join its batch
+        :param stats_window: Number of recent requests kept for latency percentiles
+        :param compiled: Evaluate forests with forest_compiler instead of sklearn
+        :param compiled_max_rows: Larger inputs go to sklearn, which is faster on big arrays
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.classes = [RISK_LABELS[int(c)] for c in model.classes_]
+        self._use_frame = hasattr(model, "feature_names_in_")
+        self.compiled_max_rows = compiled_max_rows
+        self.forest = None
+        if compiled and hasattr(model, "estimators_"):
+            try:
+                self.forest = compile_forest(model)
+            except Exception as e:
+                logging.warning(f"Falling back to sklearn predict_proba, could not compile model: {e}")
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes: deque = deque(maxlen=stats_window)
+        self._queue_latencies: deque = deque(maxlen=stats_window)
+        self._worker = threading.Thread(target=self._run, name="risk-model-batcher", daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_path(cls, model_path: str = DEFAULT_MODEL_PATH, **kwargs) -> "RiskModelServer":
+        """Load a pickled model once and return a warmed-up server."""
+        model = joblib.load(model_path)
+        server = cls(model, **kwargs)
+        server.warm_up()
+        logging.info(f"Loaded risk model from {model_path}")
+        return server
+
+    def warm_up(self) -> None:
+        """Run one prediction so first requests do not pay lazy-initialization costs."""
+        self.predict_proba_many(np.zeros((1, len(FEATURE_COLUMNS))))
+
+    def predict_proba_many(self, features: np.ndarray) -> np.ndarray:
+        """
+        Score many rows directly with one predict_proba call (no queueing)
+
+        :param features: Array of shape (rows, len(FEATURE_COLUMNS))
+        :return: Class probabilities of shape (rows, classes)
+        """
+        features = np.asarray(features, dtype=float)
+        if self.forest is not None and len(features) <= self.compiled_max_rows:
+            # Bit-identical to model.predict_proba without sklearn's per-call overhead
+            if len(features) == 1:
+                return self.forest.predict_proba_one(features[0])[np.newaxis, :]
+            return self.forest.predict_proba(features)
+        if self._use_frame:
+            # The model was fitted on a DataFrame; keep names to avoid sklearn's warning
+            features = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+        return self.model.predict_proba(features)
+
+    def predict_labels_many(self, features: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Score many rows and return (labels, probabilities)."""
+        proba = self.predict_proba_many(features)
+        return [self.classes[i] for i in proba.argmax(axis=1)], proba
+
+    def predict(self, features: Sequence[float], timeout: Optional[float] = 5.0) -> Tuple[str, Dict[str, float]]:
+        """
+        Score one row through the micro-batch queue
+
+        :param features: Values for FEATURE_COLUMNS, in order
+        :param timeout: Seconds to wait for the batch result
+        :return: (risk label, probability per label)
+        :raises ValueError: If features is not one finite number per feature column
+        """
+        request = _PendingRequest(self._validate_row(features))
+        self._queue.put(request)
+        proba = request.future.result(timeout=timeout)
+        return self.classes[int(np.argmax(proba))], dict(zip(self.classes, proba.tolist()))
+
+    @staticmethod
+    def _validate_row(features: Sequence[float]) -> np.ndarray:
+        # Checked before queueing: a bad row would fail every request in its batch
+        try:
+            row = np.asarray(features, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError(f"Features must be numbers for {FEATURE_COLUMNS}") from None
+        if row.shape != (len(FEATURE_COLUMNS),):
+            raise ValueError(f"Expected {len(FEATURE_COLUMNS)} features {FEATURE_COLUMNS}, got shape {row.shape}")
+        if not np.isfinite(row).all():
+            raise ValueError(f"Features must be finite numbers for {FEATURE_COLUMNS}")
+        return row
+
+    def _collect_batch(self, first: _PendingRequest) -> List[_PendingRequest]:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect_batch(first)
+            dispatched_at = time.perf_counter()
+            try:
+                proba = self.predict_proba_many(np.array([item.features for item in batch], dtype=float))
+            except Exception:
+                # Score the rows one by one so an error only reaches the request that caused it
+                for item in batch:
+                    try:
+                        item.future.set_result(self.predict_proba_many(item.features[np.newaxis, :])[0])
+                    except Exception as e:
+                        item.future.set_exception(e)
+            else:
+                for item, row in zip(batch, proba):
+                    item.future.set_result(row)
+
+            with self._stats_lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._batch_sizes.append(len(batch))
+                self._queue_latencies.extend((dispatched_at - item.enqueued_at) * 1000.0 for item in batch)
+
+    def stats(self) -> Dict[str, float]:
+        """Batch-size and queue-latency statistics over the recent window."""
+        with self._stats_lock:
+            sizes = np.array(self._batch_sizes, dtype=float)
+            latencies = np.array(self._queue_latencies, dtype=float)
+            stats = {
+                "requests": self._requests,
+                "batches": self._batches,
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "compiled": self.forest is not None,
+                "compiled_max_rows": self.compiled_max_rows
+            }
+        if len(sizes):
+            stats.update({
+                "mean_batch_size": float(sizes.mean()),
+                "largest_batch": int(sizes.max())
+            })
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update({
+                "queue_latency_ms_p50": float(p50),
+                "queue_latency_ms_p95": float(p95),
+                "queue_latency_ms_p99": float(p99),
+                "queue_latency_ms_max": float(latencies.max())
+            })
+        return stats
+
+    def close(self) -> None:
+        """Stop the worker after the queued requests are served."""
+        self._queue.put(None)
+        self._worker.join()
+
+
+def load_risk_model_server(model_path: Optional[str] = None) -> Optional[RiskModelServer]:
+    """
+    Build the process-wide model server from environment settings
+
+    :param model_path: Pickled model (default: RISK_MODEL_PATH or investment_model.pkl)
+    :return: Running server, or None if the model cannot be loaded
+    """
+    model_path = model_path or os.getenv("RISK_MODEL_PATH", DEFAULT_MODEL_PATH)
+    try:
+        return RiskModelServer.from_path(
+            model_path,
+            max_batch_size=int(os.getenv("RISK_MODEL_MAX_BATCH_SIZE", 64)),
+            max_wait_ms=float(os.getenv("RISK_MODEL_MAX_WAIT_MS", 2.0)),
+            compiled=os.getenv("RISK_MODEL_COMPILED", "1") != "0",
+            compiled_max_rows=int(os.getenv("RISK_MODEL_COMPILED_MAX_ROWS", DEFAULT_COMPILED_MAX_ROWS))
+        )
+    except Exception as e:
+        logging.error(f"Failed to load risk model from {model_path}: {e}")
+        return None
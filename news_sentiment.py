@@ -0,0 +1,343 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+
+from news_store import INDEXED_FIELDS, TICKER_ALIASES, default_news_paths, iter_json_articles
+from price_store import PriceStore, get_price_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Finance sentiment lexicon, a small subset in the spirit of Loughran-McDonald
+POSITIVE_WORDS = (
+    "gain", "gains", "gained", "rally", "rallies", "rallied", "surge", "surges", "surged", "soar",
+    "soars", "soared", "jump", "jumps", "jumped", "rise", "rises", "rising", "rose", "record",
+    "beat", "beats", "strong", "stronger", "growth", "profit", "profits", "profitable", "upgrade",
+    "upgraded", "bullish", "boost", "boosts", "boosted", "outperform", "outperformed", "optimism",
+    "optimistic", "recovery", "rebound", "rebounded", "winner", "winners", "high", "higher",
+)
+NEGATIVE_WORDS = (
+    "loss", "losses", "lose", "lost", "fall", "falls", "fell", "falling", "drop", "drops", "dropped",
+    "plunge", "plunges", "plunged", "slump", "slumped", "crash", "crashed", "decline", "declines",
+    "declined", "weak", "weaker", "miss", "missed", "downgrade", "downgraded", "bearish", "fear",
+    "fears", "risk", "risks", "lawsuit", "fraud", "recession", "inflation", "layoffs", "cut", "cuts",
+    "selloff", "volatile", "volatility", "concern", "concerns", "low", "lower",
+)
+
+# Identifies the lexicon; cached scores from another lexicon are recomputed
+LEXICON_VERSION = hashlib.sha256(
+    json.dumps([sorted(POSITIVE_WORDS), sorted(NEGATIVE_WORDS), TICKER_ALIASES], sort_keys=True).encode()
+).hexdigest()[:12]
+
+TICKERS = sorted(TICKER_ALIASES)
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "news_sentiment.sqlite3")
+
+# One vocabulary for lexicon words and ticker aliases, so each batch is tokenized once
+_aliases = {alias for aliases in TICKER_ALIASES.values() for alias in aliases}
+_vocabulary = sorted(set(POSITIVE_WORDS) | set(NEGATIVE_WORDS) | _aliases)
+_VECTORIZER = CountVectorizer(vocabulary=_vocabulary, lowercase=True)
+_POSITIVE_WEIGHTS = np.isin(_vocabulary, POSITIVE_WORDS).astype(np.float64)
+_NEGATIVE_WEIGHTS = np.isin(_vocabulary, NEGATIVE_WORDS).astype(np.float64)
+# Term -> ticker incidence matrix, so mentions = counts @ matrix > 0
+_TERM_TICKERS = np.array(
+    [[term in TICKER_ALIASES[ticker] for ticker in TICKERS] for term in _vocabulary], dtype=np.float64
+)
+
+
+def url_key(url: str) -> str:
+    """Cache key for an article: a hash of its URL."""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def _article_text(article: dict) -> str:
+    return " ".join(article.get(field) or "" for field in INDEXED_FIELDS)
+
+
+def score_articles(articles: List[dict]) -> Dict[str, np.ndarray]:
+    """
+    Lexicon sentiment and ticker mentions for a batch of articles
+
+    The batch becomes one sparse term-count matrix over the lexicon and the
+    ticker aliases, so all scores and mentions come out of sparse matrix
+    products.
+
+    :param articles: NewsAPI article dicts
+    :return: Dict of arrays: positive, negative (word counts), score in
+        [-1, 1] ((pos - neg) / (pos + neg), 0 without lexicon words) and
+        tickers (bitmask over TICKERS)
+    """
+    counts = _VECTORIZER.transform([_article_text(article) for article in articles])
+    positive = counts @ _POSITIVE_WEIGHTS
+    negative = counts @ _NEGATIVE_WEIGHTS
+    total = positive + negative
+    score = np.divide(positive - negative, total, out=np.zeros_like(total), where=total > 0)
+
+    mentions = (counts @ _TERM_TICKERS) > 0
+    tickers = mentions.astype(np.int64) @ (1 << np.arange(len(TICKERS), dtype=np.int64))
+    return {"positive": positive, "negative": negative, "score": score, "tickers": tickers}
+
+
+class SentimentScoreCache:
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, lexicon_version: str = LEXICON_VERSION):
+        """
+        SQLite cache of article scores keyed by URL hash
+
+        Rows scored with a different lexicon_version count as misses. Each row
+        also records the last pipeline run that read it (seen_run), which is
+        how a run deduplicates articles without holding their keys in memory.
+
+        :param path: SQLite file (None for an in-memory cache)
+        :param lexicon_version: Identifier of the lexicon producing the scores
+        """
+        self.lexicon_version = lexicon_version
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key TEXT PRIMARY KEY, lexicon_version TEXT NOT NULL, published_at TEXT, "
+            "positive REAL NOT NULL, negative REAL NOT NULL, score REAL NOT NULL, tickers INTEGER NOT NULL, "
+            "seen_run TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(scores)")}
+        if "seen_run" not in columns:
+            self._db.execute("ALTER TABLE scores ADD COLUMN seen_run TEXT")
+
+    def get_many(self, keys: List[str]) -> Dict[str, tuple]:
+        """Cached (published_at, positive, negative, score, tickers) per key."""
+        found = {}
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 900):
+            part = keys[start:start + 900]
+            rows = self._db.execute(
+                f"SELECT key, published_at, positive, negative, score, tickers FROM scores "
+                f"WHERE lexicon_version = ? AND key IN ({','.join('?' * len(part))})",
+                [self.lexicon_version, *part]
+            )
+            for key, *values in rows:
+                found[key] = tuple(values)
+        return found
+
+    def put_many(self, rows: Iterable[tuple], run: Optional[str] = None) -> None:
+        """Store (key, published_at, positive, negative, score, tickers) rows, as seen by run."""
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "INSERT OR REPLACE INTO scores "
+            "(key, lexicon_version, published_at, positive, negative, score, tickers, seen_run) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(key, self.lexicon_version, *values, run) for key, *values in rows]
+        )
+        self._db.execute("COMMIT")
+
+    def claim_many(self, keys: List[str], run: str) -> List[str]:
+        """
+        Mark keys as seen by run
+
+        :param keys: Distinct URL hashes
+        :param run: Pipeline run identifier
+        :return: The keys run had not seen yet, in order (including keys not cached at all)
+        """
+        seen = set()
+        self._db.execute("BEGIN")
+        for start in range(0, len(keys), 900):
+            part = keys[start:start + 900]
+            placeholders = ','.join('?' * len(part))
+            rows = self._db.execute(
+                f"SELECT key FROM scores WHERE seen_run = ? AND key IN ({placeholders})", [run, *part]
+            )
+            seen.update(key for key, in rows)
+            self._db.execute(f"UPDATE scores SET seen_run = ? WHERE key IN ({placeholders})", [run, *part])
+        self._db.execute("COMMIT")
+        return [key for key in keys if key not in seen]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def _batches(articles: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    batch = []
+    for article in articles:
+        batch.append(article)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_scored_batches(articles: Iterable[dict], cache: SentimentScoreCache,
+                        batch_size: int = DEFAULT_BATCH_SIZE, stats: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """
+    Score a stream of articles batch by batch, reusing cached scores
+
+    :param articles: Iterable of article dicts (e.g. iter_json_articles)
+    :param cache: Score cache; only articles missing from it are scored, and
+        it also remembers which URLs this stream has already yielded
+    :param batch_size: Articles held in memory at a time
+    :param stats: Optional dict that receives scored/cached/skipped counters
+    :return: Iterator of DataFrames with key, published_at, positive, negative, score, tickers
+    """
+    stats = stats if stats is not None else {}
+    for name in ("scored", "cached", "skipped"):
+        stats.setdefault(name, 0)
+    # Deduplicate by URL across the stream through the cache, so memory stays
+    # at one batch; articles without a URL cannot be cached
+    run = uuid.uuid4().hex
+    for batch in _batches(articles, batch_size):
+        by_key = {}
+        for article in batch:
+            if article.get("url"):
+                by_key.setdefault(url_key(article["url"]), article)
+        keys = cache.claim_many(list(by_key), run)
+        stats["skipped"] += len(batch) - len(keys)
+
+        cached = cache.get_many(keys)
+        missing = [key for key in keys if key not in cached]
+        if missing:
+            scores = score_articles([by_key[key] for key in missing])
+            new_rows = [
+                (key, by_key[key].get("publishedAt"), positive, negative, score, tickers)
+                for key, positive, negative, score, tickers in zip(
+                    missing, scores["positive"].tolist(), scores["negative"].tolist(),
+                    scores["score"].tolist(), scores["tickers"].tolist()
+                )
+            ]
+            cache.put_many(new_rows, run)
+            cached.update((row[0], row[1:]) for row in new_rows)
+        stats["scored"] += len(missing)
+        stats["cached"] += len(keys) - len(missing)
+
+        yield pd.DataFrame(
+            [(key, *cached[key]) for key in keys],
+            columns=["key", "published_at", "positive", "negative", "score", "tickers"]
+        )
+
+
+def aggregate_daily_sentiment(scored: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Per-ticker, per-day sentiment from scored batches
+
+    Each batch is reduced to (ticker, date) sums and folded into a running
+    total before the next one is read, so memory grows with tickers x days,
+    not with the number of articles or batches.
+
+    :param scored: DataFrames from iter_scored_batches
+    :return: DataFrame with ticker, date, article_count, positive, negative,
+        score_sum and sentiment (mean article score)
+    """
+    columns = ["ticker", "date", "article_count", "positive", "negative", "score_sum", "sentiment"]
+    daily = None
+    bits = 1 << np.arange(len(TICKERS), dtype=np.int64)
+    for batch in scored:
+        dates = pd.to_datetime(batch["published_at"], errors="coerce", utc=True).dt.tz_localize(None).dt.normalize()
+        mentions = (batch["tickers"].to_numpy(dtype=np.int64)[:, None] & bits) != 0
+        rows, ticker_columns = np.nonzero(mentions & dates.notna().to_numpy()[:, None])
+        if not len(rows):
+            continue
+        partial = pd.DataFrame({
+            "ticker": np.asarray(TICKERS)[ticker_columns],
+            "date": dates.to_numpy()[rows],
+            "article_count": 1,
+            "positive": batch["positive"].to_numpy()[rows],
+            "negative": batch["negative"].to_numpy()[rows],
+            "score_sum": batch["score"].to_numpy()[rows],
+        })
+        if daily is not None:
+            partial = pd.concat([daily, partial], ignore_index=True)
+        daily = partial.groupby(["ticker", "date"], as_index=False).sum()
+
+    if daily is None:
+        return pd.DataFrame(columns=columns)
+    daily["sentiment"] = daily["score_sum"] / daily["article_count"]
+    return daily[columns]
+
+
+def merge_with_prices(daily: pd.DataFrame, store: Optional[PriceStore] = None,
+                      tickers: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Align daily sentiment to each ticker's trading days
+
+    News from a non-trading day (weekend, holiday) counts toward the next
+    trading day. Days without news get article_count 0 and sentiment 0.
+
+    :param daily: Output of aggregate_daily_sentiment
+    :param store: Price store (default: the process-wide one)
+    :param tickers: Tickers to merge (default: every ticker with prices)
+    :return: Ticker -> price DataFrame (indexed by Date) with sentiment columns added
+    """
+    store = store or get_price_store()
+    merged = {}
+    for ticker, series in store.load_many(tickers).items():
+        prices = series.to_frame()
+        news = daily[daily["ticker"] == ticker]
+        trading_days = prices.index.values
+        position = np.searchsorted(trading_days, news["date"].values.astype(trading_days.dtype), side="left")
+        in_range = position < len(trading_days)
+        aligned = news[in_range].assign(Date=trading_days[position[in_range]])
+        aligned = aligned.groupby("Date")[["article_count", "positive", "negative", "score_sum"]].sum()
+
+        frame = prices.join(aligned, how="left")
+        frame[["article_count", "positive", "negative", "score_sum"]] = (
+            frame[["article_count", "positive", "negative", "score_sum"]].fillna(0)
+        )
+        frame["article_count"] = frame["article_count"].astype(np.int64)
+        frame["sentiment"] = np.divide(
+            frame["score_sum"].to_numpy(), frame["article_count"].to_numpy(),
+            out=np.zeros(len(frame)), where=frame["article_count"].to_numpy() > 0
+        )
+        merged[ticker] = frame
+    return merged
+
+
+def run_sentiment_pipeline(news_paths: Optional[List[str]] = None, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                           store: Optional[PriceStore] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Score, aggregate and merge news sentiment onto the price history, offline
+
+    :param news_paths: Article files, .json arrays or .jsonl (default: as in news_store)
+    :param cache_path: Score cache file (None keeps it in memory)
+    :param store: Price store (default: the process-wide one)
+    :param batch_size: Articles held in memory at a time
+    :return: (daily sentiment DataFrame, ticker -> merged price DataFrame, counters)
+    """
+    news_paths = news_paths or default_news_paths()[0]
+    cache = SentimentScoreCache(cache_path)
+    stats = {}
+    try:
+        articles = (article for path in news_paths for article in iter_json_articles(path))
+        daily = aggregate_daily_sentiment(iter_scored_batches(articles, cache, batch_size, stats))
+    finally:
+        cache.close()
+    logging.info(
+        f"Sentiment: {stats.get('scored', 0)} articles scored, {stats.get('cached', 0)} from cache, "
+        f"{len(daily)} ticker-days"
+    )
+    return daily, merge_with_prices(daily, store), stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch news sentiment joined to price history")
+    parser.add_argument("news", nargs="*", help="Article files (default: market_news.json and NEWS_ARCHIVE_PATH)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--output", help="Write the daily per-ticker sentiment to this CSV")
+    args = parser.parse_args()
+
+    daily, merged, _ = run_sentiment_pipeline(args.news or None, args.cache, batch_size=args.batch_size)
+    if args.output:
+        daily.to_csv(args.output, index=False)
+        logging.info(f"Saved daily sentiment to {args.output}")
+    for ticker, frame in merged.items():
+        covered = int((frame["article_count"] > 0).sum())
+        logging.info(f"{ticker}: {covered} of {len(frame)} trading days have news")
@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Article fields that feed the keyword index
+INDEXED_FIELDS = ("title", "description", "content")
+
+# Ticker -> lower-case words an article must contain to mention it
+TICKER_ALIASES = {
+    "AAPL": ("aapl", "apple"),
+    "MSFT": ("msft", "microsoft"),
+    "GOOG": ("goog", "googl", "google", "alphabet"),
+    "AMZN": ("amzn", "amazon"),
+    "TSLA": ("tsla", "tesla"),
+}
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+# Archive that fetch_market_news appends to when NEWS_ARCHIVE_PATH is unset
+DEFAULT_ARCHIVE_PATH = os.path.join(MODULE_DIR, "data", "market_news_archive.jsonl")
+
+# Sort key for articles without a usable publishedAt, so they come last
+MISSING_TIME = np.iinfo(np.int64).min
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# NewsAPI truncates content with a marker like "… [+2287 chars]"
+_TRUNCATION_MARKER = re.compile(r"\[\+\d+ chars\]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens of a text, without stopwords."""
+    text = _TRUNCATION_MARKER.sub(" ", text.lower())
+    return [token for token in _TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def parse_timestamp(value) -> int:
+    """
+    Seconds since the epoch for an ISO-8601 time or date
+
+    :param value: e.g. "2024-11-06T15:15:36Z" or "2024-11-06"
+    :return: Epoch seconds, or MISSING_TIME if the value cannot be parsed
+    """
+    if not value:
+        return MISSING_TIME
+    try:
+        return int(np.datetime64(str(value).rstrip("Z"), "s").astype(np.int64))
+    except ValueError:
+        return MISSING_TIME
+
+
+def iter_json_articles(path: str, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """
+    Stream articles from a JSON array file or a JSON Lines file
+
+    The array form (as written by fetch_market_news) is decoded one element
+    at a time from a chunk_size read buffer, so the whole file is never held
+    in memory.
+
+    :param path: .json array or .jsonl file
+    :param chunk_size: Characters read per step
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer:
+            return
+        if buffer[0] != "[":
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos = 1
+        while True:
+            # Skip separators, reading more input when the buffer runs out
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+                pos += 1
+            if pos == len(buffer):
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f"Unterminated JSON array in {path}")
+                buffer, pos = more, 0
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                article, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield article
+            pos = end
+            if pos > chunk_size:
+                buffer, pos = buffer[pos:], 0
+
+
+class NewsStore:
+    def __init__(self, archive_path: Optional[str] = None, ticker_aliases: Dict[str, Sequence[str]] = None):
+        """
+        In-memory searchable news archive
+
+        Articles get consecutive integer ids. Each keyword maps to an
+        append-only postings array of ids, which is sorted because ids only
+        grow. Publication times are kept both per id and as a sorted
+        (time, id) index, so date ranges are two binary searches. Adding
+        articles only touches their own postings, so new fetches never
+        rebuild the index.
+
+        :param archive_path: JSON Lines file that newly added articles are appended
+            to, and that refresh() tails for articles other processes append
+        :param ticker_aliases: Ticker -> words that count as a mention (default: TICKER_ALIASES)
+        """
+        self.archive_path = archive_path
+        self.ticker_aliases = {
+            ticker.upper(): tuple(aliases) for ticker, aliases in (ticker_aliases or TICKER_ALIASES).items()
+        }
+        self._articles: List[dict] = []
+        self._ids_by_url: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._times = array("q")
+        self._sorted_times = np.empty(0, dtype=np.int64)
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._duplicates = 0
+        # Bytes of archive_path already indexed by refresh() or written by us
+        self._archive_offset = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def load(self, path: str) -> int:
+        """
+        Stream a .json or .jsonl file into the store (without archiving it again)
+
+        :param path: Article file
+        :return: Number of new articles
+        """
+        added = self.add_articles(iter_json_articles(path), persist=False)
+        logging.info(f"Indexed {added} new articles from {path} ({len(self)} total)")
+        return added
+
+    def add_articles(self, articles: Iterable[dict], persist: bool = True) -> int:
+        """
+        Index articles not seen before; duplicates (same URL) are skipped
+
+        :param articles: NewsAPI article dicts
+        :param persist: Append the new articles to archive_path
+        :return: Number of new articles
+        """
+        with self._lock:
+            first_id = len(self._articles)
+            new_articles = []
+            for article in articles:
+                url = article.get("url")
+                if not url or url in self._ids_by_url:
+                    self._duplicates += 1
+                    continue
+                doc_id = len(self._articles)
+                self._ids_by_url[url] = doc_id
+                self._articles.append(article)
+                self._times.append(parse_timestamp(article.get("publishedAt")))
+                terms = set()
+                for field in INDEXED_FIELDS:
+                    terms.update(tokenize(article.get(field) or ""))
+                for term in terms:
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = array("q")
+                    postings.append(doc_id)
+                new_articles.append(article)
+
+            if new_articles:
+                self._merge_time_index(first_id)
+                if persist and self.archive_path:
+                    self._append_to_archive(new_articles)
+            return len(new_articles)
+
+    def refresh(self) -> int:
+        """
+        Index articles appended to archive_path since the last call
+
+        Only complete lines are read; a line still being written is picked up
+        next time. One stat() when nothing changed, so it is cheap enough to
+        call per request.
+
+        :return: Number of new articles
+        """
+        if not self.archive_path:
+            return 0
+        with self._lock:
+            try:
+                size = os.path.getsize(self.archive_path)
+            except OSError:
+                return 0
+            if size < self._archive_offset:
+                # Archive was truncated or replaced: re-read it, duplicates are skipped
+                self._archive_offset = 0
+            if size == self._archive_offset:
+                return 0
+            with open(self.archive_path, "rb") as f:
+                f.seek(self._archive_offset)
+                data = f.read(size - self._archive_offset)
+            complete = data.rfind(b"\n") + 1
+            articles = []
+            for line in data[:complete].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    articles.append(json.loads(line))
+                except ValueError as e:
+                    logging.error(f"Skipping malformed line in {self.archive_path}: {e}")
+            self._archive_offset += complete
+            added = self.add_articles(articles, persist=False)
+            if added:
+                logging.info(f"Indexed {added} new articles from {self.archive_path} ({len(self)} total)")
+            return added
+
+    def _merge_time_index(self, first_id: int) -> None:
+        new_ids = np.arange(first_id, len(self._articles), dtype=np.int64)
+        new_times = np.asarray(self._times[first_id:], dtype=np.int64)
+        order = np.argsort(new_times, kind="stable")
+        new_ids, new_times = new_ids[order], new_times[order]
+        # side="right" keeps articles with equal times in id order
+        positions = np.searchsorted(self._sorted_times, new_times, side="right")
+        self._sorted_times = np.insert(self._sorted_times, positions, new_times)
+        self._sorted_ids = np.insert(self._sorted_ids, positions, new_ids)
+
+    def _append_to_archive(self, articles: List[dict]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.archive_path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.archive_path, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            caught_up = f.tell() == self._archive_offset
+            f.write("".join(json.dumps(article) + "\n" for article in articles).encode("utf-8"))
+            if caught_up:
+                # Our own lines need no re-reading; otherwise refresh() reads
+                # them along with the other writer's and skips them as duplicates
+                self._archive_offset = f.tell()
+
+    def _term_ids(self, term: str) -> np.ndarray:
+        postings = self._postings.get(term)
+        if postings is None:
+            return np.empty(0, dtype=np.int64)
+        return np.frombuffer(postings, dtype=np.int64).copy()
+
+    def _ticker_ids(self, ticker: str) -> np.ndarray:
+        aliases = self.ticker_aliases.get(ticker.upper(), (ticker.lower(),))
+        ids = [self._term_ids(alias) for alias in aliases]
+        return ids[0] if len(ids) == 1 else np.unique(np.concatenate(ids))
+
+    def search(self, query: Optional[str] = None, ticker: Optional[str] = None,
+               start: Optional[str] = None, end: Optional[str] = None,
+               limit: int = 20, offset: int = 0) -> Tuple[int, List[dict]]:
+        """
+        Find articles matching every given filter, newest first
+
+        :param query: Keywords that must all appear in title, description or content
+        :param ticker: Ticker symbol, matched through its aliases
+        :param start: Earliest publishedAt (ISO date or time, inclusive)
+        :param end: Latest publishedAt (inclusive; a bare date covers the whole day)
+        :param limit: Page size
+        :param offset: Matches to skip
+        :return: (total number of matches, articles on the requested page)
+        """
+        low = parse_timestamp(start) if start else None
+        high = parse_timestamp(end) if end else None
+        if MISSING_TIME in (low, high):
+            raise ValueError("start and end must be ISO-8601 dates or times")
+        if end and len(end) == 10:
+            high += 86399
+
+        with self._lock:
+            candidates = []
+            for term in dict.fromkeys(tokenize(query or "")):
+                candidates.append(self._term_ids(term))
+            if ticker:
+                candidates.append(self._ticker_ids(ticker))
+
+            if not candidates:
+                # Date filter only: a slice of the sorted time index
+                lo = 0 if low is None else np.searchsorted(self._sorted_times, low, side="left")
+                hi = len(self._sorted_times) if high is None else np.searchsorted(self._sorted_times, high, side="right")
+                matches = self._sorted_ids[lo:hi][::-1]
+            else:
+                # Intersect the shortest postings first
+                candidates.sort(key=len)
+                ids = candidates[0]
+                for other in candidates[1:]:
+                    if not len(ids):
+                        break
+                    ids = np.intersect1d(ids, other, assume_unique=True)
+                times = np.frombuffer(self._times, dtype=np.int64)[ids]
+                keep = np.ones(len(ids), dtype=bool)
+                if low is not None:
+                    keep &= times >= low
+                if high is not None:
+                    keep &= times <= high
+                ids, times = ids[keep], times[keep]
+                # Newest first, ties by newest id
+                matches = ids[np.lexsort((-ids, -times))]
+
+            page = matches[offset:offset + limit]
+            return len(matches), [self._articles[i] for i in page.tolist()]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "articles": len(self._articles),
+                "terms": len(self._postings),
+                "duplicates_skipped": self._duplicates
+            }
+
+
+def default_news_paths() -> Tuple[List[str], Optional[str]]:
+    """
+    Article files to load at startup and the archive to append to
+
+    NEWS_DATA_PATH (default: data/market_news.json, else market_news.json next
+    to this module) plus the NEWS_ARCHIVE_PATH JSON Lines archive (default:
+    DEFAULT_ARCHIVE_PATH), each if it exists.
+    """
+    seed = os.getenv("NEWS_DATA_PATH")
+    if not seed:
+        seed = os.path.join(MODULE_DIR, "data", "market_news.json")
+        if not os.path.exists(seed):
+            seed = os.path.join(MODULE_DIR, "market_news.json")
+    archive = os.getenv("NEWS_ARCHIVE_PATH") or DEFAULT_ARCHIVE_PATH
+    paths = [path for path in (seed, archive) if path and os.path.exists(path)]
+    return paths, archive
+
+
+def load_news_store() -> NewsStore:
+    """Build the process-wide news store from environment settings."""
+    paths, archive = default_news_paths()
+    store = NewsStore(archive_path=archive)
+    for path in paths:
+        try:
+            if path == archive:
+                # Tailed rather than loaded, so later appends reach refresh()
+                store.refresh()
+            else:
+                store.load(path)
+        except Exception as e:
+            logging.error(f"Failed to load news from {path}: {e}")
+    return store
@@ -1,19 +1,158 @@
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Union, Any
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Union, Any, Tuple
+
+from portfolio_optimizer import PortfolioOptimizer, get_portfolio_optimizer
+from return_table import TickerReturns
+from tax_lots import WASH_SALE_DAYS, TaxLots, harvest_losses
+
+# Tax brackets per region. Each rate type maps to (thresholds, rates): an
+# income strictly above thresholds[i] moves into rates[i + 1]. Thresholds must
+# be sorted ascending and there is one more rate than thresholds. New regions
+# only need an entry here.
+TAX_BRACKETS = {
+    'US': {
+        'short_term_capital_gains': (
+            [41775, 89075, 170050, 209425, 578125],
+            [0.12, 0.22, 0.24, 0.32, 0.35, 0.37]
+        ),
+        'long_term_capital_gains': (
+            [44625, 492300],
+            [0.0, 0.15, 0.20]
+        ),
+        'dividend': (
+            [44625, 492300],
+            [0.0, 0.15, 0.20]
+        )
+    }
+}
+
+DEFAULT_TAX_REGION = 'US'
+
+# Allocation assumed for profiles whose current portfolio is unknown
+DEFAULT_PORTFOLIO = {'Bonds': 50, 'Stocks': 50}
+
+# Share of annual income assumed invested when turning a return into dollars
+INVESTED_INCOME_SHARE = 0.05
+
+MAX_DEDUCTIBLE_LOSS = 3000  # Standard US tax rule
+
+
+@lru_cache(maxsize=None)
+def _bracket_tables(region: str) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Compile a region's brackets into sorted NumPy lookup tables (cached)
+
+    :param region: Tax jurisdiction, unknown regions fall back to the default
+    :return: Dictionary of (thresholds, rates) arrays per rate type
+    """
+    brackets = TAX_BRACKETS.get(region, TAX_BRACKETS[DEFAULT_TAX_REGION])
+    tables = {}
+    for rate_type, (thresholds, rates) in brackets.items():
+        thresholds = np.asarray(thresholds, dtype=float)
+        rates = np.asarray(rates, dtype=float)
+        if len(rates) != len(thresholds) + 1 or np.any(np.diff(thresholds) <= 0):
+            raise ValueError(f"Invalid {rate_type} brackets for region {region}")
+        tables[rate_type] = (thresholds, rates)
+    return tables
+
+
+def lookup_tax_rates(income: Union[float, np.ndarray], region: str = 'US') -> Dict[str, np.ndarray]:
+    """
+    Look up tax rates for one or many incomes with a binary search per rate type
+
+    :param income: Annual income, scalar or array
+    :param region: Tax jurisdiction (default: US)
+    :return: Dictionary of rate arrays shaped like income
+    """
+    income = np.asarray(income, dtype=float)
+    return {
+        rate_type: rates[np.searchsorted(thresholds, income, side='left')]
+        for rate_type, (thresholds, rates) in _bracket_tables(region).items()
+    }
+
+
+def _optimize_at_current_risk(optimizer: PortfolioOptimizer, tax_rates: Dict[str, float],
+                              portfolio: Dict[str, float], start=None, end=None) -> Dict[str, Any]:
+    """
+    Pick the after-tax efficient portfolio with at most the risk of the current one
+
+    :param optimizer: Optimizer holding the cached estimates and frontiers
+    :param tax_rates: Tax rates of the investor
+    :param portfolio: Current allocation, e.g. {"Bonds": 80, "Stocks": 20}
+    :param start: First date of the estimation window
+    :param end: Last date of the estimation window
+    :return: Optimized weights and expected figures for both portfolios
+    """
+    market = optimizer.estimates(start, end)
+    after_tax_mean, _ = market.after_tax(tax_rates)
+    current = optimizer.weights_of(portfolio, start, end)
+    current_volatility = float(np.sqrt(current @ market.cov @ current))
+
+    frontier = optimizer.frontier(tax_rates, start, end)
+    index = int(optimizer.at_volatility(tax_rates, current_volatility, start, end))
+    pre_tax_return = float(frontier['pre_tax_return'][index])
+    after_tax_return = float(frontier['after_tax_return'][index])
+    return {
+        'optimized_portfolio': {
+            asset: round(float(weight), 4)
+            for asset, weight in zip(frontier['assets'], frontier['weights'][index]) if weight >= 5e-5
+        },
+        # Share of the expected return lost to tax
+        'estimated_tax_efficiency': 1.0 - after_tax_return / pre_tax_return if pre_tax_return > 0 else 0.0,
+        'expected_return': pre_tax_return,
+        'after_tax_return': after_tax_return,
+        'volatility': float(frontier['volatility'][index]),
+        'current_after_tax_return': float(current @ after_tax_mean),
+        'current_volatility': current_volatility,
+        'estimation_window': list(frontier['window'])
+    }
+
+
+def allocation_weights(portfolios: Sequence[Dict[str, float]], tickers: Sequence[str]) -> np.ndarray:
+    """
+    Fraction of each allocation held in each ticker or asset class
+
+    :param portfolios: Allocations like {"Bonds": 80, "Stocks": 20}
+    :param tickers: Names to look up; names an allocation does not hold get 0
+    :return: Array of shape (len(portfolios), len(tickers))
+    """
+    weights = np.array([[portfolio.get(ticker, 0) for ticker in tickers] for portfolio in portfolios], dtype=float)
+    totals = np.array([sum(portfolio.values()) for portfolio in portfolios], dtype=float)
+    return np.divide(weights, totals[:, None], out=np.zeros_like(weights), where=totals[:, None] > 0)
+
+
+def distinct_tax_rates(region: str = 'US') -> List[Dict[str, float]]:
+    """
+    Every distinct combination of rates an income can get in a region
+
+    :param region: Tax jurisdiction
+    :return: One rates dictionary per combination
+    """
+    tables = _bracket_tables(region)
+    incomes = np.unique(np.concatenate([[0.0]] + [thresholds + 1.0 for thresholds, _ in tables.values()]))
+    rates = lookup_tax_rates(incomes, region)
+    names = sorted(rates)
+    combinations = np.unique(np.column_stack([rates[name] for name in names]), axis=0)
+    return [dict(zip(names, row)) for row in combinations.tolist()]
+
 
 class TaxOptimizationTool:
-    def __init__(self, income: float, portfolio: Dict[str, float], region: str = 'US'):
+    def __init__(self, income: float, portfolio: Dict[str, float], region: str = 'US',
+                 optimizer: Optional[PortfolioOptimizer] = None):
         """
         Initialize tax optimization tool with user financial profile
         
         :param income: Annual income
         :param portfolio: Current investment portfolio allocation
         :param region: Tax jurisdiction (default: US)
+        :param optimizer: Portfolio optimizer (default: the process-wide one)
         """
         self.income = income
         self.portfolio = portfolio
         self.region = region
+        self.optimizer = optimizer or get_portfolio_optimizer()
         self.tax_rates = self._get_tax_rates()
     
     def _get_tax_rates(self) -> Dict[str, float]:
@@ -22,33 +161,42 @@ class TaxOptimizationTool:
         
         :return: Dictionary of tax rates for different investment types
         """
-        base_rates = {
-            'US': {
-                'short_term_capital_gains': 0.37 if self.income > 578125 else 
-                           0.35 if self.income > 209425 else 
-                           0.32 if self.income > 170050 else 
-                           0.24 if self.income > 89075 else 
-                           0.22 if self.income > 41775 else 0.12,
-                'long_term_capital_gains': 0.20 if self.income > 492300 else 
-                              0.15 if self.income > 44625 else 0.0,
-                'dividend': 0.20 if self.income > 492300 else 
-                           0.15 if self.income > 44625 else 0.0
-            }
+        return {
+            rate_type: float(rate)
+            for rate_type, rate in lookup_tax_rates(self.income, self.region).items()
         }
-        return base_rates.get(self.region, base_rates['US'])
     
-    def tax_loss_harvesting(self, investment_data: pd.DataFrame) -> Dict[str, Union[float, List[str]]]:
+    def tax_loss_harvesting(self, investment_data: Union[pd.DataFrame, TickerReturns, TaxLots],
+                            **harvest_options) -> Dict[str, Union[float, List[str]]]:
         """
         Identify tax loss harvesting opportunities
         
-        :param investment_data: DataFrame with investment performance data
+        Returns are fractions; each holding is valued at its share of the
+        portfolio times the invested share of income (INVESTED_INCOME_SHARE),
+        so losses, the deduction cap and the savings are in dollars.
+        
+        :param investment_data: DataFrame with ticker and return columns, TickerReturns
+            (e.g. from return_table), or TaxLots for a lot-level evaluation priced
+            from the stored price data
+        :param harvest_options: Passed to tax_lots.harvest_losses for TaxLots
+            (as_of, method, sell, lot_ids, purchases, realized_gains, ...)
         :return: Dict with tax loss opportunities and potential savings
         """
-        unrealized_losses = investment_data[investment_data['return'] < 0]
-        total_loss = unrealized_losses['return'].sum()
+        if isinstance(investment_data, TaxLots):
+            return harvest_losses(investment_data, self.tax_rates, MAX_DEDUCTIBLE_LOSS, **harvest_options)
+
+        if isinstance(investment_data, pd.DataFrame):
+            investment_data = TickerReturns(investment_data['ticker'].tolist(),
+                                            investment_data['return'].to_numpy(dtype=float))
+        position_values = self.income * INVESTED_INCOME_SHARE * allocation_weights(
+            [self.portfolio], investment_data.tickers)[0]
+        gains = investment_data.returns * position_values
+        losses = gains < 0
+        total_loss = float(gains[losses].sum())
         
-        harvest_candidates = unrealized_losses['ticker'].tolist()
-        max_deductible_loss = min(total_loss, 3000)  # Standard US tax rule
+        harvest_candidates = [ticker for ticker, is_loss in zip(investment_data.tickers, losses.tolist()) if is_loss]
+        # Losses are negative; the deduction is their magnitude, capped
+        max_deductible_loss = min(abs(total_loss), MAX_DEDUCTIBLE_LOSS)
         
         return {
             'total_potential_tax_savings': max_deductible_loss * self.tax_rates['short_term_capital_gains'],
@@ -56,50 +204,188 @@ class TaxOptimizationTool:
             'max_deductible_loss': max_deductible_loss
         }
     
-    def optimize_portfolio_tax_efficiency(self) -> Dict[str, Union[float, Dict]]:
+    def optimize_portfolio_tax_efficiency(self, start=None, end=None) -> Dict[str, Union[float, Dict]]:
         """
         Recommend tax-efficient portfolio rebalancing
         
+        Solves for the after-tax mean-variance portfolio (estimated from the
+        stored price history) with no more volatility than the current one.
+        
+        :param start: First date of the estimation window (default: all history)
+        :param end: Last date of the estimation window
         :return: Optimized portfolio allocation with tax considerations
         """
-        optimized_allocation = {
-            'bonds': 0.3,  # Tax-efficient municipal bonds
-            'index_funds': 0.4,  # Lower turnover, more tax-efficient
-            'dividend_stocks': 0.2,  # Qualified dividend treatment
-            'real_estate': 0.1  # Potential tax advantages
-        }
-        
-        estimated_tax_efficiency = sum([
-            rate * allocation 
-            for rate, allocation in zip(
-                [self.tax_rates['long_term_capital_gains']] * len(optimized_allocation), 
-                optimized_allocation.values()
-            )
-        ])
-        
-        return {
-            'optimized_portfolio': optimized_allocation,
-            'estimated_tax_efficiency': estimated_tax_efficiency,
-            'tax_savings_potential': estimated_tax_efficiency * self.income * 0.05
-        }
+        result = _optimize_at_current_risk(self.optimizer, self.tax_rates, self.portfolio, start, end)
+        # Extra after-tax return per year on the invested share of income
+        result['tax_savings_potential'] = (
+            (result['after_tax_return'] - result['current_after_tax_return']) * self.income * INVESTED_INCOME_SHARE
+        )
+        return result
     
-    def generate_tax_strategy_report(self, investment_data: pd.DataFrame) -> Dict[str, Any]:
+    def generate_tax_strategy_report(self, investment_data: Union[pd.DataFrame, TickerReturns, TaxLots],
+                                     **harvest_options) -> Dict[str, Any]:
         """
         Generate comprehensive tax optimization report
         
-        :param investment_data: Investment performance data
+        :param investment_data: Investment performance data or TaxLots
+        :param harvest_options: Lot-level harvest options, see tax_loss_harvesting
         :return: Detailed tax optimization insights
         """
-        tax_loss_harvest = self.tax_loss_harvesting(investment_data)
+        tax_loss_harvest = self.tax_loss_harvesting(investment_data, **harvest_options)
         portfolio_optimization = self.optimize_portfolio_tax_efficiency()
         
+        recommendations = [
+            f"Consider harvesting losses from: {', '.join(tax_loss_harvest['harvest_candidates'])}",
+            f"Potential tax savings: ${tax_loss_harvest['total_potential_tax_savings']:.2f}",
+            "Recommended portfolio rebalancing for tax efficiency",
+            f"Estimated annual tax savings: ${portfolio_optimization['tax_savings_potential']:.2f}"
+        ]
+        if tax_loss_harvest.get('wash_sale_tickers'):
+            recommendations.append(
+                f"Wash sale rule disallows ${tax_loss_harvest['wash_sale_disallowed_loss']:.2f} of losses; "
+                f"avoid buying {', '.join(tax_loss_harvest['wash_sale_tickers'])} within {WASH_SALE_DAYS} days of selling"
+            )
+
         return {
             'tax_loss_harvesting': tax_loss_harvest,
             'portfolio_optimization': portfolio_optimization,
+            'recommendations': recommendations
+        }
+
+
+class BatchTaxOptimizationTool:
+    def __init__(self, incomes: np.ndarray, region: str = 'US', optimizer: Optional[PortfolioOptimizer] = None):
+        """
+        Vectorized tax optimization over many user profiles at once
+
+        :param incomes: Array of annual incomes, one per profile
+        :param region: Tax jurisdiction shared by all profiles (default: US)
+        :param optimizer: Portfolio optimizer (default: the process-wide one)
+        """
+        self.income = np.asarray(incomes, dtype=float)
+        self.region = region
+        self.optimizer = optimizer or get_portfolio_optimizer()
+        self.tax_rates = lookup_tax_rates(self.income, region)
+
+    def tax_loss_harvesting(self, returns: np.ndarray, tickers: List[str],
+                            portfolios: Optional[Sequence[Dict[str, float]]] = None,
+                            portfolio_codes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Identify tax loss harvesting opportunities for every profile
+
+        Dollar losses as in TaxOptimizationTool.tax_loss_harvesting, with each
+        profile's holdings valued from its own income and allocation.
+
+        :param returns: Array of shape (profiles, tickers) with investment returns
+        :param tickers: Ticker names matching the columns of returns
+        :param portfolios: Distinct current allocations (default: [DEFAULT_PORTFOLIO])
+        :param portfolio_codes: Index into portfolios per profile (default: all 0)
+        :return: Dict of per-profile arrays, harvest_candidates is a boolean mask
+        """
+        portfolios = list(portfolios or [DEFAULT_PORTFOLIO])
+        if portfolio_codes is None:
+            portfolio_codes = np.zeros(len(self.income), dtype=np.intp)
+        weights = allocation_weights(portfolios, tickers)[portfolio_codes]
+        gains = np.asarray(returns, dtype=float) * weights * (self.income * INVESTED_INCOME_SHARE)[:, None]
+        losses = gains < 0
+        total_loss = np.where(losses, gains, 0.0).sum(axis=1)
+        max_deductible_loss = np.minimum(np.abs(total_loss), MAX_DEDUCTIBLE_LOSS)
+
+        return {
+            'total_potential_tax_savings': max_deductible_loss * self.tax_rates['short_term_capital_gains'],
+            'harvest_candidates': losses,
+            'max_deductible_loss': max_deductible_loss,
+            'tickers': list(tickers)
+        }
+
+    def optimize_portfolio_tax_efficiency(self, portfolios: Optional[Sequence[Dict[str, float]]] = None,
+                                          portfolio_codes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Recommend tax-efficient portfolio rebalancing for every profile
+
+        Profiles sharing a tax bracket and a current portfolio share the
+        answer, so the optimizer runs once per distinct pair (a handful),
+        each from a cached frontier.
+
+        :param portfolios: Distinct current allocations (default: [DEFAULT_PORTFOLIO])
+        :param portfolio_codes: Index into portfolios per profile (default: all 0)
+        :return: Dictionary-encoded optimized allocation with per-profile arrays of
+            the figures TaxOptimizationTool.optimize_portfolio_tax_efficiency returns
+        """
+        portfolios = list(portfolios or [DEFAULT_PORTFOLIO])
+        if portfolio_codes is None:
+            portfolio_codes = np.zeros(len(self.income), dtype=np.intp)
+        rate_names = sorted(self.tax_rates)
+        keys = np.column_stack([self.tax_rates[name] for name in rate_names] + [portfolio_codes])
+        groups, group_codes = np.unique(keys, axis=0, return_inverse=True)
+        group_codes = group_codes.reshape(-1)
+
+        figures = ('estimated_tax_efficiency', 'expected_return', 'after_tax_return', 'volatility',
+                   'current_after_tax_return', 'current_volatility')
+        allocations = []
+        per_group = {name: np.empty(len(groups)) for name in figures}
+        windows = np.empty((len(groups), 2), dtype=object)
+        for g, key in enumerate(groups):
+            tax_rates = dict(zip(rate_names, key[:-1].tolist()))
+            result = _optimize_at_current_risk(self.optimizer, tax_rates, portfolios[int(key[-1])])
+            allocations.append(result['optimized_portfolio'])
+            for name in figures:
+                per_group[name][g] = result[name]
+            windows[g] = result['estimation_window']
+
+        report = {'optimized_portfolio': {'categories': allocations, 'codes': group_codes}}
+        report.update((name, values[group_codes]) for name, values in per_group.items())
+        report['estimation_window'] = windows[group_codes]
+        report['tax_savings_potential'] = (
+            (report['after_tax_return'] - report['current_after_tax_return']) * self.income * INVESTED_INCOME_SHARE
+        )
+        return report
+
+    def generate_tax_strategy_report(self, returns: np.ndarray, tickers: List[str],
+                                     portfolios: Optional[Sequence[Dict[str, float]]] = None,
+                                     portfolio_codes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Generate a columnar tax optimization report for every profile
+
+        :param returns: Array of shape (profiles, tickers) with investment returns
+        :param tickers: Ticker names matching the columns of returns
+        :param portfolios: Distinct current allocations, see optimize_portfolio_tax_efficiency
+        :param portfolio_codes: Index into portfolios per profile
+        :return: Report with one list entry per profile, JSON serializable
+        """
+        tax_loss_harvest = self.tax_loss_harvesting(returns, tickers, portfolios, portfolio_codes)
+        portfolio_optimization = self.optimize_portfolio_tax_efficiency(portfolios, portfolio_codes)
+
+        tickers = tax_loss_harvest['tickers']
+        harvest_candidates = [
+            [ticker for ticker, is_loss in zip(tickers, row) if is_loss]
+            for row in tax_loss_harvest['harvest_candidates'].tolist()
+        ]
+        tax_savings = tax_loss_harvest['total_potential_tax_savings'].tolist()
+        annual_savings = portfolio_optimization['tax_savings_potential'].tolist()
+        optimized_portfolio = portfolio_optimization.pop('optimized_portfolio')
+
+        return {
+            'tax_loss_harvesting': {
+                'total_potential_tax_savings': tax_savings,
+                'harvest_candidates': harvest_candidates,
+                'max_deductible_loss': tax_loss_harvest['max_deductible_loss'].tolist()
+            },
+            'portfolio_optimization': {
+                'optimized_portfolio': {
+                    'categories': optimized_portfolio['categories'],
+                    'codes': optimized_portfolio['codes'].tolist()
+                },
+                # The same figures as the single-profile report, one list entry per profile
+                **{name: values.tolist() for name, values in portfolio_optimization.items()}
+            },
             'recommendations': [
-                f"Consider harvesting losses from: {', '.join(tax_loss_harvest['harvest_candidates'])}",
-                f"Potential tax savings: ${tax_loss_harvest['total_potential_tax_savings']:.2f}",
-                f"Recommended portfolio rebalancing for tax efficiency",
-                f"Estimated annual tax savings: ${portfolio_optimization['tax_savings_potential']:.2f}"
+                [
+                    f"Consider harvesting losses from: {', '.join(candidates)}",
+                    f"Potential tax savings: ${savings:.2f}",
+                    "Recommended portfolio rebalancing for tax efficiency",
+                    f"Estimated annual tax savings: ${annual:.2f}"
+                ]
+                for candidates, savings, annual in zip(harvest_candidates, tax_savings, annual_savings)
             ]
-        }
\ No newline at end of file
+        }
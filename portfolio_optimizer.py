@@ -0,0 +1,342 @@
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from price_store import PriceStore, get_price_store
+from retirement_simulator import BOND_ANNUAL_RETURN, BOND_ANNUAL_VOLATILITY, BOND_TICKERS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+TRADING_DAYS = 252
+BOND_ASSET = "Bonds"
+DEFAULT_FRONTIER_POINTS = 100
+# Risk aversion grid of the frontier: from nearly return-only to nearly minimum variance
+DEFAULT_RISK_AVERSION_RANGE = (0.05, 500.0)
+DEFAULT_CACHE_SIZE = 32
+# Historical mean returns are noisy and the optimizer chases whichever stock
+# ran hardest: each stock's growth is pulled this far toward the average stock
+# growth, and no single stock may take more than DEFAULT_MAX_WEIGHT
+DEFAULT_MEAN_SHRINKAGE = 0.5
+DEFAULT_MAX_WEIGHT = 0.25
+
+
+class MarketEstimates:
+    def __init__(self, assets: List[str], growth: np.ndarray, income: np.ndarray,
+                 ordinary: np.ndarray, cov: np.ndarray, window: Tuple[str, str]):
+        """
+        Annualized return and covariance estimates for one date window
+
+        Total return (adjusted close) is split into price growth and the
+        distributions the adjusted close adds back (dividends), since the two
+        are taxed differently.
+
+        :param assets: Asset names, BOND_ASSET included
+        :param growth: Annual price growth per asset
+        :param income: Annual distribution yield per asset
+        :param ordinary: True for assets whose whole return is taxed as ordinary income (bonds)
+        :param cov: Annualized covariance of total returns
+        :param window: (first, last) date the estimates cover
+        """
+        self.assets = assets
+        self.growth = growth
+        self.income = income
+        self.ordinary = ordinary
+        self.cov = cov
+        self.window = window
+
+    @property
+    def expected_return(self) -> np.ndarray:
+        return self.growth + self.income
+
+    def after_tax(self, tax_rates: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        After-tax expected returns and covariance
+
+        Growth is taxed at the long-term rate (positions held over a year),
+        distributions at the dividend rate and bond returns as ordinary
+        income (the short-term rate). The covariance is scaled by the same
+        per-asset keep-fraction, since taxes scale gains and deductible
+        losses alike.
+
+        :param tax_rates: Rates with short_term_capital_gains, long_term_capital_gains and dividend
+        :return: (expected returns, covariance) after tax
+        """
+        keep_ordinary = 1.0 - tax_rates['short_term_capital_gains']
+        keep_growth = np.where(self.ordinary, keep_ordinary, 1.0 - tax_rates['long_term_capital_gains'])
+        keep_income = np.where(self.ordinary, keep_ordinary, 1.0 - tax_rates['dividend'])
+        mean = self.growth * keep_growth + self.income * keep_income
+        return mean, self.cov * np.outer(keep_growth, keep_growth)
+
+
+def project_to_simplex(points: np.ndarray) -> np.ndarray:
+    """Euclidean projection of each row onto {w >= 0, sum(w) = 1}."""
+    n = points.shape[1]
+    ordered = -np.sort(-points, axis=1)
+    excess = np.cumsum(ordered, axis=1) - 1.0
+    # Largest k with ordered[k] > excess[k] / (k + 1); the condition holds for a prefix
+    support = np.count_nonzero(ordered * np.arange(1, n + 1) > excess, axis=1)
+    threshold = excess[np.arange(len(points)), support - 1] / support
+    return np.maximum(points - threshold[:, None], 0.0)
+
+
+def project_to_capped_simplex(points: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Euclidean projection of each row onto {0 <= w <= upper, sum(w) = 1}
+
+    The projection is clip(p - tau, 0, upper) for the tau where the row sums
+    to one. That sum is piecewise linear in tau with breaks at p and
+    p - upper, so tau is interpolated between the two breakpoints around 1.
+
+    :param points: Rows to project
+    :param upper: Per-asset caps in (0, 1], summing to at least 1
+    """
+    breakpoints = np.sort(np.concatenate((points, points - upper), axis=1), axis=1)
+    # Row sum at each breakpoint, falling from sum(upper) >= 1 to 0
+    totals = np.clip(points[:, None, :] - breakpoints[:, :, None], 0.0, upper).sum(axis=2)
+    rows = np.arange(len(points))
+    i = np.count_nonzero(totals >= 1.0, axis=1) - 1
+    lo, hi = breakpoints[rows, i], breakpoints[rows, i + 1]
+    drop = totals[rows, i] - totals[rows, i + 1]
+    tau = lo + np.divide((totals[rows, i] - 1.0) * (hi - lo), drop, out=np.zeros_like(lo), where=drop > 0)
+    return np.clip(points - tau[:, None], 0.0, upper)
+
+
+def solve_mean_variance(mean: np.ndarray, cov: np.ndarray, risk_aversion: Sequence[float],
+                        max_weight: Optional[np.ndarray] = None,
+                        tol: float = 1e-10, max_iter: int = 5000) -> np.ndarray:
+    """
+    Long-only, fully invested mean-variance weights for many risk aversions at once
+
+    Maximizes mean @ w - risk_aversion / 2 * w @ cov @ w for every risk
+    aversion with accelerated projected gradient (FISTA). All problems
+    share the covariance, so each iteration is one (k, n) @ (n, n) product
+    and a row-wise simplex projection (a capped one with max_weight).
+
+    :param mean: Expected return per asset
+    :param cov: Covariance matrix
+    :param risk_aversion: Risk aversion per problem (positive)
+    :param max_weight: Cap per asset (default: none); the caps must sum to at least 1
+    :param tol: Stop when no weight moves more than this
+    :param max_iter: Iteration cap
+    :return: Weights of shape (len(risk_aversion), assets)
+    """
+    risk_aversion = np.asarray(risk_aversion, dtype=float)
+    if np.any(risk_aversion <= 0):
+        raise ValueError("Risk aversion must be positive")
+    n = len(mean)
+    if max_weight is None:
+        project = project_to_simplex
+    else:
+        upper = np.minimum(np.asarray(max_weight, dtype=float), 1.0)
+        if np.any(upper <= 0) or upper.sum() < 1.0:
+            raise ValueError("Weight caps must be positive and sum to at least 1")
+        project = partial(project_to_capped_simplex, upper=upper)
+    step = 1.0 / (risk_aversion * max(np.linalg.eigvalsh(cov)[-1], 1e-12))
+
+    weights = project(np.full((len(risk_aversion), n), 1.0 / n))
+    momentum = weights.copy()
+    t = 1.0
+    for _ in range(max_iter):
+        gradient = mean - risk_aversion[:, None] * (momentum @ cov)
+        updated = project(momentum + step[:, None] * gradient)
+        t_next = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        momentum = updated + ((t - 1.0) / t_next) * (updated - weights)
+        converged = np.max(np.abs(updated - weights)) < tol
+        weights, t = updated, t_next
+        if converged:
+            break
+    return weights
+
+
+class PortfolioOptimizer:
+    def __init__(self, store: Optional[PriceStore] = None, tickers: Optional[List[str]] = None,
+                 frontier_points: int = DEFAULT_FRONTIER_POINTS, cache_size: int = DEFAULT_CACHE_SIZE,
+                 mean_shrinkage: float = DEFAULT_MEAN_SHRINKAGE, max_weight: Optional[float] = DEFAULT_MAX_WEIGHT):
+        """
+        After-tax mean-variance optimizer over the stored price history
+
+        Estimates are cached per date window (and dropped when the price files
+        change). Frontiers are cached per window and tax rates; income brackets
+        give only a handful of distinct rate sets, so after warm-up a request
+        only picks a point from a cached frontier.
+
+        :param store: Price store (default: the process-wide one)
+        :param tickers: Tickers to invest in (default: every stored ticker)
+        :param frontier_points: Risk aversions solved per frontier
+        :param cache_size: Estimates and frontiers kept, least recently used dropped first
+        :param mean_shrinkage: Fraction of each stock's price growth replaced by
+            the average stock growth (0 keeps the sample means)
+        :param max_weight: Cap on any one stock's weight (None for no cap);
+            bonds are not capped, so every allocation stays feasible
+        """
+        if not 0.0 <= mean_shrinkage <= 1.0:
+            raise ValueError("mean_shrinkage must be between 0 and 1")
+        if max_weight is not None and max_weight <= 0:
+            raise ValueError("max_weight must be positive")
+        self.store = store or get_price_store()
+        self.tickers = tickers
+        self.frontier_points = frontier_points
+        self.cache_size = cache_size
+        self.mean_shrinkage = mean_shrinkage
+        self.max_weight = max_weight
+        self._estimates: "OrderedDict[tuple, MarketEstimates]" = OrderedDict()
+        self._frontiers: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, cache: OrderedDict, key, build):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = build()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def _window_key(self, start, end) -> tuple:
+        tickers = self.tickers or self.store.tickers()
+        versions = tuple((ticker, self.store.version(ticker)) for ticker in tickers)
+        return (str(start) if start else None, str(end) if end else None, versions)
+
+    def estimates(self, start=None, end=None) -> MarketEstimates:
+        """
+        Return and covariance estimates for an inclusive date window (cached)
+
+        :param start: First date (None for the beginning of the history)
+        :param end: Last date (None for the end)
+        """
+        key = self._window_key(start, end)
+        return self._cached(self._estimates, key, lambda: self._estimate([ticker for ticker, _ in key[2]],
+                                                                         start, end))
+
+    def _estimate(self, tickers: List[str], start, end) -> MarketEstimates:
+        series = {ticker: self.store.load_range(ticker, start, end) for ticker in tickers}
+        # Align on the dates every ticker traded
+        common = None
+        for s in series.values():
+            common = s.dates if common is None else np.intersect1d(common, s.dates, assume_unique=True)
+        if common is None or len(common) < 3:
+            raise ValueError(f"Not enough common price history between {start} and {end}")
+
+        total, price = [], []
+        for s in series.values():
+            rows = np.searchsorted(s.dates, common)
+            adj_close, close = np.asarray(s["adj_close"])[rows], np.asarray(s["close"])[rows]
+            total.append(adj_close[1:] / adj_close[:-1] - 1.0)
+            price.append(close[1:] / close[:-1] - 1.0)
+        total, price = np.array(total), np.array(price)
+
+        growth = price.mean(axis=1) * TRADING_DAYS
+        income = np.maximum(total.mean(axis=1) * TRADING_DAYS - growth, 0.0)
+        cov = np.cov(total) * TRADING_DAYS
+        ordinary = np.isin(tickers, BOND_TICKERS)
+        stocks = ~ordinary
+        if stocks.any():
+            growth[stocks] += self.mean_shrinkage * (growth[stocks].mean() - growth[stocks])
+        assets = list(tickers)
+        if not ordinary.any():
+            # No bond price history: add the parametric bond sleeve, uncorrelated with stocks
+            assets.append(BOND_ASSET)
+            growth = np.append(growth, 0.0)
+            income = np.append(income, BOND_ANNUAL_RETURN)
+            ordinary = np.append(ordinary, True)
+            cov = np.pad(np.atleast_2d(cov), ((0, 1), (0, 1)))
+            cov[-1, -1] = BOND_ANNUAL_VOLATILITY ** 2
+        return MarketEstimates(assets, growth, income, ordinary, cov, (str(common[0]), str(common[-1])))
+
+    def solve(self, tax_rates: Dict[str, float], risk_aversion: Sequence[float],
+              start=None, end=None) -> Dict:
+        """
+        After-tax optimal portfolios for many risk aversions in one batched solve
+
+        :param tax_rates: Tax rates of the investor
+        :param risk_aversion: Risk aversions to solve for
+        :param start: First date of the estimation window
+        :param end: Last date of the estimation window
+        :return: Dict with assets, risk_aversion, weights (k x assets) and, per
+            portfolio, pre_tax_return, after_tax_return and volatility
+        """
+        market = self.estimates(start, end)
+        mean, cov = market.after_tax(tax_rates)
+        risk_aversion = np.asarray(risk_aversion, dtype=float)
+        # Only stocks are capped; there is always a bond asset to hold the rest
+        max_weight = None if self.max_weight is None else np.where(market.ordinary, 1.0, self.max_weight)
+        weights = solve_mean_variance(mean, cov, risk_aversion, max_weight)
+        return {
+            "assets": market.assets,
+            "risk_aversion": risk_aversion,
+            "weights": weights,
+            "pre_tax_return": weights @ market.expected_return,
+            "after_tax_return": weights @ mean,
+            "volatility": np.sqrt(np.einsum("ki,ij,kj->k", weights, market.cov, weights)),
+            "window": market.window
+        }
+
+    def frontier(self, tax_rates: Dict[str, float], start=None, end=None) -> Dict:
+        """
+        After-tax efficient frontier, ordered from lowest to highest volatility (cached)
+
+        :param tax_rates: Tax rates of the investor
+        :param start: First date of the estimation window
+        :param end: Last date of the estimation window
+        """
+        rates = tuple(sorted((name, float(rate)) for name, rate in tax_rates.items()))
+        key = (self._window_key(start, end), rates)
+        low, high = DEFAULT_RISK_AVERSION_RANGE
+        risk_aversion = np.geomspace(high, low, self.frontier_points)
+        return self._cached(self._frontiers, key, lambda: self.solve(tax_rates, risk_aversion, start, end))
+
+    def weights_of(self, portfolio: Dict[str, float], start=None, end=None) -> np.ndarray:
+        """
+        Asset weights of an allocation like {"Bonds": 80, "Stocks": 20}
+
+        "Stocks" is spread evenly over the stock tickers; keys naming an asset
+        go to that asset.
+        """
+        market = self.estimates(start, end)
+        weights = np.zeros(len(market.assets))
+        stocks = [i for i, asset in enumerate(market.assets) if not market.ordinary[i]]
+        bonds = [i for i, asset in enumerate(market.assets) if market.ordinary[i]]
+        for name, value in portfolio.items():
+            if name in market.assets:
+                weights[market.assets.index(name)] += value
+            elif name.lower() == "stocks" and stocks:
+                weights[stocks] += value / len(stocks)
+            elif name.lower() == "bonds" and bonds:
+                weights[bonds] += value / len(bonds)
+            else:
+                raise ValueError(f"Cannot map allocation '{name}' to {market.assets}")
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("Allocation must have a positive total")
+        return weights / total
+
+    def at_volatility(self, tax_rates: Dict[str, float], volatility: np.ndarray, start=None, end=None) -> np.ndarray:
+        """
+        Frontier point index for each target volatility
+
+        Picks the highest after-tax return whose volatility does not exceed
+        the target (the minimum-variance point when none qualifies).
+        """
+        frontier = self.frontier(tax_rates, start, end)
+        # Volatility rises along the frontier (risk aversion falls)
+        index = np.searchsorted(frontier["volatility"], np.asarray(volatility) + 1e-12, side="right") - 1
+        return np.clip(index, 0, len(frontier["volatility"]) - 1)
+
+
+_default_optimizer: Optional[PortfolioOptimizer] = None
+
+
+def get_portfolio_optimizer() -> PortfolioOptimizer:
+    """Process-wide PortfolioOptimizer over the default price store."""
+    global _default_optimizer
+    if _default_optimizer is None:
+        _default_optimizer = PortfolioOptimizer()
+    return _default_optimizer
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CSV_SUFFIX = "_stock_data.csv"
+CACHE_DIR_NAME = ".price_cache"
+CACHE_FORMAT_VERSION = 1
+
+# Source CSV column -> (cache column, dtype)
+PRICE_COLUMNS = {
+    "Adj Close": ("adj_close", np.float64),
+    "Close": ("close", np.float64),
+    "High": ("high", np.float64),
+    "Low": ("low", np.float64),
+    "Open": ("open", np.float64),
+    "Volume": ("volume", np.int64),
+}
+
+
+def default_data_dir() -> str:
+    """Directory holding the *_stock_data.csv files (PRICE_DATA_DIR overrides)."""
+    if os.getenv("PRICE_DATA_DIR"):
+        return os.environ["PRICE_DATA_DIR"]
+    base = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(base, "data")
+    return data_dir if os.path.isdir(data_dir) else base
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _to_date(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+def read_price_csv(csv_path: str) -> pd.DataFrame:
+    """
+    Parse a yfinance price CSV, tolerating its extra ticker header rows
+
+    :param csv_path: Path to a *_stock_data.csv file
+    :return: DataFrame sorted by Date with numeric price columns
+    """
+    data = pd.read_csv(csv_path, header=0, dtype=str)
+    date_column = data.columns[0]
+    dates = pd.to_datetime(data[date_column], errors="coerce")
+    # Rows that are not dates are the ticker/"Date" header rows yfinance adds
+    data = data[dates.notna()].copy()
+    data["Date"] = dates[dates.notna()].dt.normalize()
+    for column, (_, dtype) in PRICE_COLUMNS.items():
+        if column in data.columns:
+            try:
+                # astype(float) round-trips the stored digits exactly
+                data[column] = data[column].astype(float)
+            except ValueError:
+                data[column] = pd.to_numeric(data[column], errors="coerce")
+            if dtype is np.int64 and data[column].notna().all():
+                data[column] = data[column].astype(np.int64)
+    return data.sort_values("Date").drop_duplicates("Date", keep="last").reset_index(drop=True)
+
+
+class PriceSeries:
+    def __init__(self, ticker: str, dates: np.ndarray, columns: Dict[str, np.ndarray]):
+        """
+        Date-indexed price columns for one ticker, usually memory-mapped
+
+        :param ticker: Ticker symbol
+        :param dates: Sorted datetime64[D] array
+        :param columns: Column name -> array aligned with dates
+        """
+        self.ticker = ticker
+        self.dates = dates
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def index_range(self, start=None, end=None) -> Tuple[int, int]:
+        """
+        Binary-search the row range for an inclusive date window
+
+        :param start: First date to include (None for the beginning)
+        :param end: Last date to include (None for the end)
+        :return: (first_row, stop_row) suitable for slicing
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.dates, _to_date(start), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, _to_date(end), side="right"))
+        return lo, max(lo, hi)
+
+    def slice(self, start=None, end=None) -> "PriceSeries":
+        """
+        Return a view over a date window; only the touched pages are read
+
+        :param start: First date to include (None for the beginning)
+        :param end: Last date to include (None for the end)
+        :return: PriceSeries sharing memory with this one
+        """
+        lo, hi = self.index_range(start, end)
+        return PriceSeries(
+            self.ticker,
+            self.dates[lo:hi],
+            {name: values[lo:hi] for name, values in self.columns.items()}
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize the series as a DataFrame indexed by date."""
+        frame = pd.DataFrame({name: np.asarray(values) for name, values in self.columns.items()})
+        frame.index = pd.DatetimeIndex(np.asarray(self.dates), name="Date")
+        return frame
+
+
+class PriceStore:
+    def __init__(self, data_dir: Optional[str] = None, cache_dir: Optional[str] = None):
+        """
+        Binary columnar cache over the *_stock_data.csv price files
+
+        Each CSV is converted once into one .npy file per column under
+        cache_dir/<TICKER>/ and later opened memory-mapped. The cache is
+        rebuilt when the source file's size/mtime and content hash change.
+
+        :param data_dir: Directory holding the CSV files
+        :param cache_dir: Directory for the binary cache (default: data_dir/.price_cache)
+        """
+        self.data_dir = data_dir or default_data_dir()
+        self.cache_dir = cache_dir or os.path.join(self.data_dir, CACHE_DIR_NAME)
+        self._open: Dict[str, Tuple[Tuple[int, int], PriceSeries]] = {}
+        self._lock = threading.Lock()
+
+    def csv_path(self, ticker: str) -> str:
+        return os.path.join(self.data_dir, f"{ticker}{CSV_SUFFIX}")
+
+    def _ticker_cache_dir(self, ticker: str) -> str:
+        return os.path.join(self.cache_dir, ticker)
+
+    def tickers(self) -> List[str]:
+        """List tickers that have a source CSV in data_dir."""
+        if not os.path.isdir(self.data_dir):
+            return []
+        return sorted(
+            name[:-len(CSV_SUFFIX)] for name in os.listdir(self.data_dir) if name.endswith(CSV_SUFFIX)
+        )
+
+    def version(self, ticker: str) -> Tuple[int, int]:
+        """Cheap change token for a ticker's source file: (mtime_ns, size)."""
+        stat = os.stat(self.csv_path(ticker))
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_meta(self, ticker: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._ticker_cache_dir(ticker), "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("format_version") == CACHE_FORMAT_VERSION else None
+
+    def _write_meta(self, target_dir: str, meta: dict) -> None:
+        tmp_path = os.path.join(target_dir, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(target_dir, "meta.json"))
+
+    def _build(self, ticker: str, version: Tuple[int, int], sha256: str) -> None:
+        """Convert a CSV into the columnar layout, swapping it in atomically."""
+        data = read_price_csv(self.csv_path(ticker))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{ticker}-", dir=self.cache_dir)
+        try:
+            np.save(os.path.join(tmp_dir, "date.npy"), data["Date"].values.astype("datetime64[D]"))
+            columns = []
+            for source, (name, dtype) in PRICE_COLUMNS.items():
+                if source not in data.columns:
+                    continue
+                values = data[source]
+                if dtype is np.int64:
+                    values = values.fillna(0).round()
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), values.to_numpy(dtype=dtype))
+                columns.append(name)
+            self._write_meta(tmp_dir, {
+                "format_version": CACHE_FORMAT_VERSION,
+                "ticker": ticker,
+                "source_mtime_ns": version[0],
+                "source_size": version[1],
+                "source_sha256": sha256,
+                "rows": len(data),
+                "columns": columns,
+                "first_date": str(data["Date"].iloc[0].date()) if len(data) else None,
+                "last_date": str(data["Date"].iloc[-1].date()) if len(data) else None,
+            })
+            target_dir = self._ticker_cache_dir(ticker)
+            old_dir = None
+            if os.path.exists(target_dir):
+                old_dir = tempfile.mkdtemp(prefix=f".{ticker}-old-", dir=self.cache_dir)
+                os.rmdir(old_dir)
+                os.replace(target_dir, old_dir)
+            os.replace(tmp_dir, target_dir)
+            if old_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        logging.info(f"Built price cache for {ticker} ({len(data)} rows)")
+
+    def ensure_cache(self, ticker: str) -> Tuple[int, int]:
+        """
+        Make sure the binary cache for a ticker is current
+
+        :param ticker: Ticker symbol
+        :return: Source version the cache was validated against
+        """
+        version = self.version(ticker)
+        meta = self._read_meta(ticker)
+        if meta and (meta["source_mtime_ns"], meta["source_size"]) == version:
+            return version
+
+        sha256 = _file_sha256(self.csv_path(ticker))
+        if meta and meta["source_sha256"] == sha256:
+            # Touched but unchanged: refresh the stamp without rebuilding
+            meta["source_mtime_ns"], meta["source_size"] = version
+            self._write_meta(self._ticker_cache_dir(ticker), meta)
+        else:
+            self._build(ticker, version, sha256)
+        return version
+
+    def load(self, ticker: str) -> PriceSeries:
+        """
+        Open a ticker's price columns memory-mapped (zero-copy)
+
+        :param ticker: Ticker symbol
+        :return: PriceSeries backed by read-only memmaps
+        """
+        with self._lock:
+            version = self.version(ticker)
+            cached = self._open.get(ticker)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            version = self.ensure_cache(ticker)
+            meta = self._read_meta(ticker)
+            cache_dir = self._ticker_cache_dir(ticker)
+            series = PriceSeries(
+                ticker,
+                np.load(os.path.join(cache_dir, "date.npy"), mmap_mode="r"),
+                {
+                    name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+                    for name in meta["columns"]
+                }
+            )
+            self._open[ticker] = (version, series)
+            return series
+
+    def load_range(self, ticker: str, start=None, end=None) -> PriceSeries:
+        """
+        Load only the rows inside an inclusive date window
+
+        :param ticker: Ticker symbol
+        :param start: First date to include (None for the beginning)
+        :param end: Last date to include (None for the end)
+        :return: PriceSeries view over the window
+        """
+        return self.load(ticker).slice(start, end)
+
+    def load_many(self, tickers: Optional[List[str]] = None) -> Dict[str, PriceSeries]:
+        """Load several tickers (default: every ticker in data_dir)."""
+        result = {}
+        for ticker in tickers or self.tickers():
+            try:
+                result[ticker] = self.load(ticker)
+            except Exception as e:
+                logging.error(f"Failed to load prices for {ticker}: {e}")
+        return result
+
+    def invalidate(self, ticker: Optional[str] = None) -> None:
+        """Drop open memmaps so the next load revalidates against the source."""
+        with self._lock:
+            if ticker is None:
+                self._open.clear()
+            else:
+                self._open.pop(ticker, None)
+
+
+_default_store: Optional[PriceStore] = None
+
+
+def get_price_store() -> PriceStore:
+    """Process-wide PriceStore over the default data directory."""
+    global _default_store
+    if _default_store is None:
+        _default_store = PriceStore()
+    return _default_store
+
+
+def load_prices(ticker: str, start=None, end=None,
+                store: Optional[PriceStore] = None) -> PriceSeries:
+    """Convenience wrapper around PriceStore.load_range on the default store."""
+    return (store or get_price_store()).load_range(ticker, start, end)
+
+
+if __name__ == "__main__":
+    store = get_price_store()
+    for ticker in store.tickers():
+        series = store.load(ticker)
+        logging.info(f"{ticker}: {len(series)} rows, {series.dates[0]} to {series.dates[-1]}")
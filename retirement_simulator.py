@@ -0,0 +1,322 @@
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from price_store import PriceStore, get_price_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_PATHS = 20000
+DEFAULT_CHUNK_PATHS = 500
+DEFAULT_MAX_YEARS = 50
+DEFAULT_SEED = 42
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Bond ETFs used for the Bonds sleeve when their price files exist
+BOND_TICKERS = ("BND", "AGG")
+# Otherwise bond returns are drawn from a normal distribution with these annual figures
+BOND_ANNUAL_RETURN = 0.035
+BOND_ANNUAL_VOLATILITY = 0.05
+
+
+class MonthlyReturns:
+    def __init__(self, stocks: np.ndarray, bonds: Optional[np.ndarray], source: str):
+        """
+        Historical monthly returns the simulator resamples
+
+        :param stocks: Equal-weight stock basket return per month
+        :param bonds: Bond return for the same months, or None to use the parametric model
+        :param source: Description of where the returns came from
+        """
+        self.stocks = stocks
+        self.bonds = bonds
+        self.source = source
+
+    @classmethod
+    def from_store(cls, store: PriceStore) -> "MonthlyReturns":
+        """Month-end adjusted closes of every stored ticker, aligned on common months."""
+        monthly = {}
+        for ticker, series in store.load_many().items():
+            frame = series.to_frame()["adj_close"]
+            month_end = frame.groupby(frame.index.to_period("M")).last()
+            monthly[ticker] = month_end.pct_change().dropna()
+        bond_tickers = [ticker for ticker in BOND_TICKERS if ticker in monthly]
+        stock_tickers = [ticker for ticker in monthly if ticker not in bond_tickers]
+        if not stock_tickers:
+            raise ValueError(f"No stock price files found in {store.data_dir}")
+
+        table = pd.concat({ticker: monthly[ticker] for ticker in stock_tickers + bond_tickers}, axis=1).dropna()
+        stocks = table[stock_tickers].mean(axis=1).to_numpy()
+        bonds = table[bond_tickers].mean(axis=1).to_numpy() if bond_tickers else None
+        source = (f"{len(table)} months of {', '.join(stock_tickers)}"
+                  + (f" and {', '.join(bond_tickers)}" if bond_tickers else ""))
+        return cls(stocks, bonds, source)
+
+
+def simulate_chunk(returns: MonthlyReturns, stock_weight: float, max_years: int,
+                   paths: int, seed: int, chunk: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Growth factors for one chunk of paths
+
+    Each month contributes before it grows, so a path's balance after y years
+    is current_savings * A[y] + monthly_savings * B[y], with
+    A = product of (1 + r) and B = sum over deposits of their growth since.
+
+    :param returns: Historical monthly returns to bootstrap
+    :param stock_weight: Fraction in stocks, the rest in bonds
+    :param max_years: Longest horizon recorded
+    :param paths: Paths in this chunk
+    :param seed: Simulation seed
+    :param chunk: Chunk index; with seed it fixes the random stream
+    :return: (A, B), each of shape (max_years + 1, paths)
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+    months = max_years * 12
+    bond_weight = 1.0 - stock_weight
+    picks = rng.integers(0, len(returns.stocks), size=(paths, months), dtype=np.int32)
+    growth = returns.stocks[picks]
+    growth *= stock_weight
+    if bond_weight and returns.bonds is not None:
+        growth += bond_weight * returns.bonds[picks]
+    elif bond_weight:
+        # float32 draws halve the cost; the noise needs no more precision
+        noise = rng.standard_normal((paths, months), dtype=np.float32)
+        noise *= bond_weight * BOND_ANNUAL_VOLATILITY / np.sqrt(12)
+        growth += noise
+        growth += bond_weight * BOND_ANNUAL_RETURN / 12
+    growth += 1.0
+
+    # Cumulative growth P[t] after month t; B[t] = P[t] * sum_{k<=t} 1 / P[k-1]
+    cumulative = np.cumprod(growth, axis=1, out=growth)
+    inverse = np.empty_like(cumulative)
+    inverse[:, 0] = 1.0
+    np.divide(1.0, cumulative[:, :-1], out=inverse[:, 1:])
+    np.cumsum(inverse, axis=1, out=inverse)
+
+    year_ends = np.arange(12, months + 1, 12) - 1
+    A = np.ones((max_years + 1, paths))
+    B = np.zeros((max_years + 1, paths))
+    A[1:] = cumulative[:, year_ends].T
+    B[1:] = A[1:] * inverse[:, year_ends].T
+    return A, B
+
+
+class _MixPaths:
+    """Growth factors for one allocation mix, filled chunk by chunk."""
+
+    def __init__(self, max_years: int, n_paths: int):
+        self.A = np.empty((max_years + 1, n_paths))
+        self.B = np.empty((max_years + 1, n_paths))
+        self.chunks_done = 0
+        self.paths_done = 0
+        self.lock = threading.Lock()
+
+
+class RetirementSimulator:
+    def __init__(self, store: Optional[PriceStore] = None, n_paths: int = DEFAULT_PATHS,
+                 chunk_paths: int = DEFAULT_CHUNK_PATHS, max_years: int = DEFAULT_MAX_YEARS,
+                 seed: int = DEFAULT_SEED, workers: Optional[int] = None):
+        """
+        Monte Carlo retirement projections from bootstrapped market history
+
+        For each allocation mix the simulator draws n_paths sequences of
+        monthly returns (sampling whole historical months, so stocks and
+        bonds keep their joint behaviour) and stores the per-path growth
+        factors for every year up to max_years. Any savings, contribution and
+        horizon is then a linear combination of those factors, so projections
+        for a known mix only cost a weighted sum and a percentile.
+
+        Paths are produced in chunks of chunk_paths; chunk i always uses the
+        random stream (seed, i), so results do not depend on the worker
+        count or on how many calls it took to fill the paths. Everything is
+        recomputed when the price files change.
+
+        :param store: Price store with the return history (default: the process-wide one)
+        :param n_paths: Paths per allocation mix
+        :param chunk_paths: Paths simulated per chunk, which bounds working memory
+        :param max_years: Longest horizon; longer ones are capped
+        :param seed: Simulation seed
+        :param workers: Simulate chunks in this many processes (None: in-process)
+        """
+        self.store = store or get_price_store()
+        self.n_paths = n_paths
+        self.chunk_paths = chunk_paths
+        self.max_years = max_years
+        self.seed = seed
+        self.workers = workers
+        self._versions = None
+        self._returns: Optional[MonthlyReturns] = None
+        self._mixes: Dict[float, _MixPaths] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def n_chunks(self) -> int:
+        return -(-self.n_paths // self.chunk_paths)
+
+    def returns(self) -> MonthlyReturns:
+        """Current return history, reloaded (and all paths dropped) when prices change."""
+        versions = tuple((ticker, self.store.version(ticker)) for ticker in self.store.tickers())
+        with self._lock:
+            if versions != self._versions:
+                self._returns = MonthlyReturns.from_store(self.store)
+                self._mixes = {}
+                self._versions = versions
+            return self._returns
+
+    def _mix(self, stock_weight: float) -> _MixPaths:
+        self.returns()
+        with self._lock:
+            mix = self._mixes.get(stock_weight)
+            if mix is None:
+                mix = self._mixes[stock_weight] = _MixPaths(self.max_years, self.n_paths)
+            return mix
+
+    def _chunk_sizes(self, first: int, last: int):
+        for chunk in range(first, last):
+            start = chunk * self.chunk_paths
+            yield chunk, start, min(self.chunk_paths, self.n_paths - start)
+
+    def simulate(self, stock_weight: float, time_budget_ms: Optional[float] = None) -> _MixPaths:
+        """
+        Fill the paths for a mix, stopping early once time_budget_ms is spent
+
+        At least one chunk is always simulated. Finished chunks are kept, so
+        a later call carries on where this one stopped.
+
+        :param stock_weight: Fraction in stocks
+        :param time_budget_ms: Wall-clock budget for this call (None: finish all chunks)
+        :return: Paths for the mix; paths_done tells how many are filled
+        """
+        mix = self._mix(stock_weight)
+        if mix.chunks_done == self.n_chunks:
+            return mix
+        deadline = None if time_budget_ms is None else time.perf_counter() + time_budget_ms / 1000.0
+        returns = self.returns()
+
+        if self.workers and self.workers > 1 and deadline is None:
+            with mix.lock, ProcessPoolExecutor(max_workers=self.workers) as pool:
+                chunks = list(self._chunk_sizes(mix.chunks_done, self.n_chunks))
+                results = pool.map(
+                    simulate_chunk, [returns] * len(chunks), [stock_weight] * len(chunks),
+                    [self.max_years] * len(chunks), [size for _, _, size in chunks],
+                    [self.seed] * len(chunks), [chunk for chunk, _, _ in chunks]
+                )
+                for (chunk, start, size), (A, B) in zip(chunks, results):
+                    mix.A[:, start:start + size], mix.B[:, start:start + size] = A, B
+                    mix.chunks_done, mix.paths_done = chunk + 1, start + size
+            return mix
+
+        while mix.chunks_done < self.n_chunks:
+            with mix.lock:
+                if mix.chunks_done == self.n_chunks:
+                    break
+                chunk, start, size = next(self._chunk_sizes(mix.chunks_done, mix.chunks_done + 1))
+                A, B = simulate_chunk(returns, stock_weight, self.max_years, size, self.seed, chunk)
+                mix.A[:, start:start + size], mix.B[:, start:start + size] = A, B
+                mix.chunks_done, mix.paths_done = chunk + 1, start + size
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return mix
+
+    def warm_up(self, stock_weights: Sequence[float]) -> None:
+        """Simulate every path for the given mixes (e.g. from a background thread)."""
+        for stock_weight in stock_weights:
+            self.simulate(stock_weight)
+
+    def _horizon(self, years) -> np.ndarray:
+        # Whole years, rounded to the nearest (halves up)
+        return np.clip(np.floor(np.asarray(years, dtype=float) + 0.5), 0, self.max_years).astype(np.intp)
+
+    def project(self, current_savings: float, monthly_savings: float, years: float, stock_weight: float,
+                percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                time_budget_ms: Optional[float] = None) -> dict:
+        """
+        Percentile bands of the balance for every year up to retirement
+
+        :param current_savings: Balance today
+        :param monthly_savings: Contribution at the start of every month
+        :param years: Years to retirement, rounded to whole years (capped at max_years)
+        :param stock_weight: Fraction in stocks
+        :param percentiles: Percentiles to report
+        :param time_budget_ms: Simulation budget if the mix is not fully simulated yet
+        :return: Dict with years, bands (percentile -> balance per year), final
+            (percentile -> balance at retirement), mean and paths
+        """
+        mix = self.simulate(stock_weight, time_budget_ms)
+        paths = mix.paths_done
+        horizon = int(self._horizon(years))
+        balances = current_savings * mix.A[:horizon + 1, :paths] + monthly_savings * mix.B[:horizon + 1, :paths]
+        bands = np.percentile(balances, percentiles, axis=1)
+        return {
+            "years": list(range(horizon + 1)),
+            "bands": {f"p{p:g}": band.tolist() for p, band in zip(percentiles, bands)},
+            "final": {f"p{p:g}": float(band[-1]) for p, band in zip(percentiles, bands)},
+            "mean": float(balances[-1].mean()),
+            "paths": paths,
+            "horizon_capped": bool(years > self.max_years)
+        }
+
+    def project_final_many(self, current_savings: np.ndarray, monthly_savings: np.ndarray, years: np.ndarray,
+                           stock_weights: np.ndarray, percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                           time_budget_ms: Optional[float] = None, chunk_rows: int = 256) -> np.ndarray:
+        """
+        Percentiles of the balance at retirement for many profiles
+
+        :param current_savings: Balance today per profile
+        :param monthly_savings: Monthly contribution per profile
+        :param years: Years to retirement per profile, rounded to whole years
+        :param stock_weights: Fraction in stocks per profile
+        :param percentiles: Percentiles to report
+        :param time_budget_ms: Simulation budget per mix not fully simulated yet
+        :param chunk_rows: Profiles evaluated together, bounding the (rows x paths) work array
+        :return: Array of shape (profiles, len(percentiles))
+        """
+        current_savings = np.asarray(current_savings, dtype=float)
+        monthly_savings = np.asarray(monthly_savings, dtype=float)
+        horizons = self._horizon(years)
+        stock_weights = np.asarray(stock_weights, dtype=float)
+        out = np.empty((len(horizons), len(percentiles)))
+        for stock_weight in np.unique(stock_weights):
+            mix = self.simulate(float(stock_weight), time_budget_ms)
+            paths = mix.paths_done
+            rows = np.flatnonzero(stock_weights == stock_weight)
+            for start in range(0, len(rows), chunk_rows):
+                part = rows[start:start + chunk_rows]
+                balances = (current_savings[part, None] * mix.A[horizons[part], :paths]
+                            + monthly_savings[part, None] * mix.B[horizons[part], :paths])
+                out[part] = np.percentile(balances, percentiles, axis=1).T
+        return out
+
+
+def stock_weight_of(allocation: Dict[str, float]) -> float:
+    """Fraction in stocks for an allocation like {"Bonds": 80, "Stocks": 20}."""
+    total = sum(allocation.values())
+    return allocation.get("Stocks", 0) / total if total else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo retirement projection")
+    parser.add_argument("--current-savings", type=float, default=10000)
+    parser.add_argument("--monthly-savings", type=float, default=500)
+    parser.add_argument("--years", type=float, default=20)
+    parser.add_argument("--stocks", type=float, default=0.5, help="Fraction in stocks")
+    parser.add_argument("--paths", type=int, default=DEFAULT_PATHS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    simulator = RetirementSimulator(n_paths=args.paths, workers=args.workers, seed=args.seed)
+    start = time.perf_counter()
+    simulator.simulate(args.stocks)
+    logging.info(f"Simulated {args.paths} paths in {time.perf_counter() - start:.2f}s "
+                 f"from {simulator.returns().source}")
+    projection = simulator.project(args.current_savings, args.monthly_savings, args.years, args.stocks)
+    for name, value in projection["final"].items():
+        logging.info(f"{name}: ${value:,.0f}")
@@ -0,0 +1,109 @@
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from portfolio_optimizer import BOND_ASSET
+from price_store import PriceStore, get_price_store
+from retirement_simulator import BOND_ANNUAL_RETURN, BOND_TICKERS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Trailing window of the returns, in trading days (one year)
+DEFAULT_LOOKBACK_DAYS = 252
+STOCK_ASSET = "Stocks"
+
+
+class TickerReturns(NamedTuple):
+    tickers: List[str]
+    returns: np.ndarray
+
+
+class _Table(NamedTuple):
+    key: tuple
+    names: List[str]
+    index: Dict[str, int]
+    returns: np.ndarray
+
+
+class ReturnTable:
+    def __init__(self, store: Optional[PriceStore] = None, lookback_days: int = DEFAULT_LOOKBACK_DAYS):
+        """
+        Trailing total return per ticker and per asset class
+
+        Built once from the stored adjusted closes and rebuilt when a price
+        file changes, so a request only indexes a small float array. Asset
+        classes are "Stocks" (equal weight over the stock tickers) and
+        "Bonds" (the bond tickers, or BOND_ANNUAL_RETURN scaled to the
+        window when there is no bond price history).
+
+        :param store: Price store (default: the process-wide one)
+        :param lookback_days: Trading days the returns cover (shorter histories use all they have)
+        """
+        self.store = store or get_price_store()
+        self.lookback_days = lookback_days
+        self._table: Optional[_Table] = None
+        self._lock = threading.Lock()
+
+    def _key(self) -> tuple:
+        return tuple((ticker, self.store.version(ticker)) for ticker in self.store.tickers())
+
+    def table(self) -> _Table:
+        key = self._key()
+        table = self._table
+        if table is None or table.key != key:
+            with self._lock:
+                if self._table is None or self._table.key != key:
+                    self._table = self._build(key)
+                table = self._table
+        return table
+
+    def _build(self, key: tuple) -> _Table:
+        tickers = [ticker for ticker, _ in key]
+        returns = np.empty(len(tickers))
+        for i, ticker in enumerate(tickers):
+            series = self.store.load(ticker)
+            adj_close = np.asarray(series["adj_close"])
+            if len(adj_close) < 2:
+                raise ValueError(f"Not enough price history for {ticker}")
+            start = adj_close[max(len(adj_close) - 1 - self.lookback_days, 0)]
+            returns[i] = adj_close[-1] / start - 1.0
+
+        bonds = np.isin(tickers, BOND_TICKERS)
+        stock_return = returns[~bonds].mean() if (~bonds).any() else 0.0
+        if bonds.any():
+            bond_return = returns[bonds].mean()
+        else:
+            bond_return = (1.0 + BOND_ANNUAL_RETURN) ** (self.lookback_days / DEFAULT_LOOKBACK_DAYS) - 1.0
+
+        names = tickers + [STOCK_ASSET, BOND_ASSET]
+        returns = np.append(returns, [stock_return, bond_return])
+        returns.flags.writeable = False
+        return _Table(key, names, {name: i for i, name in enumerate(names)}, returns)
+
+    def returns_for(self, names: Sequence[str]) -> TickerReturns:
+        """
+        Trailing returns of tickers or asset classes, in the given order
+
+        :raises KeyError: For a name the table does not hold
+        """
+        names = list(names)
+        table = self.table()
+        try:
+            rows = np.array([table.index[name] for name in names], dtype=np.intp)
+        except KeyError as e:
+            raise KeyError(f"No return data for {e.args[0]!r}") from None
+        return TickerReturns(names, table.returns[rows])
+
+
+_default_table: Optional[ReturnTable] = None
+
+
+def get_return_table() -> ReturnTable:
+    """Process-wide ReturnTable over the default price store."""
+    global _default_table
+    if _default_table is None:
+        _default_table = ReturnTable()
+    return _default_table
@@ -0,0 +1,150 @@
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from lazy_import import LazyModule
+from metrics import REGISTRY
+
+# Only the async variant needs asyncio; keep it off the Flask worker's startup path
+asyncio = LazyModule("asyncio")
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+COALESCED_REQUESTS = REGISTRY.counter(
+    "single_flight_requests_total",
+    "Requests by coalescing group; role=\"follower\" counts upstream calls saved",
+    ["group", "role"])
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = True):
+        """
+        Coalesce concurrent calls with the same key into one
+
+        The first caller of a key (the leader) runs the function; callers
+        arriving while it is in flight (followers) block and get the same
+        result, or the same exception. Nothing is remembered once the call
+        returns, so a failure is never served to later callers.
+
+        :param name: Group label for the metrics
+        :param enabled: When False every caller runs the function itself
+        """
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """
+        Return fn(*args), sharing the call with concurrent callers of the same key
+
+        :param key: Identity of the computation (callers must normalize it)
+        :param fn: Function to run if no call for key is in flight
+        :return: The result of fn
+        :raises Exception: Whatever fn raised, in the leader and every follower
+        """
+        if not self.enabled:
+            return fn(*args)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._stats["leaders" if leader else "followers"] += 1
+        COALESCED_REQUESTS.inc(group=self.name, role="leader" if leader else "follower")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    def __init__(self, name: str, enabled: bool = True):
+        """
+        SingleFlight for coroutines on one event loop
+
+        The shared computation runs as its own task. A waiter that is
+        cancelled (e.g. by a route timeout) leaves the others unaffected;
+        the task itself is cancelled only when its last waiter goes away.
+
+        :param name: Group label for the metrics
+        :param enabled: When False every caller awaits its own coroutine
+        """
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: Hashable, factory: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Return await factory(*args), sharing it with concurrent callers of the same key
+
+        :param key: Identity of the computation (callers must normalize it)
+        :param factory: Coroutine function to run if no call for key is in flight
+        :return: The result of the coroutine
+        :raises Exception: Whatever the coroutine raised, in every waiter
+        """
+        if not self.enabled:
+            return await factory(*args)
+
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            call = self._calls[key] = _AsyncCall(asyncio.ensure_future(factory(*args)))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        self._stats["leaders" if leader else "followers"] += 1
+        COALESCED_REQUESTS.inc(group=self.name, role="leader" if leader else "follower")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is waiting any more; new callers must not join a cancelled task
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _AsyncCall) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,469 @@
+import logging
+import math
+from numbers import Real
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from price_store import PriceStore, get_price_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LOT_METHODS = ("fifo", "hifo", "specific")
+
+# Keyword arguments of harvest_losses that callers may take from user input
+HARVEST_OPTIONS = ("as_of", "method", "sell", "lot_ids", "purchases")
+
+# A loss is disallowed if substantially identical shares are bought this many
+# days before or after the sale
+WASH_SALE_DAYS = 30
+
+
+def _to_days(values) -> np.ndarray:
+    return np.asarray(pd.to_datetime(values).values.astype("datetime64[D]"))
+
+
+def _date(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+def _check_date(value, name: str) -> None:
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be an ISO date string")
+    try:
+        valid = not pd.isna(pd.Timestamp(value))
+    except ValueError:
+        valid = False
+    if not valid:
+        raise ValueError(f"{name} is not a valid date: {value!r}")
+
+
+def _check_number(value, name: str, positive: bool = False) -> None:
+    if isinstance(value, bool) or not isinstance(value, Real) or not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number")
+    if value < 0 or (positive and value == 0):
+        raise ValueError(f"{name} must be {'positive' if positive else 'non-negative'}")
+
+
+def _check_records(records, name: str, fields: Dict[str, str]) -> None:
+    """Check a list of dicts from user input; fields maps each required key to "ticker", "date", "number" or "positive"."""
+    if not isinstance(records, list):
+        raise ValueError(f"{name} must be a list of objects")
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"{name}[{i}] must be an object")
+        missing = set(fields) - set(record)
+        if missing:
+            raise ValueError(f"{name}[{i}] is missing {sorted(missing)}")
+        for field, kind in fields.items():
+            label = f"{name}[{i}].{field}"
+            value = record[field]
+            if kind == "ticker":
+                if not isinstance(value, str) or not value.strip():
+                    raise ValueError(f"{label} must be a non-empty string")
+            elif kind == "date":
+                _check_date(value, label)
+            else:
+                _check_number(value, label, positive=kind == "positive")
+
+
+def _check_lot_id(value, name: str) -> None:
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"{name} must be a string or an integer")
+
+
+def validate_harvest_options(options) -> Dict:
+    """
+    Check harvest options taken from user input
+
+    :param options: Dict with keys from HARVEST_OPTIONS
+    :return: The options, ready for harvest_losses
+    :raises ValueError: For unknown keys or values of the wrong type
+    """
+    if not isinstance(options, dict) or set(options) - set(HARVEST_OPTIONS):
+        raise ValueError(f"harvest must be an object with keys from {list(HARVEST_OPTIONS)}")
+    if options.get("as_of") is not None:
+        _check_date(options["as_of"], "harvest.as_of")
+    if "method" in options and options["method"] not in LOT_METHODS:
+        raise ValueError(f"harvest.method must be one of {list(LOT_METHODS)}")
+    if options.get("sell") is not None:
+        if not isinstance(options["sell"], dict):
+            raise ValueError("harvest.sell must be an object of ticker -> shares")
+        for ticker, shares in options["sell"].items():
+            _check_number(shares, f"harvest.sell.{ticker}")
+    if options.get("lot_ids") is not None:
+        if not isinstance(options["lot_ids"], list):
+            raise ValueError("harvest.lot_ids must be a list")
+        for i, lot_id in enumerate(options["lot_ids"]):
+            _check_lot_id(lot_id, f"harvest.lot_ids[{i}]")
+    if options.get("purchases") is not None:
+        _check_records(options["purchases"], "harvest.purchases",
+                       {"ticker": "ticker", "date": "date", "quantity": "positive"})
+    return options
+
+
+class TaxLots:
+    def __init__(self, tickers: Sequence[str], acquired, quantity, cost_basis, lot_ids=None):
+        """
+        Columnar set of tax lots
+
+        Tickers are stored as integer codes into the sorted `symbols` list, so
+        every per-ticker step below is a bincount or a sort on those codes.
+
+        :param tickers: Ticker per lot
+        :param acquired: Acquisition date per lot
+        :param quantity: Shares per lot
+        :param cost_basis: Total cost basis per lot (not per share)
+        :param lot_ids: Identifier per lot for specific-ID sales (default: 0..n-1)
+        """
+        codes, symbols = pd.factorize(pd.Series(tickers, dtype=str).str.upper(), sort=True)
+        if np.any(codes < 0):
+            raise ValueError("Every lot needs a ticker")
+        self.symbols: List[str] = symbols.tolist()
+        self.codes = codes.astype(np.int64)
+        self.acquired = _to_days(acquired)
+        self.quantity = np.asarray(quantity, dtype=float)
+        self.cost_basis = np.asarray(cost_basis, dtype=float)
+        self.lot_ids = np.arange(len(self.codes)) if lot_ids is None else np.asarray(lot_ids)
+        if not (len(self.codes) == len(self.acquired) == len(self.quantity)
+                == len(self.cost_basis) == len(self.lot_ids)):
+            raise ValueError("Lot columns must all have the same length")
+        if np.any(self.quantity <= 0):
+            raise ValueError("Lot quantities must be positive")
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def cost_per_share(self) -> np.ndarray:
+        return self.cost_basis / self.quantity
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> "TaxLots":
+        """
+        Lots from dicts with ticker, acquired, quantity, cost_basis and optional lot_id
+
+        The records are checked field by field, so they may come straight from user input.
+
+        :raises ValueError: For a missing field or a value of the wrong type
+        """
+        _check_records(records, "tax_lots",
+                       {"ticker": "ticker", "acquired": "date", "quantity": "positive", "cost_basis": "number"})
+        if not records:
+            raise ValueError("tax_lots must not be empty")
+        has_ids = ["lot_id" in record for record in records]
+        if any(has_ids) and not all(has_ids):
+            raise ValueError("Either every lot or no lot needs a lot_id")
+        for i, record in enumerate(records):
+            if "lot_id" in record:
+                _check_lot_id(record["lot_id"], f"tax_lots[{i}].lot_id")
+        return cls.from_frame(pd.DataFrame(records))
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> "TaxLots":
+        """Lots from a DataFrame with ticker, acquired, quantity, cost_basis (and lot_id) columns."""
+        missing = {"ticker", "acquired", "quantity", "cost_basis"} - set(frame.columns)
+        if missing:
+            raise ValueError(f"Tax lots are missing columns: {sorted(missing)}")
+        return cls(
+            frame["ticker"].to_numpy(), frame["acquired"], frame["quantity"].to_numpy(),
+            frame["cost_basis"].to_numpy(), frame["lot_id"].to_numpy() if "lot_id" in frame else None
+        )
+
+
+class PurchaseIndex:
+    def __init__(self, symbols: List[str], codes: np.ndarray, dates: np.ndarray, quantity: np.ndarray):
+        """
+        Purchases sorted by (ticker, date) with a running share count
+
+        The number of shares of one ticker bought in any date window is then
+        a difference of two cumulative sums found by binary search.
+
+        :param symbols: Ticker for each code
+        :param codes: Ticker code per purchase
+        :param dates: Purchase date per purchase (datetime64[D])
+        :param quantity: Shares per purchase
+        """
+        self.symbols = symbols
+        keys = self._keys(np.asarray(codes, dtype=np.int64), np.asarray(dates, dtype="datetime64[D]"))
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.cumulative = np.concatenate(([0.0], np.cumsum(np.asarray(quantity, dtype=float)[order])))
+
+    @staticmethod
+    def _keys(codes: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        # Ticker code in the high bits, days since the epoch (offset to stay positive) in the low bits
+        return (codes << 32) + (dates.astype(np.int64) + (1 << 31))
+
+    @classmethod
+    def from_lots(cls, lots: TaxLots, purchases: Optional[Iterable[dict]] = None) -> "PurchaseIndex":
+        """
+        Index the lots' acquisitions plus any other purchases
+
+        :param lots: Lots held
+        :param purchases: Extra buys (dicts with ticker, date, quantity), e.g.
+            dividend reinvestments or planned purchases after the sale
+        """
+        codes, dates, quantity = lots.codes, lots.acquired, lots.quantity
+        if purchases:
+            extra = pd.DataFrame(list(purchases))
+            positions = {symbol: code for code, symbol in enumerate(lots.symbols)}
+            # Purchases of tickers without lots cannot wash any sale, so drop them
+            extra_codes = extra["ticker"].str.upper().map(positions)
+            known = extra_codes.notna().to_numpy()
+            codes = np.concatenate((codes, extra_codes[known].to_numpy(dtype=np.int64)))
+            dates = np.concatenate((dates, _to_days(extra["date"][known])))
+            quantity = np.concatenate((quantity, extra["quantity"].to_numpy(dtype=float)[known]))
+        return cls(lots.symbols, codes, dates, quantity)
+
+    def quantity_between(self, codes: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+        """
+        Shares bought per ticker code within inclusive date windows
+
+        :param codes: Ticker codes
+        :param start: First day of each window
+        :param end: Last day of each window
+        :return: Shares bought in each window
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        lo = np.searchsorted(self.keys, self._keys(codes, np.asarray(start, dtype="datetime64[D]")), side="left")
+        hi = np.searchsorted(self.keys, self._keys(codes, np.asarray(end, dtype="datetime64[D]")), side="right")
+        return self.cumulative[hi] - self.cumulative[lo]
+
+
+def price_lots(lots: TaxLots, as_of=None, store: Optional[PriceStore] = None) -> Tuple[np.ndarray, np.datetime64]:
+    """
+    Closing price of every lot's ticker on the last trading day up to as_of
+
+    :param lots: Lots to price
+    :param as_of: Valuation date (default: the latest date every ticker has a price for)
+    :param store: Price store (default: the process-wide one)
+    :return: (price per lot, valuation date)
+    :raises ValueError: For a ticker without price data or a date before its history
+    """
+    store = store or get_price_store()
+    unknown = sorted(set(lots.symbols) - set(store.tickers()))
+    if unknown:
+        raise ValueError(f"No price data for: {', '.join(unknown)}")
+    series = [store.load(symbol) for symbol in lots.symbols]
+    if as_of is None:
+        as_of = min(s.dates[-1] for s in series)
+    as_of = _date(as_of)
+
+    prices = np.empty(len(lots.symbols))
+    for code, s in enumerate(series):
+        row = int(np.searchsorted(s.dates, as_of, side="right")) - 1
+        if row < 0:
+            raise ValueError(f"No price for {lots.symbols[code]} on or before {as_of}")
+        prices[code] = s["close"][row]
+    return prices[lots.codes], as_of
+
+
+def long_term_mask(acquired: np.ndarray, sold) -> np.ndarray:
+    """
+    Lots held for more than one year at the sale date
+
+    The holding period is long-term from the day after the first anniversary
+    of the acquisition (a Feb 29 purchase turns on Mar 2 of the next year).
+
+    :param acquired: Acquisition dates (datetime64[D])
+    :param sold: Sale date, scalar or per lot
+    """
+    acquired = np.asarray(acquired, dtype="datetime64[D]")
+    month_start = acquired.astype("datetime64[M]")
+    anniversary = (month_start + 12).astype("datetime64[D]") + (acquired - month_start.astype("datetime64[D]"))
+    return np.asarray(sold, dtype="datetime64[D]") > anniversary
+
+
+def _exclusive_cumsum_by_group(codes: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Running total of values before each row, restarting at every code (rows sorted by code)."""
+    before = np.cumsum(values) - values
+    group_start = np.searchsorted(codes, codes, side="left")
+    return before - before[group_start]
+
+
+def _fill_in_order(order: np.ndarray, codes: np.ndarray, available: np.ndarray,
+                   wanted_per_code: np.ndarray) -> np.ndarray:
+    """
+    Take wanted_per_code[code] units from rows in the given order, at most available per row
+
+    :param order: Row order, grouped by code
+    :return: Units taken per row (in original row order)
+    """
+    sorted_codes = codes[order]
+    sorted_available = available[order]
+    before = _exclusive_cumsum_by_group(sorted_codes, sorted_available)
+    taken = np.clip(wanted_per_code[sorted_codes] - before, 0.0, sorted_available)
+    result = np.empty_like(available)
+    result[order] = taken
+    return result
+
+
+def select_lots(lots: TaxLots, method: str = "fifo", sell: Optional[Dict[str, float]] = None,
+                lot_ids: Optional[Sequence] = None) -> np.ndarray:
+    """
+    Shares to sell from each lot
+
+    :param lots: Lots held
+    :param method: "fifo" (oldest first), "hifo" (highest cost per share first) or
+        "specific" (whole lots named in lot_ids)
+    :param sell: Ticker -> shares to sell, for fifo and hifo
+    :param lot_ids: Lots to sell in full, for specific
+    :return: Shares sold per lot
+    """
+    if method not in LOT_METHODS:
+        raise ValueError(f"method must be one of {LOT_METHODS}")
+    if method == "specific":
+        if lot_ids is None:
+            raise ValueError("Specific identification needs lot_ids")
+        selected = np.isin(lots.lot_ids, np.asarray(lot_ids))
+        return np.where(selected, lots.quantity, 0.0)
+
+    wanted = np.zeros(len(lots.symbols))
+    for ticker, shares in (sell or {}).items():
+        ticker = ticker.upper()
+        if ticker not in lots.symbols:
+            raise ValueError(f"No lots held for {ticker}")
+        wanted[lots.symbols.index(ticker)] = shares
+    held = np.bincount(lots.codes, weights=lots.quantity, minlength=len(lots.symbols))
+    if np.any(wanted > held + 1e-9):
+        short = [symbol for symbol, w, h in zip(lots.symbols, wanted, held) if w > h + 1e-9]
+        raise ValueError(f"Cannot sell more shares than held of: {', '.join(short)}")
+
+    if method == "fifo":
+        order = np.lexsort((lots.lot_ids, lots.acquired, lots.codes))
+    else:
+        order = np.lexsort((lots.lot_ids, lots.acquired, -lots.cost_per_share, lots.codes))
+    return _fill_in_order(order, lots.codes, lots.quantity, wanted)
+
+
+def capital_gains_tax(short_term: float, long_term: float, tax_rates: Dict[str, float],
+                      max_deductible_loss: float) -> float:
+    """
+    Tax on a year's net capital gains; negative when a net loss is deducted
+
+    Short- and long-term results offset each other. A remaining net gain is
+    taxed at its own rate; a net loss is deductible against ordinary income
+    (taxed here at the short-term rate) up to max_deductible_loss.
+    """
+    net = short_term + long_term
+    if net < 0:
+        return -min(-net, max_deductible_loss) * tax_rates['short_term_capital_gains']
+    if short_term < 0:
+        long_term, short_term = net, 0.0
+    elif long_term < 0:
+        short_term, long_term = net, 0.0
+    return short_term * tax_rates['short_term_capital_gains'] + long_term * tax_rates['long_term_capital_gains']
+
+
+def evaluate_sale(lots: TaxLots, sold: np.ndarray, prices: np.ndarray, sale_date,
+                  purchases: Optional[PurchaseIndex] = None) -> Dict[str, np.ndarray]:
+    """
+    Per-lot gains, holding period and wash-sale adjustments for one sale date
+
+    Shares bought within WASH_SALE_DAYS of the sale (other than the ones
+    sold) replace sold loss shares in acquisition order; the loss on each
+    replaced share is disallowed.
+
+    :param lots: Lots held
+    :param sold: Shares sold per lot
+    :param prices: Sale price per lot
+    :param sale_date: Date of the sale
+    :param purchases: Purchase index (default: the lots' own acquisitions)
+    :return: Dict of per-lot arrays: sold, gain, long_term, washed_shares, disallowed_loss
+    """
+    sale_date = _date(sale_date)
+    purchases = purchases or PurchaseIndex.from_lots(lots)
+    gain = sold * (prices - lots.cost_per_share)
+    long_term = long_term_mask(lots.acquired, sale_date)
+
+    window = np.timedelta64(WASH_SALE_DAYS, "D")
+    n_symbols = len(lots.symbols)
+    codes = np.arange(n_symbols)
+    bought = purchases.quantity_between(codes, np.full(n_symbols, sale_date - window),
+                                        np.full(n_symbols, sale_date + window))
+    # The shares being sold are not their own replacement
+    in_window = np.abs(lots.acquired - sale_date) <= window
+    sold_in_window = np.bincount(lots.codes, weights=np.where(in_window, sold, 0.0), minlength=n_symbols)
+    replacement = np.maximum(bought - sold_in_window, 0.0)
+
+    loss_shares = np.where(gain < 0, sold, 0.0)
+    order = np.lexsort((lots.lot_ids, lots.acquired, lots.codes))
+    washed = _fill_in_order(order, lots.codes, loss_shares, replacement)
+    per_share_loss = np.divide(gain, sold, out=np.zeros_like(gain), where=sold > 0)
+    return {
+        "sold": sold,
+        "gain": gain,
+        "long_term": long_term,
+        "washed_shares": washed,
+        "disallowed_loss": -washed * per_share_loss
+    }
+
+
+def harvest_losses(lots: TaxLots, tax_rates: Dict[str, float], max_deductible_loss: float,
+                   prices: Optional[np.ndarray] = None, as_of=None, store: Optional[PriceStore] = None,
+                   method: str = "specific", sell: Optional[Dict[str, float]] = None,
+                   lot_ids: Optional[Sequence] = None, purchases: Optional[Iterable[dict]] = None,
+                   realized_gains: Tuple[float, float] = (0.0, 0.0)) -> Dict:
+    """
+    Evaluate a tax-loss harvest over a set of lots
+
+    By default every lot with an unrealized loss is sold (specific
+    identification of the losers). Passing sell with method "fifo" or "hifo",
+    or lot_ids with "specific", evaluates that sale instead.
+
+    :param lots: Lots held
+    :param tax_rates: Rates with short_term_capital_gains and long_term_capital_gains
+    :param max_deductible_loss: Yearly cap on net losses deducted from ordinary income
+    :param prices: Price per lot (default: priced from the price store as of as_of)
+    :param as_of: Sale date (default: latest common price date)
+    :param store: Price store used when prices is None
+    :param method: Lot selection method, see select_lots
+    :param sell: Ticker -> shares, for fifo and hifo
+    :param lot_ids: Lots to sell, for specific (default: every lot at a loss)
+    :param purchases: Other buys checked for wash sales (ticker, date, quantity)
+    :param realized_gains: (short-term, long-term) gains already realized this year
+    :return: Report with the same headline keys as TaxOptimizationTool.tax_loss_harvesting
+    """
+    if prices is None:
+        prices, as_of = price_lots(lots, as_of, store)
+    elif as_of is None:
+        raise ValueError("as_of is required when prices are given")
+    as_of = _date(as_of)
+    if np.any(lots.acquired > as_of):
+        raise ValueError(f"Some lots were acquired after {as_of}")
+
+    if method == "specific" and lot_ids is None:
+        lot_ids = lots.lot_ids[prices * lots.quantity < lots.cost_basis]
+    sold = select_lots(lots, method, sell, lot_ids)
+    sale = evaluate_sale(lots, sold, prices, as_of, PurchaseIndex.from_lots(lots, purchases))
+
+    # Disallowed losses do not count this year
+    allowed = sale["gain"] + sale["disallowed_loss"]
+    long_term = sale["long_term"]
+    short_term_result = float(allowed[~long_term].sum())
+    long_term_result = float(allowed[long_term].sum())
+
+    prior_short, prior_long = realized_gains
+    tax_before = capital_gains_tax(prior_short, prior_long, tax_rates, max_deductible_loss)
+    tax_after = capital_gains_tax(prior_short + short_term_result, prior_long + long_term_result,
+                                  tax_rates, max_deductible_loss)
+    net = prior_short + prior_long + short_term_result + long_term_result
+
+    n_symbols = len(lots.symbols)
+    harvested = np.bincount(lots.codes, weights=np.minimum(allowed, 0.0), minlength=n_symbols)
+    disallowed = np.bincount(lots.codes, weights=sale["disallowed_loss"], minlength=n_symbols)
+    return {
+        'total_potential_tax_savings': tax_before - tax_after,
+        'harvest_candidates': [symbol for symbol, loss in zip(lots.symbols, harvested) if loss < 0],
+        'max_deductible_loss': float(min(max(-net, 0.0), max_deductible_loss)),
+        'carryforward_loss': float(max(-net - max_deductible_loss, 0.0)),
+        'short_term_result': short_term_result,
+        'long_term_result': long_term_result,
+        'wash_sale_disallowed_loss': float(disallowed.sum()),
+        'wash_sale_tickers': [symbol for symbol, loss in zip(lots.symbols, disallowed) if loss > 0],
+        'lots_sold': int(np.count_nonzero(sold)),
+        'as_of': str(as_of)
+    }
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from tax_lots import (TaxLots, capital_gains_tax, evaluate_sale, harvest_losses, long_term_mask, select_lots,
+                      validate_harvest_options)
+
+RATES = {"short_term_capital_gains": 0.3, "long_term_capital_gains": 0.15}
+
+
+def lots_of(*rows):
+    """Lots from (ticker, acquired, quantity, cost_basis) rows."""
+    tickers, acquired, quantity, cost_basis = zip(*rows)
+    return TaxLots(list(tickers), list(acquired), list(quantity), list(cost_basis))
+
+
+def days(*values):
+    return np.array(values, dtype="datetime64[D]")
+
+
+class TestHoldingPeriod:
+    def test_long_term_starts_the_day_after_the_anniversary(self):
+        acquired = days("2021-02-28", "2021-02-28")
+        assert long_term_mask(acquired, days("2022-02-28", "2022-03-01")).tolist() == [False, True]
+
+    def test_leap_day_purchase(self):
+        acquired = days("2020-02-29", "2020-02-29")
+        assert long_term_mask(acquired, days("2021-03-01", "2021-03-02")).tolist() == [False, True]
+
+    def test_sale_splits_short_and_long_term_gains(self):
+        lots = lots_of(("AAPL", "2020-01-02", 10, 1000.0), ("AAPL", "2022-03-01", 10, 1000.0))
+        sale = evaluate_sale(lots, lots.quantity, np.array([150.0, 150.0]), "2022-06-01")
+        assert sale["long_term"].tolist() == [True, False]
+        assert sale["gain"].tolist() == [500.0, 500.0]
+
+
+class TestWashSale:
+    def test_purchase_within_window_disallows_loss_on_replaced_shares(self):
+        lots = lots_of(("TSLA", "2022-01-03", 10, 1000.0))
+        purchases = [{"ticker": "TSLA", "date": "2022-06-15", "quantity": 4}]
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([80.0]), as_of="2022-06-01",
+                                purchases=purchases)
+        assert report["wash_sale_disallowed_loss"] == pytest.approx(80.0)
+        assert report["wash_sale_tickers"] == ["TSLA"]
+        assert report["short_term_result"] == pytest.approx(-120.0)
+
+    def test_purchase_outside_window_is_not_a_wash_sale(self):
+        lots = lots_of(("TSLA", "2022-01-03", 10, 1000.0))
+        purchases = [{"ticker": "TSLA", "date": "2022-07-02", "quantity": 4}]
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([80.0]), as_of="2022-06-01",
+                                purchases=purchases)
+        assert report["wash_sale_disallowed_loss"] == 0.0
+        assert report["short_term_result"] == pytest.approx(-200.0)
+
+    def test_recently_bought_lot_is_not_its_own_replacement(self):
+        lots = lots_of(("TSLA", "2022-05-20", 10, 1000.0))
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([80.0]), as_of="2022-06-01")
+        assert report["wash_sale_disallowed_loss"] == 0.0
+
+    def test_unsold_recent_lot_washes_an_older_loss(self):
+        lots = lots_of(("TSLA", "2022-01-03", 10, 1000.0), ("TSLA", "2022-05-20", 5, 500.0))
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([80.0, 80.0]), as_of="2022-06-01",
+                                lot_ids=[0])
+        assert report["wash_sale_disallowed_loss"] == pytest.approx(100.0)
+
+    def test_purchase_of_another_ticker_does_not_wash(self):
+        lots = lots_of(("TSLA", "2022-01-03", 10, 1000.0))
+        purchases = [{"ticker": "AAPL", "date": "2022-06-15", "quantity": 4}]
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([80.0]), as_of="2022-06-01",
+                                purchases=purchases)
+        assert report["wash_sale_disallowed_loss"] == 0.0
+
+
+class TestNetting:
+    def test_short_term_loss_offsets_long_term_gain(self):
+        assert capital_gains_tax(-1000.0, 3000.0, RATES, 3000.0) == pytest.approx(2000.0 * 0.15)
+
+    def test_long_term_loss_offsets_short_term_gain(self):
+        assert capital_gains_tax(3000.0, -1000.0, RATES, 3000.0) == pytest.approx(2000.0 * 0.3)
+
+    def test_net_loss_deduction_is_capped(self):
+        assert capital_gains_tax(-4000.0, -1000.0, RATES, 3000.0) == pytest.approx(-3000.0 * 0.3)
+
+    def test_harvest_against_realized_gains(self):
+        lots = lots_of(("TSLA", "2022-01-03", 10, 1000.0))
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([50.0]), as_of="2022-06-01",
+                                realized_gains=(0.0, 2000.0))
+        # The 500 short-term loss offsets long-term gains taxed at 15%
+        assert report["total_potential_tax_savings"] == pytest.approx(500.0 * 0.15)
+        assert report["carryforward_loss"] == 0.0
+
+    def test_loss_beyond_the_cap_carries_forward(self):
+        lots = lots_of(("TSLA", "2022-01-03", 100, 10000.0))
+        report = harvest_losses(lots, RATES, 3000.0, prices=np.array([50.0]), as_of="2022-06-01")
+        assert report["max_deductible_loss"] == 3000.0
+        assert report["carryforward_loss"] == pytest.approx(2000.0)
+        assert report["total_potential_tax_savings"] == pytest.approx(3000.0 * 0.3)
+
+
+class TestLotSelection:
+    def test_fifo_and_hifo(self):
+        lots = lots_of(("AAPL", "2021-01-04", 10, 1000.0), ("AAPL", "2021-06-01", 10, 1500.0))
+        assert select_lots(lots, "fifo", {"aapl": 15}).tolist() == [10.0, 5.0]
+        assert select_lots(lots, "hifo", {"AAPL": 15}).tolist() == [5.0, 10.0]
+
+    def test_overselling_is_rejected(self):
+        lots = lots_of(("AAPL", "2021-01-04", 10, 1000.0))
+        with pytest.raises(ValueError, match="more shares than held"):
+            select_lots(lots, "fifo", {"AAPL": 11})
+
+
+class TestInputValidation:
+    def test_records_are_checked(self):
+        lot = {"ticker": "AAPL", "acquired": "2021-01-04", "quantity": 10, "cost_basis": 1000.0}
+        assert len(TaxLots.from_records([lot])) == 1
+        for bad in ([dict(lot, quantity="10")], [dict(lot, acquired="soon")], [{"ticker": "AAPL"}],
+                    [dict(lot, quantity=0)], [lot, dict(lot, lot_id=1)], {"lots": [lot]}, [], ["AAPL"]):
+            with pytest.raises(ValueError):
+                TaxLots.from_records(bad)
+
+    def test_harvest_options_are_checked(self):
+        options = {"as_of": "2022-06-01", "method": "fifo", "sell": {"AAPL": 5},
+                   "purchases": [{"ticker": "AAPL", "date": "2022-06-15", "quantity": 1}]}
+        assert validate_harvest_options(options) is options
+        for bad in ({"as_of": 20220601}, {"method": "lifo"}, {"sell": [5]}, {"sell": {"AAPL": -1}},
+                    {"lot_ids": "1"}, {"purchases": [{"ticker": "AAPL"}]}, {"unknown": 1}, []):
+            with pytest.raises(ValueError):
+                validate_harvest_options(bad)
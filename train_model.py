@@ -1,31 +1,191 @@
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
+from sklearn.model_selection import train_test_split, ParameterGrid
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import argparse
 import joblib
+import json
 import os
 import logging
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def train_investment_model(user_data_file, model_output_path=r"C:\\Users\\user\Desktop\\fowzan\\Aiproject\\models\\investment_model.pkl"
-):
-    """Train a model to recommend investment portfolios based on user profiles."""
+# Model inputs and target encoding, shared with the serving code
+FEATURE_COLUMNS = ["income", "expenses", "savings", "investment_amount"]
+LABEL_MAPPING = {"low": 0, "medium": 1, "high": 2}
+
+DEFAULT_MODEL_PARAMS = {"n_estimators": 150, "max_depth": 10}
+DEFAULT_CHUNK_ROWS = 500_000
+DEFAULT_SEARCH_GRID = {
+    "n_estimators": [50, 100, 150],
+    "max_depth": [6, 10, 14],
+    "min_samples_leaf": [1, 5]
+}
+
+def _peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB (None on Windows)."""
+    if resource is None:
+        return None
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak_kb / 1024.0
+
+@contextmanager
+def log_stage(name, rows=None):
+    """
+    Log wall-clock time, peak memory and throughput of a training stage
+
+    :param name: Stage name for the log line
+    :param rows: Rows processed by the stage; a dict can also be yielded into
+        and its "rows" key set inside the with-block
+    """
+    info = {"rows": rows}
+    start = time.perf_counter()
+    yield info
+    elapsed = time.perf_counter() - start
+    message = f"[stage] {name}: {elapsed:.2f}s"
+    peak = _peak_rss_mb()
+    if peak is not None:
+        message += f", peak RSS {peak:.0f} MB"
+    if info["rows"]:
+        message += f", {info['rows'] / max(elapsed, 1e-9):,.0f} rows/s"
+    logging.info(message)
+
+def _prepare_chunk(data):
+    """Validate a profile frame and return (features DataFrame, label array), or None."""
+    missing_columns = [col for col in FEATURE_COLUMNS + ["risk_tolerance"] if col not in data.columns]
+    if missing_columns:
+        logging.error(f"Missing required columns: {missing_columns}")
+        return None
+    X = data[FEATURE_COLUMNS]
+    if X.isnull().values.any():
+        logging.warning("Chunk contains missing values. Filling missing values with the chunk mean.")
+        X = X.fillna(X.mean())
+    y = data["risk_tolerance"].map(LABEL_MAPPING)
+    if y.isnull().any():
+        logging.error("Unexpected values found in the 'risk_tolerance' column.")
+        return None
+    return X, y.to_numpy(dtype=np.int64)
+
+def count_profile_rows(user_data_file):
+    """Rows in a profile CSV or columnar directory, counted without parsing."""
+    if os.path.isdir(user_data_file):
+        with open(os.path.join(user_data_file, "meta.json")) as f:
+            return json.load(f)["rows"]
+    lines = 0
+    last = b"\n"
+    with open(user_data_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    # A final row without a newline still counts; the header does not
+    return max(lines + (last != b"\n") - 1, 0)
+
+def iter_profile_chunks(user_data_file, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Read a profile set in chunks of at most chunk_rows rows
+
+    Accepts the CSV written by generate_user_profiles / write_user_profiles
+    or a columnar directory written by write_user_profiles, which is
+    memory-mapped and sliced without parsing.
+
+    :param user_data_file: CSV path or columnar directory
+    :param chunk_rows: Rows per chunk
+    :return: Iterator of (features DataFrame, labels array)
+    """
+    if os.path.isdir(user_data_file):
+        with open(os.path.join(user_data_file, "meta.json")) as f:
+            meta = json.load(f)
+        columns = {
+            name: np.load(os.path.join(user_data_file, f"{name}.npy"), mmap_mode="r")
+            for name in FEATURE_COLUMNS + ["risk_tolerance"]
+        }
+        # Stored codes index meta["risk_levels"]; translate them to training labels
+        code_to_label = np.array([LABEL_MAPPING[level] for level in meta["risk_levels"]], dtype=np.int64)
+        for start in range(0, meta["rows"], chunk_rows):
+            stop = start + chunk_rows
+            X = pd.DataFrame({name: np.asarray(columns[name][start:stop]) for name in FEATURE_COLUMNS})
+            yield X, code_to_label[columns["risk_tolerance"][start:stop]]
+        return
+
+    for data in pd.read_csv(user_data_file, usecols=FEATURE_COLUMNS + ["risk_tolerance"], chunksize=chunk_rows):
+        prepared = _prepare_chunk(data)
+        if prepared is None:
+            raise ValueError(f"Invalid profile data in {user_data_file}")
+        yield prepared
+
+def merge_forests(forests):
+    """
+    Combine forests fitted on different shards into one RandomForestClassifier
+
+    Each forest must have been fitted on the same feature columns and classes.
+    The result averages all trees, like a single forest of the combined size.
+    """
+    merged = forests[0]
+    for forest in forests[1:]:
+        if not np.array_equal(forest.classes_, merged.classes_):
+            raise ValueError("Cannot merge forests fitted on different classes")
+        merged.estimators_ += forest.estimators_
+    merged.n_estimators = len(merged.estimators_)
+    return merged
+
+def _evaluate(model, X_test, y_test):
+    y_pred = model.predict(X_test)
+    accuracy = accuracy_score(y_test, y_pred)
+    logging.info(f"Model Accuracy: {accuracy:.2f}")
+    logging.info("\nClassification Report:\n" + classification_report(
+        y_test, y_pred, labels=list(LABEL_MAPPING.values()), target_names=list(LABEL_MAPPING)
+    ))
+    return accuracy
+
+def _save_model(model, model_output_path):
+    os.makedirs(os.path.dirname(model_output_path) or ".", exist_ok=True)  # Create directory if it doesn't exist
+    try:
+        joblib.dump(model, model_output_path)
+        logging.info(f"Model trained and saved at {model_output_path}")
+    except Exception as e:
+        logging.error(f"Failed to save the model: {e}")
+
+def train_investment_model(user_data_file, model_output_path=r"C:\\Users\\user\Desktop\\fowzan\\Aiproject\\models\\investment_model.pkl",
+                           n_jobs=-1, model_params=None):
+    """
+    Train a model to recommend investment portfolios based on user profiles.
+
+    Loads the whole file into memory; see train_investment_model_sharded for
+    profile sets larger than RAM.
+
+    :param user_data_file: Profile CSV
+    :param model_output_path: Where to save the fitted model
+    :param n_jobs: Cores used to fit trees (-1: all); the fitted model does not depend on it
+    :param model_params: RandomForestClassifier parameters (default: DEFAULT_MODEL_PARAMS)
+    :return: Fitted model, or None on failure
+    """
     if not os.path.exists(user_data_file):
         logging.error(f"Error: {user_data_file} not found!")
         return
 
     # Load user profiles
     try:
-        data = pd.read_csv(user_data_file)
+        with log_stage("load") as stage:
+            data = pd.read_csv(user_data_file)
+            stage["rows"] = len(data)
         logging.info(f"Loaded user profiles from {user_data_file}")
     except Exception as e:
         logging.error(f"Failed to load user profiles: {e}")
         return
     
     # Ensure all necessary columns are present
-    required_columns = ["income", "expenses", "savings", "investment_amount", "risk_tolerance"]
+    required_columns = FEATURE_COLUMNS + ["risk_tolerance"]
     missing_columns = [col for col in required_columns if col not in data.columns]
     if missing_columns:
         logging.error(f"Missing required columns: {missing_columns}")
@@ -37,11 +197,11 @@ def train_investment_model(user_data_file, model_output_path=r"C:\\Users\\user\D
         data.fillna(data.mean(), inplace=True)
     
     # Features and target variable
-    X = data[["income", "expenses", "savings", "investment_amount"]]
+    X = data[FEATURE_COLUMNS]
     y = data["risk_tolerance"]
     
     # Convert target to numerical labels
-    label_mapping = {"low": 0, "medium": 1, "high": 2}
+    label_mapping = LABEL_MAPPING
     if not set(y).issubset(set(label_mapping.keys())):
         logging.error("Unexpected values found in the 'risk_tolerance' column.")
         return
@@ -52,29 +212,159 @@ def train_investment_model(user_data_file, model_output_path=r"C:\\Users\\user\D
     
     # Train Random Forest Classifier
     logging.info("Training Random Forest model...")
-    model = RandomForestClassifier(n_estimators=150, max_depth=10, random_state=42)
-    model.fit(X_train, y_train)
+    model = RandomForestClassifier(**(model_params or DEFAULT_MODEL_PARAMS), random_state=42, n_jobs=n_jobs)
+    with log_stage("fit", rows=len(X_train)):
+        model.fit(X_train, y_train)
     
     # Evaluate model performance
-    y_pred = model.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
-    logging.info(f"Model Accuracy: {accuracy:.2f}")
-    logging.info("\nClassification Report:\n" + classification_report(y_test, y_pred, target_names=["low", "medium", "high"]))
+    with log_stage("evaluate", rows=len(X_test)):
+        _evaluate(model, X_test, y_test)
     
     # Save model
-    os.makedirs(os.path.dirname(model_output_path), exist_ok=True)  # Create directory if it doesn't exist
-    try:
-        joblib.dump(model, model_output_path)
-        logging.info(f"Model trained and saved at {model_output_path}")
-    except Exception as e:
-        logging.error(f"Failed to save the model: {e}")
+    with log_stage("save"):
+        _save_model(model, model_output_path)
+    return model
+
+def train_investment_model_sharded(user_data_file, model_output_path, chunk_rows=DEFAULT_CHUNK_ROWS,
+                                   trees_per_shard=None, model_params=None, test_size=0.2,
+                                   max_eval_rows=200_000, n_jobs=-1, random_state=42):
+    """
+    Train on a profile set larger than RAM as an ensemble of per-shard forests
+
+    Chunks are read one at a time; each becomes a shard whose held-out rows
+    (test_size) go to a bounded evaluation sample and whose remaining rows fit
+    a forest of trees_per_shard trees on all cores. The shard forests are
+    merged into one RandomForestClassifier, so serving and forest_compiler
+    treat it like any other model. Peak memory is one chunk plus the trees.
+    By default the n_estimators budget is split across the shards, so the
+    merged model has about as many trees however large the data is.
+
+    :param user_data_file: Profile CSV or columnar directory
+    :param model_output_path: Where to save the merged model
+    :param chunk_rows: Rows per shard
+    :param trees_per_shard: Trees fitted per shard (default: n_estimators // shards, at least 1)
+    :param model_params: RandomForestClassifier parameters (default: DEFAULT_MODEL_PARAMS)
+    :param test_size: Fraction of every chunk held out for evaluation
+    :param max_eval_rows: Cap on the evaluation sample kept in memory
+    :param n_jobs: Cores used per shard fit (-1: all)
+    :param random_state: Seed for the hold-out split and the shard forests
+    :return: Merged model, or None on failure
+    """
+    if not os.path.exists(user_data_file):
+        logging.error(f"Error: {user_data_file} not found!")
+        return
+
+    params = dict(model_params or DEFAULT_MODEL_PARAMS)
+    if not trees_per_shard:
+        shards = max(-(-count_profile_rows(user_data_file) // chunk_rows), 1)
+        trees_per_shard = max(1, params["n_estimators"] // shards)
+    params["n_estimators"] = trees_per_shard
+    rng = np.random.default_rng(random_state)
+    forests, eval_X, eval_y = [], [], []
+    eval_rows = 0
+
+    with log_stage("sharded training") as total:
+        total["rows"] = 0
+        chunks = iter_profile_chunks(user_data_file, chunk_rows)
+        for shard, (X, y) in enumerate(chunks):
+            held_out = rng.random(len(y)) < test_size
+            if eval_rows < max_eval_rows:
+                keep = np.flatnonzero(held_out)[:max_eval_rows - eval_rows]
+                eval_X.append(X.iloc[keep])
+                eval_y.append(y[keep])
+                eval_rows += len(keep)
+
+            X_train, y_train = X[~held_out], y[~held_out]
+            if len(np.unique(y_train)) < len(LABEL_MAPPING):
+                logging.warning(f"Skipping shard {shard}: not every risk level is present")
+                continue
+            model = RandomForestClassifier(**params, random_state=random_state + shard, n_jobs=n_jobs)
+            with log_stage(f"fit shard {shard}", rows=len(y_train)):
+                model.fit(X_train, y_train)
+            forests.append(model)
+            total["rows"] += len(y)
+
+    if not forests:
+        logging.error("No shard could be trained.")
+        return
+
+    model = merge_forests(forests)
+    logging.info(f"Merged {len(forests)} shard forests into {model.n_estimators} trees")
+    if eval_rows:
+        with log_stage("evaluate", rows=eval_rows):
+            _evaluate(model, pd.concat(eval_X, ignore_index=True), np.concatenate(eval_y))
+    with log_stage("save"):
+        _save_model(model, model_output_path)
+    return model
+
+# Search data, loaded once per worker process by _init_search_worker
+_search_data = {}
+
+def _init_search_worker(user_data_file, sample_rows, random_state):
+    X, y = next(iter_profile_chunks(user_data_file, sample_rows))
+    _search_data["split"] = train_test_split(X, y, test_size=0.2, random_state=random_state)
+
+def _fit_candidate(params, random_state):
+    X_train, X_test, y_train, y_test = _search_data["split"]
+    start = time.perf_counter()
+    model = RandomForestClassifier(**params, random_state=random_state, n_jobs=1)
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    return {
+        "params": params,
+        "accuracy": float(accuracy_score(y_test, model.predict(X_test))),
+        "fit_seconds": fit_seconds
+    }
+
+def search_hyperparameters(user_data_file, param_grid=None, sample_rows=DEFAULT_CHUNK_ROWS,
+                           max_workers=None, random_state=42):
+    """
+    Grid search with every candidate fitted in its own worker process
+
+    Each worker loads the first sample_rows profiles once and fits its
+    candidates single-threaded, so max_workers candidates run at a time.
+
+    :param user_data_file: Profile CSV or columnar directory
+    :param param_grid: Dict of RandomForestClassifier parameter -> values (default: DEFAULT_SEARCH_GRID)
+    :param sample_rows: Profiles used for the search
+    :param max_workers: Worker processes (default: all cores)
+    :param random_state: Seed for the split and every candidate
+    :return: Results sorted by accuracy, best first
+    """
+    candidates = list(ParameterGrid(param_grid or DEFAULT_SEARCH_GRID))
+    max_workers = max_workers or os.cpu_count()
+    logging.info(f"Searching {len(candidates)} candidates on {max_workers} processes")
+    with log_stage("hyperparameter search"):
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_search_worker,
+                                 initargs=(user_data_file, sample_rows, random_state)) as pool:
+            results = list(pool.map(_fit_candidate, candidates, [random_state] * len(candidates)))
+    results.sort(key=lambda result: (-result["accuracy"], result["fit_seconds"]))
+    for result in results[:5]:
+        logging.info(f"accuracy {result['accuracy']:.4f} in {result['fit_seconds']:.2f}s: {result['params']}")
+    return results
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the investment risk model")
+    parser.add_argument("--mode", choices=["full", "sharded", "search"], default="full",
+                        help="full: in-memory fit, sharded: out-of-core shard ensemble, search: parallel grid search")
+    # Path to the user profiles file
+    parser.add_argument("--data", default="C:\\Users\\user\\Desktop\\fowzan\\Aiproject\\data\\user_profiles.csv")
+    parser.add_argument("--output", default=r"C:\\Users\\user\Desktop\\fowzan\\Aiproject\\models\\investment_model.pkl")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--trees-per-shard", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Search worker processes (default: all cores)")
+    args = parser.parse_args()
+
     # Ensure the 'models' directory exists
     if not os.path.exists("models"):
         os.makedirs("models")
         logging.info("Created 'models' directory.")
 
     # Train the model using the generated user profiles
-    user_data_file = "C:\\Users\\user\\Desktop\\fowzan\\Aiproject\\data\\user_profiles.csv"  # Path to the user profiles file
-    train_investment_model(user_data_file)
+    if args.mode == "sharded":
+        train_investment_model_sharded(args.data, args.output, chunk_rows=args.chunk_rows,
+                                       trees_per_shard=args.trees_per_shard)
+    elif args.mode == "search":
+        search_hyperparameters(args.data, sample_rows=args.chunk_rows, max_workers=args.workers)
+    else:
+        train_investment_model(args.data, args.output)